@@ -11,11 +11,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models import UsuarioLogin, LoginResponse, UsuarioResponse
 from auth import AuthService, get_current_user, security
 from database import db
+from db_config import RutaConSesion
 
-router = APIRouter(tags=["Autenticación"])
+router = APIRouter(tags=["Autenticación"], route_class=RutaConSesion)
 
 @router.post("/login", response_model=LoginResponse)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """
     Endpoint para autenticación de usuarios usando OAuth2 estándar
     Credenciales de prueba:
@@ -38,7 +39,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         # Crear token de acceso
         access_token_expires = timedelta(minutes=480)  # 8 horas
         access_token = AuthService.create_access_token(
-            data={"sub": user.id, "email": user.email, "rol": user.rol.value},
+            data={"sub": user.id, "email": user.email, "rol": user.rol.value, "escuela_id": user.escuela_id},
             expires_delta=access_token_expires
         )
         
@@ -71,8 +72,12 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
 
 @router.post("/logout")
-async def logout(current_user: dict = Depends(get_current_user)):
-    """Cierra sesión del usuario actual"""
+def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: dict = Depends(get_current_user)
+):
+    """Cierra sesión del usuario actual revocando su token hasta que expire"""
+    AuthService.revoke_token(credentials.credentials)
     return {"message": "Logout exitoso", "user_id": current_user.id}
 
 @router.post("/verify-token")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Response
 from typing import List, Optional
 import sys
 import os
@@ -13,42 +13,51 @@ from models import (
     CategoriaComida,
     RolUsuario
 )
-from auth import get_current_user, get_nutricionista_user
-from database import db
+from auth import get_current_principal, get_nutricionista_user
+from database import db, CursorInvalidoError, RegistroDuplicadoError
+from db_config import RutaConSesion
 
-router = APIRouter(tags=["Comidas"])
+router = APIRouter(tags=["Comidas"], route_class=RutaConSesion)
 
 @router.get("/comidas", response_model=List[ComidaResponse])
-async def get_comidas(
+def get_comidas(
     categoria: Optional[CategoriaComida] = Query(None, description="Filtrar por categoría"),
     max_calorias: Optional[int] = Query(None, description="Máximo de calorías"),
     min_proteinas: Optional[float] = Query(None, description="Mínimo de proteínas"),
     search: Optional[str] = Query(None, description="Buscar por nombre"),
-    current_user: dict = Depends(get_current_user)
+    limit: int = Query(50, ge=1, le=200, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    response: Response = None,
+    current_user: dict = Depends(get_current_principal)
 ):
     """
     Obtiene lista de comidas con filtros opcionales
     Todos los usuarios autenticados pueden ver las comidas
+    
+    Paginado por keyset (orden por nombre): si hay más resultados, la cabecera
+    X-Next-Cursor trae el cursor para pedir la página siguiente.
     """
     comidas = []
     
-    for comida in db.comidas.values():
-        # Filtrar por categoría
-        if categoria and comida.categoria != categoria:
-            continue
-        
-        # Filtrar por calorías máximas
-        if max_calorias and comida.calorias > max_calorias:
-            continue
-        
-        # Filtrar por proteínas mínimas
-        if min_proteinas and comida.proteinas < min_proteinas:
-            continue
-        
-        # Filtrar por búsqueda en nombre
-        if search and search.lower() not in comida.nombre.lower():
-            continue
-        
+    # Filtros, orden por nombre y paginación se resuelven en la base de datos
+    try:
+        pagina, siguiente = db.list_comidas(
+            categoria=categoria,
+            max_calorias=max_calorias,
+            min_proteinas=min_proteinas,
+            search=search,
+            limit=limit,
+            cursor=cursor
+        )
+    except CursorInvalidoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido"
+        )
+    if siguiente:
+        response.headers["X-Next-Cursor"] = siguiente
+    
+    for comida in pagina:
         comidas.append(ComidaResponse(
             id=comida.id,
             nombre=comida.nombre,
@@ -67,26 +76,22 @@ async def get_comidas(
             fecha_creacion=comida.fecha_creacion
         ))
     
-    # Ordenar por nombre
-    comidas.sort(key=lambda x: x.nombre)
-    
     return comidas
 
 @router.get("/comidas/{comida_id}", response_model=ComidaResponse)
-async def get_comida(
+def get_comida(
     comida_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     """Obtiene una comida específica por ID"""
     
-    if comida_id not in db.comidas:
+    comida = db.get_comida(comida_id)
+    if not comida:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Comida no encontrada"
         )
     
-    comida = db.comidas[comida_id]
-    
     return ComidaResponse(
         id=comida.id,
         nombre=comida.nombre,
@@ -106,9 +111,9 @@ async def get_comida(
     )
 
 @router.get("/comidas/categoria/{categoria}", response_model=List[ComidaResponse])
-async def get_comidas_by_categoria(
+def get_comidas_by_categoria(
     categoria: CategoriaComida,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     """Obtiene todas las comidas de una categoría específica"""
     
@@ -146,11 +151,11 @@ async def get_comidas_by_categoria(
     return comidas
 
 @router.get("/comidas/nutritivas/recomendadas", response_model=List[ComidaResponse])
-async def get_comidas_recomendadas(
+def get_comidas_recomendadas(
     max_calorias: int = Query(300, description="Máximo de calorías"),
     min_proteinas: float = Query(10.0, description="Mínimo de proteínas"),
     max_sodio: float = Query(500.0, description="Máximo de sodio (mg)"),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     """Obtiene comidas recomendadas basadas en criterios nutricionales"""
     
@@ -186,7 +191,7 @@ async def get_comidas_recomendadas(
     return comidas_recomendadas
 
 @router.post("/comidas", response_model=ComidaResponse)
-async def create_comida(
+def create_comida(
     comida_data: ComidaCreate,
     current_user: dict = Depends(get_nutricionista_user)
 ):
@@ -194,16 +199,14 @@ async def create_comida(
     Crea una nueva comida (solo nutricionistas y admin)
     """
     
-    # Verificar si ya existe una comida con el mismo nombre
-    for comida in db.comidas.values():
-        if comida.nombre.lower() == comida_data.nombre.lower():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Ya existe una comida con este nombre"
-            )
-    
-    # Crear la comida
-    nueva_comida = db.create_comida(comida_data)
+    # Crear la comida; el índice único sobre el nombre rechaza un duplicado
+    try:
+        nueva_comida = db.create_comida(comida_data.model_dump(mode="json"))
+    except RegistroDuplicadoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ya existe una comida con este nombre"
+        )
     
     return ComidaResponse(
         id=nueva_comida.id,
@@ -224,21 +227,27 @@ async def create_comida(
     )
 
 @router.put("/comidas/{comida_id}", response_model=ComidaResponse)
-async def update_comida(
+def update_comida(
     comida_id: str,
     comida_data: ComidaUpdate,
     current_user: dict = Depends(get_nutricionista_user)
 ):
     """Actualiza una comida existente"""
     
-    if comida_id not in db.comidas:
+    if not db.comida_exists(comida_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Comida no encontrada"
         )
     
     # Actualizar la comida
-    comida_actualizada = db.update_comida(comida_id, comida_data)
+    try:
+        comida_actualizada = db.update_comida(comida_id, comida_data.model_dump(mode="json", exclude_unset=True))
+    except RegistroDuplicadoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ya existe una comida con este nombre"
+        )
     
     return ComidaResponse(
         id=comida_actualizada.id,
@@ -259,7 +268,7 @@ async def update_comida(
     )
 
 @router.delete("/comidas/{comida_id}")
-async def delete_comida(
+def delete_comida(
     comida_id: str,
     current_user: dict = Depends(get_nutricionista_user)
 ):
@@ -268,27 +277,20 @@ async def delete_comida(
     En lugar de eliminación física, desactiva la comida
     """
     
-    if comida_id not in db.comidas:
+    if not db.comida_exists(comida_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Comida no encontrada"
         )
     
     # Verificar si la comida está siendo usada en algún menú activo
-    comida_en_uso = False
-    for menu in db.menus.values():
-        if menu.activo:
-            # Aquí se verificaría si la comida está en el menú
-            # Por simplicidad, asumimos que no está en uso
-            pass
-    
-    if comida_en_uso:
+    if db.comida_en_menus_activos(comida_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No se puede eliminar una comida que está siendo usada en menús activos"
         )
     
     # Desactivar comida en lugar de eliminar
-    db.comidas[comida_id].activa = False
+    db.update_comida(comida_id, {"activa": False})
     
     return {"message": "Comida desactivada exitosamente"}
\ No newline at end of file
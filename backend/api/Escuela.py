@@ -13,12 +13,18 @@ from models import (
     RolUsuario
 )
 from auth import get_current_user, get_admin_user
-from database import db
+from database import db, RegistroDuplicadoError
+from db_config import RutaConSesion
 
-router = APIRouter(tags=["Escuelas"])
+router = APIRouter(tags=["Escuelas"], route_class=RutaConSesion)
+
+def _detalle_escuela_duplicada(error: RegistroDuplicadoError) -> str:
+    if "nombre" in error.restriccion:
+        return "Ya existe una escuela con este nombre"
+    return "Ya existe una escuela con este email o código de establecimiento"
 
 @router.get("/escuelas", response_model=List[EscuelaResponse])
-async def get_escuelas(current_user: dict = Depends(get_current_user)):
+def get_escuelas(current_user: dict = Depends(get_current_user)):
     """
     Obtiene lista de escuelas
     - Admin: puede ver todas las escuelas
@@ -41,8 +47,8 @@ async def get_escuelas(current_user: dict = Depends(get_current_user)):
             ))
     else:
         # Otros roles solo ven su escuela
-        if current_user.escuela_id and current_user.escuela_id in db.escuelas:
-            escuela = db.escuelas[current_user.escuela_id]
+        escuela = db.get_escuela(current_user.escuela_id) if current_user.escuela_id else None
+        if escuela:
             escuelas.append(EscuelaResponse(
                 id=escuela.id,
                 nombre=escuela.nombre,
@@ -56,20 +62,19 @@ async def get_escuelas(current_user: dict = Depends(get_current_user)):
     return escuelas
 
 @router.get("/escuelas/{escuela_id}", response_model=EscuelaResponse)
-async def get_escuela(
+def get_escuela(
     escuela_id: str,
     current_user: dict = Depends(get_current_user)
 ):
     """Obtiene una escuela específica por ID"""
     
-    if escuela_id not in db.escuelas:
+    escuela = db.get_escuela(escuela_id)
+    if not escuela:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Escuela no encontrada"
         )
     
-    escuela = db.escuelas[escuela_id]
-    
     # Verificar permisos
     if current_user.rol != RolUsuario.ADMIN:
         if current_user.escuela_id != escuela_id:
@@ -89,7 +94,7 @@ async def get_escuela(
     )
 
 @router.post("/escuelas", response_model=EscuelaResponse)
-async def create_escuela(
+def create_escuela(
     escuela_data: EscuelaCreate,
     current_user: dict = Depends(get_admin_user)
 ):
@@ -97,16 +102,14 @@ async def create_escuela(
     Crea una nueva escuela (solo admin)
     """
     
-    # Verificar si ya existe una escuela con el mismo nombre
-    for escuela in db.escuelas.values():
-        if escuela.nombre.lower() == escuela_data.nombre.lower():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Ya existe una escuela con este nombre"
-            )
-    
-    # Crear la escuela
-    nueva_escuela = db.create_escuela(escuela_data)
+    # Crear la escuela; los índices únicos rechazan nombre, email o código repetidos
+    try:
+        nueva_escuela = db.create_escuela(escuela_data.model_dump(mode="json"))
+    except RegistroDuplicadoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_detalle_escuela_duplicada(e)
+        )
     
     return EscuelaResponse(
         id=nueva_escuela.id,
@@ -119,7 +122,7 @@ async def create_escuela(
     )
 
 @router.put("/escuelas/{escuela_id}", response_model=EscuelaResponse)
-async def update_escuela(
+def update_escuela(
     escuela_id: str,
     escuela_data: EscuelaUpdate,
     current_user: dict = Depends(get_current_user)
@@ -130,7 +133,7 @@ async def update_escuela(
     - Rector: solo puede actualizar su escuela
     """
     
-    if escuela_id not in db.escuelas:
+    if not db.escuela_exists(escuela_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Escuela no encontrada"
@@ -145,7 +148,13 @@ async def update_escuela(
             )
     
     # Actualizar la escuela
-    escuela_actualizada = db.update_escuela(escuela_id, escuela_data)
+    try:
+        escuela_actualizada = db.update_escuela(escuela_id, escuela_data.model_dump(mode="json", exclude_unset=True))
+    except RegistroDuplicadoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_detalle_escuela_duplicada(e)
+        )
     
     return EscuelaResponse(
         id=escuela_actualizada.id,
@@ -158,7 +167,7 @@ async def update_escuela(
     )
 
 @router.delete("/escuelas/{escuela_id}")
-async def delete_escuela(
+def delete_escuela(
     escuela_id: str,
     current_user: dict = Depends(get_admin_user)
 ):
@@ -167,25 +176,22 @@ async def delete_escuela(
     En lugar de eliminación física, desactiva la escuela
     """
     
-    if escuela_id not in db.escuelas:
+    if not db.escuela_exists(escuela_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Escuela no encontrada"
         )
     
     # Verificar si hay usuarios asociados a esta escuela
-    usuarios_en_escuela = [
-        user for user in db.usuarios.values() 
-        if user.escuela_id == escuela_id and user.activo
-    ]
+    usuarios_activos = db.contar_usuarios_activos(escuela_id)
     
-    if usuarios_en_escuela:
+    if usuarios_activos:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"No se puede eliminar la escuela. Hay {len(usuarios_en_escuela)} usuarios activos asociados"
+            detail=f"No se puede eliminar la escuela. Hay {usuarios_activos} usuarios activos asociados"
         )
     
     # Desactivar escuela en lugar de eliminar
-    db.escuelas[escuela_id].activa = False
+    db.update_escuela(escuela_id, {"activa": False})
     
     return {"message": "Escuela desactivada exitosamente"}
\ No newline at end of file
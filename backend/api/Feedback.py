@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Response
 from typing import List, Optional
 from datetime import date, datetime, timedelta
 import sys
@@ -14,106 +14,88 @@ from models import (
     FeedbackEstadisticas,
     RolUsuario
 )
-from auth import get_current_user
-from database import db
+from auth import get_current_user, get_current_principal
+from database import db, CursorInvalidoError, RegistroDuplicadoError
+from db_config import RutaConSesion
 
-router = APIRouter(tags=["Feedback"])
+router = APIRouter(tags=["Feedback"], route_class=RutaConSesion)
 
 @router.get("/feedback", response_model=List[FeedbackResponse])
-async def get_feedback(
+def get_feedback(
     menu_id: Optional[str] = Query(None, description="Filtrar por menú"),
     usuario_id: Optional[str] = Query(None, description="Filtrar por usuario"),
     calificacion_min: Optional[int] = Query(None, ge=1, le=5, description="Calificación mínima"),
     fecha_inicio: Optional[date] = Query(None, description="Fecha de inicio"),
     fecha_fin: Optional[date] = Query(None, description="Fecha de fin"),
-    current_user: dict = Depends(get_current_user)
+    limit: int = Query(50, ge=1, le=200, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    response: Response = None,
+    current_user: dict = Depends(get_current_principal)
 ):
     """
     Obtiene feedback con filtros opcionales
     - Admin: puede ver todo el feedback
     - Rector/Nutricionista: feedback de su escuela
     - Padres/Estudiantes: solo su feedback
+    
+    Paginado por keyset (más reciente primero): si hay más resultados, la
+    cabecera X-Next-Cursor trae el cursor para pedir la página siguiente.
     """
-    feedbacks = []
-    
-    for feedback in db.feedback.values():
-        # Verificar permisos por rol
-        if current_user.rol == RolUsuario.ADMIN:
-            # Admin puede ver todo
-            pass
-        elif current_user.rol in [RolUsuario.RECTOR, RolUsuario.NUTRICIONISTA]:
-            # Verificar que el feedback sea de un menú de su escuela
-            if feedback.menu_id in db.menus:
-                menu = db.menus[feedback.menu_id]
-                if menu.escuela_id != current_user.escuela_id:
-                    continue
-            else:
-                continue
-        else:
-            # Padres y estudiantes solo ven su propio feedback
-            if feedback.usuario_id != current_user.id:
-                continue
-        
-        # Aplicar filtros
-        if menu_id and feedback.menu_id != menu_id:
-            continue
-        
-        if usuario_id and feedback.usuario_id != usuario_id:
-            continue
-        
-        if calificacion_min and feedback.calificacion < calificacion_min:
-            continue
-        
-        if fecha_inicio and feedback.fecha < fecha_inicio:
-            continue
-        
-        if fecha_fin and feedback.fecha > fecha_fin:
-            continue
-        
-        # Obtener información del usuario y menú
-        usuario = db.usuarios.get(feedback.usuario_id, None)
-        menu = db.menus.get(feedback.menu_id, None)
-        
-        feedbacks.append(FeedbackResponse(
-            id=feedback.id,
-            menu_id=feedback.menu_id,
-            usuario_id=feedback.usuario_id,
-            calificacion=feedback.calificacion,
-            comentario=feedback.comentario,
-            fecha=feedback.fecha,
-            usuario_nombre=usuario.nombre if usuario else "Usuario desconocido",
-            menu_nombre=menu.nombre if menu else "Menú desconocido",
-            menu_fecha=menu.fecha if menu else None,
-            menu_tipo=menu.tipo if menu else None
-        ))
-    
-    # Ordenar por fecha descendente
-    feedbacks.sort(key=lambda x: x.fecha, reverse=True)
+    # Alcance por rol, aplicado en la consulta
+    escuela_scope = None
+    autor_scope = None
+    if current_user.rol in [RolUsuario.RECTOR, RolUsuario.NUTRICIONISTA]:
+        if not current_user.escuela_id:
+            return []
+        escuela_scope = current_user.escuela_id
+    elif current_user.rol != RolUsuario.ADMIN:
+        autor_scope = current_user.id
+    
+    # Alcance, filtros y nombres de usuario/menú se resuelven en una sola consulta
+    try:
+        pagina, siguiente = db.list_feedback(
+            escuela_id=escuela_scope,
+            autor_id=autor_scope,
+            menu_id=menu_id,
+            usuario_id=usuario_id,
+            calificacion_min=calificacion_min,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            limit=limit,
+            cursor=cursor
+        )
+    except CursorInvalidoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido"
+        )
+    if siguiente:
+        response.headers["X-Next-Cursor"] = siguiente
     
-    return feedbacks
+    return pagina
 
 @router.get("/feedback/{feedback_id}", response_model=FeedbackResponse)
-async def get_feedback_by_id(
+def get_feedback_by_id(
     feedback_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     """Obtiene un feedback específico por ID"""
     
-    if feedback_id not in db.feedback:
+    feedback = db.get_feedback(feedback_id)
+    if not feedback:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Feedback no encontrado"
         )
     
-    feedback = db.feedback[feedback_id]
+    menu = db.get_menu(feedback.menu_id)
     
     # Verificar permisos
     if current_user.rol == RolUsuario.ADMIN:
         pass
     elif current_user.rol in [RolUsuario.RECTOR, RolUsuario.NUTRICIONISTA]:
         # Verificar que sea de su escuela
-        if feedback.menu_id in db.menus:
-            menu = db.menus[feedback.menu_id]
+        if menu:
             if menu.escuela_id != current_user.escuela_id:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
@@ -128,8 +110,7 @@ async def get_feedback_by_id(
             )
     
     # Obtener información adicional
-    usuario = db.usuarios.get(feedback.usuario_id, None)
-    menu = db.menus.get(feedback.menu_id, None)
+    usuario = db.get_usuario(feedback.usuario_id)
     
     return FeedbackResponse(
         id=feedback.id,
@@ -145,20 +126,19 @@ async def get_feedback_by_id(
     )
 
 @router.get("/feedback/menu/{menu_id}", response_model=List[FeedbackResponse])
-async def get_feedback_by_menu(
+def get_feedback_by_menu(
     menu_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     """Obtiene todo el feedback para un menú específico"""
     
-    if menu_id not in db.menus:
+    menu = db.get_menu(menu_id)
+    if not menu:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Menú no encontrado"
         )
     
-    menu = db.menus[menu_id]
-    
     # Verificar permisos
     if current_user.rol != RolUsuario.ADMIN:
         if menu.escuela_id != current_user.escuela_id:
@@ -167,23 +147,8 @@ async def get_feedback_by_menu(
                 detail="No tienes permisos para ver feedback de este menú"
             )
     
-    feedbacks = []
-    for feedback in db.feedback.values():
-        if feedback.menu_id == menu_id:
-            usuario = db.usuarios.get(feedback.usuario_id, None)
-            
-            feedbacks.append(FeedbackResponse(
-                id=feedback.id,
-                menu_id=feedback.menu_id,
-                usuario_id=feedback.usuario_id,
-                calificacion=feedback.calificacion,
-                comentario=feedback.comentario,
-                fecha=feedback.fecha,
-                usuario_nombre=usuario.nombre if usuario else "Usuario desconocido",
-                menu_nombre=menu.nombre,
-                menu_fecha=menu.fecha,
-                menu_tipo=menu.tipo
-            ))
+    # Feedback con nombres de usuario, ya ordenado por fecha descendente
+    feedbacks, _ = db.list_feedback(menu_id=menu_id)
     
     if not feedbacks:
         raise HTTPException(
@@ -191,26 +156,22 @@ async def get_feedback_by_menu(
             detail="No hay feedback para este menú"
         )
     
-    # Ordenar por fecha descendente
-    feedbacks.sort(key=lambda x: x.fecha, reverse=True)
-    
     return feedbacks
 
 @router.get("/feedback/estadisticas/menu/{menu_id}", response_model=FeedbackEstadisticas)
-async def get_feedback_estadisticas(
+def get_feedback_estadisticas(
     menu_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     """Obtiene estadísticas del feedback para un menú específico"""
     
-    if menu_id not in db.menus:
+    menu = db.get_menu(menu_id)
+    if not menu:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Menú no encontrado"
         )
     
-    menu = db.menus[menu_id]
-    
     # Verificar permisos
     if current_user.rol != RolUsuario.ADMIN:
         if menu.escuela_id != current_user.escuela_id:
@@ -220,7 +181,7 @@ async def get_feedback_estadisticas(
             )
     
     # Obtener feedback del menú
-    feedback_del_menu = [f for f in db.feedback.values() if f.menu_id == menu_id]
+    feedback_del_menu = db.get_feedback_by_menu(menu_id)
     
     if not feedback_del_menu:
         raise HTTPException(
@@ -258,7 +219,7 @@ async def get_feedback_estadisticas(
     )
 
 @router.post("/feedback", response_model=FeedbackResponse)
-async def create_feedback(
+def create_feedback(
     feedback_data: FeedbackCreate,
     current_user: dict = Depends(get_current_user)
 ):
@@ -275,14 +236,13 @@ async def create_feedback(
         )
     
     # Verificar que el menú existe
-    if feedback_data.menu_id not in db.menus:
+    menu = db.get_menu(feedback_data.menu_id)
+    if not menu:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Menú no encontrado"
         )
     
-    menu = db.menus[feedback_data.menu_id]
-    
     # Verificar que el menú es de la escuela del usuario
     if menu.escuela_id != current_user.escuela_id:
         raise HTTPException(
@@ -290,16 +250,14 @@ async def create_feedback(
             detail="Solo puedes dar feedback a menús de tu escuela"
         )
     
-    # Verificar que no haya feedback duplicado
-    for feedback in db.feedback.values():
-        if feedback.menu_id == feedback_data.menu_id and feedback.usuario_id == current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Ya has dado feedback para este menú"
-            )
-    
-    # Crear el feedback
-    nuevo_feedback = db.create_feedback(feedback_data, current_user.id)
+    # Crear el feedback; el índice único (menú, usuario) rechaza un duplicado
+    try:
+        nuevo_feedback = db.create_feedback(feedback_data.model_dump(mode="json"), current_user.id)
+    except RegistroDuplicadoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ya has dado feedback para este menú"
+        )
     
     return FeedbackResponse(
         id=nuevo_feedback.id,
@@ -315,21 +273,20 @@ async def create_feedback(
     )
 
 @router.put("/feedback/{feedback_id}", response_model=FeedbackResponse)
-async def update_feedback(
+def update_feedback(
     feedback_id: str,
     feedback_data: FeedbackUpdate,
     current_user: dict = Depends(get_current_user)
 ):
     """Actualiza un feedback existente (solo el autor puede actualizar)"""
     
-    if feedback_id not in db.feedback:
+    feedback = db.get_feedback(feedback_id)
+    if not feedback:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Feedback no encontrado"
         )
     
-    feedback = db.feedback[feedback_id]
-    
     # Solo el autor puede actualizar su feedback
     if feedback.usuario_id != current_user.id:
         raise HTTPException(
@@ -345,10 +302,10 @@ async def update_feedback(
         )
     
     # Actualizar el feedback
-    feedback_actualizado = db.update_feedback(feedback_id, feedback_data)
+    feedback_actualizado = db.update_feedback(feedback_id, feedback_data.model_dump(mode="json", exclude_unset=True))
     
     # Obtener información adicional
-    menu = db.menus.get(feedback_actualizado.menu_id, None)
+    menu = db.get_menu(feedback_actualizado.menu_id)
     
     return FeedbackResponse(
         id=feedback_actualizado.id,
@@ -364,7 +321,7 @@ async def update_feedback(
     )
 
 @router.delete("/feedback/{feedback_id}")
-async def delete_feedback(
+def delete_feedback(
     feedback_id: str,
     current_user: dict = Depends(get_current_user)
 ):
@@ -374,14 +331,13 @@ async def delete_feedback(
     - Admin puede eliminar cualquier feedback
     """
     
-    if feedback_id not in db.feedback:
+    feedback = db.get_feedback(feedback_id)
+    if not feedback:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Feedback no encontrado"
         )
     
-    feedback = db.feedback[feedback_id]
-    
     # Verificar permisos
     if current_user.rol != RolUsuario.ADMIN and feedback.usuario_id != current_user.id:
         raise HTTPException(
@@ -390,6 +346,6 @@ async def delete_feedback(
         )
     
     # Eliminar feedback
-    del db.feedback[feedback_id]
+    db.delete_feedback(feedback_id)
     
     return {"message": "Feedback eliminado exitosamente"}
\ No newline at end of file
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Response
 from typing import List, Optional
 from datetime import date, datetime, timedelta
 import sys
@@ -11,27 +11,38 @@ from models import (
     MenuCreate,
     MenuUpdate,
     MenuResponse,
+    MenuInformacionNutricional,
+    MenuCompleto,
     TipoMenu,
     RolUsuario
 )
-from auth import get_current_user, get_nutricionista_user
-from database import db
+from auth import get_current_principal, get_nutricionista_user
+from database import db, CursorInvalidoError, RegistroDuplicadoError
+from db_config import RutaConSesion
+from api.validaciones import verificar_comidas
+from nutricion import motor_nutricional
 
-router = APIRouter(tags=["Menus"])
+router = APIRouter(tags=["Menus"], route_class=RutaConSesion)
 
 @router.get("/menus", response_model=List[MenuResponse])
-async def get_menus(
+def get_menus(
     escuela_id: Optional[str] = Query(None, description="ID de la escuela"),
     fecha_inicio: Optional[date] = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
     fecha_fin: Optional[date] = Query(None, description="Fecha de fin (YYYY-MM-DD)"),
     tipo: Optional[TipoMenu] = Query(None, description="Tipo de menú"),
-    current_user: dict = Depends(get_current_user)
+    limit: int = Query(50, ge=1, le=200, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    response: Response = None,
+    current_user: dict = Depends(get_current_principal)
 ):
     """
     Obtiene lista de menús con filtros opcionales
     - Admin: puede ver todos los menús
     - Rector/Nutricionista: solo menús de su escuela
     - Padres/Estudiantes: solo menús de su escuela
+    
+    Paginado por keyset: si hay más resultados, la cabecera X-Next-Cursor trae
+    el cursor para pedir la página siguiente.
     """
     menus = []
     
@@ -46,21 +57,25 @@ async def get_menus(
     if not fecha_fin:
         fecha_fin = fecha_inicio + timedelta(days=7)
     
-    for menu in db.menus.values():
-        # Filtrar por escuela
-        if target_escuela_id and menu.escuela_id != target_escuela_id:
-            continue
-        
-        # Filtrar por fechas
-        if fecha_inicio and menu.fecha < fecha_inicio:
-            continue
-        if fecha_fin and menu.fecha > fecha_fin:
-            continue
-        
-        # Filtrar por tipo
-        if tipo and menu.tipo != tipo:
-            continue
-        
+    # Filtros, orden (fecha, tipo) y paginación se resuelven en la base de datos
+    try:
+        pagina, siguiente = db.list_menus(
+            escuela_id=target_escuela_id,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            tipo=tipo,
+            limit=limit,
+            cursor=cursor
+        )
+    except CursorInvalidoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido"
+        )
+    if siguiente:
+        response.headers["X-Next-Cursor"] = siguiente
+    
+    for menu in pagina:
         menus.append(MenuResponse(
             id=menu.id,
             escuela_id=menu.escuela_id,
@@ -73,26 +88,103 @@ async def get_menus(
             fecha_creacion=menu.fecha_creacion
         ))
     
-    # Ordenar por fecha y tipo
-    menus.sort(key=lambda x: (x.fecha, x.tipo.value))
-    
     return menus
 
+# Declarada antes de /menus/{menu_id} para que no se tome como un id
+@router.get("/menus/informacion-nutricional", response_model=List[MenuInformacionNutricional])
+def get_informacion_nutricional_menus(
+    escuela_id: Optional[str] = Query(None, description="ID de la escuela (todas, para admin)"),
+    fecha_inicio: Optional[date] = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
+    fecha_fin: Optional[date] = Query(None, description="Fecha de fin (YYYY-MM-DD)"),
+    tipo: Optional[TipoMenu] = Query(None, description="Tipo de menú"),
+    current_user: dict = Depends(get_current_principal)
+):
+    """
+    Información nutricional de los menús de un período (por defecto, el mes en curso)
+    - Admin: todas las escuelas, o la indicada
+    - Otros roles: solo menús de su escuela
+    
+    Los totales se leen ya calculados (tabla menu_nutricion); los menús que aún no
+    los tengan se calculan juntos con el motor nutricional.
+    """
+    target_escuela_id = escuela_id
+    if current_user.rol != RolUsuario.ADMIN:
+        target_escuela_id = current_user.escuela_id
+    
+    if not fecha_inicio:
+        fecha_inicio = date.today().replace(day=1)
+    if not fecha_fin:
+        fecha_fin = (fecha_inicio.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    
+    menus, _ = db.list_menus(
+        escuela_id=target_escuela_id,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        tipo=tipo
+    )
+    menu_ids = [menu.id for menu in menus]
+    totales = db.totales_nutricionales(menu_ids)
+    faltantes = [menu_id for menu_id in menu_ids if menu_id not in totales]
+    if faltantes:
+        totales.update(motor_nutricional.totales(faltantes))
+    
+    return [
+        MenuInformacionNutricional(
+            menu_id=menu.id,
+            escuela_id=menu.escuela_id,
+            fecha=menu.fecha,
+            tipo=menu.tipo,
+            nombre=menu.nombre,
+            informacion_nutricional=totales[menu.id]
+        )
+        for menu in menus
+    ]
+
+# Declarada antes de /menus/{menu_id} para que no se tome como un id
+@router.get("/menus/calendario", response_model=List[MenuCompleto])
+def get_calendario_menus(
+    escuela_id: Optional[str] = Query(None, description="ID de la escuela (obligatorio para admin)"),
+    anio: Optional[int] = Query(None, ge=2000, le=2100, description="Año (por defecto, el actual)"),
+    mes: Optional[int] = Query(None, ge=1, le=12, description="Mes 1-12 (por defecto, el actual)"),
+    current_user: dict = Depends(get_current_principal)
+):
+    """
+    Calendario mensual de una escuela: cada menú activo del mes, ordenado por fecha
+    y tipo, con sus comidas en orden y sus totales nutricionales
+    - Admin: la escuela indicada
+    - Otros roles: solo su escuela
+    
+    Todo sale de una sola consulta (menús, totales guardados y comidas unidos).
+    """
+    target_escuela_id = escuela_id
+    if current_user.rol != RolUsuario.ADMIN:
+        target_escuela_id = current_user.escuela_id
+    if not target_escuela_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Debe indicar escuela_id"
+        )
+    
+    hoy = date.today()
+    fecha_inicio = date(anio or hoy.year, mes or hoy.month, 1)
+    fecha_fin = (fecha_inicio.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    
+    return db.get_menus_completos(target_escuela_id, fecha_inicio, fecha_fin)
+
 @router.get("/menus/{menu_id}", response_model=MenuResponse)
-async def get_menu(
+def get_menu(
     menu_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     """Obtiene un menú específico por ID"""
     
-    if menu_id not in db.menus:
+    menu = db.get_menu(menu_id)
+    if not menu:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Menú no encontrado"
         )
     
-    menu = db.menus[menu_id]
-    
     # Verificar permisos
     if current_user.rol != RolUsuario.ADMIN:
         if menu.escuela_id != current_user.escuela_id:
@@ -114,22 +206,21 @@ async def get_menu(
     )
 
 @router.get("/menus/fecha/{fecha}", response_model=List[MenuResponse])
-async def get_menus_by_fecha(
+def get_menus_by_fecha(
     fecha: date,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     """Obtiene todos los menús de una fecha específica"""
     
     menus = []
     target_escuela_id = current_user.escuela_id if current_user.rol != RolUsuario.ADMIN else None
     
-    for menu in db.menus.values():
-        if menu.fecha != fecha:
-            continue
-        
-        if target_escuela_id and menu.escuela_id != target_escuela_id:
-            continue
-        
+    for menu in db.query_menus(
+        escuela_id=target_escuela_id,
+        fecha_inicio=fecha,
+        fecha_fin=fecha,
+        order_by=["tipo"]
+    ):
         menus.append(MenuResponse(
             id=menu.id,
             escuela_id=menu.escuela_id,
@@ -148,15 +239,12 @@ async def get_menus_by_fecha(
             detail="No hay menús para esta fecha"
         )
     
-    # Ordenar por tipo
-    menus.sort(key=lambda x: x.tipo.value)
-    
     return menus
 
 @router.get("/menus/semana/{fecha_inicio}", response_model=List[MenuResponse])
-async def get_menus_semana(
+def get_menus_semana(
     fecha_inicio: date,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     """Obtiene todos los menús de una semana (7 días) a partir de una fecha"""
     
@@ -165,13 +253,11 @@ async def get_menus_semana(
     menus = []
     target_escuela_id = current_user.escuela_id if current_user.rol != RolUsuario.ADMIN else None
     
-    for menu in db.menus.values():
-        if not (fecha_inicio <= menu.fecha <= fecha_fin):
-            continue
-        
-        if target_escuela_id and menu.escuela_id != target_escuela_id:
-            continue
-        
+    for menu in db.query_menus(
+        escuela_id=target_escuela_id,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin
+    ):
         menus.append(MenuResponse(
             id=menu.id,
             escuela_id=menu.escuela_id,
@@ -184,13 +270,10 @@ async def get_menus_semana(
             fecha_creacion=menu.fecha_creacion
         ))
     
-    # Ordenar por fecha y tipo
-    menus.sort(key=lambda x: (x.fecha, x.tipo.value))
-    
     return menus
 
 @router.post("/menus", response_model=MenuResponse)
-async def create_menu(
+def create_menu(
     menu_data: MenuCreate,
     current_user: dict = Depends(get_nutricionista_user)
 ):
@@ -206,19 +289,17 @@ async def create_menu(
                 detail="Solo puedes crear menús en tu escuela"
             )
     
-    # Verificar si ya existe un menú del mismo tipo para la misma fecha y escuela
-    for menu in db.menus.values():
-        if (menu.escuela_id == menu_data.escuela_id and 
-            menu.fecha == menu_data.fecha and 
-            menu.tipo == menu_data.tipo and
-            menu.activo):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Ya existe un menú de {menu_data.tipo.value} para esta fecha en esta escuela"
-            )
+    verificar_comidas(menu_data.comidas)
     
-    # Crear el menú
-    nuevo_menu = db.create_menu(menu_data, current_user.id)
+    # Crear el menú; el índice único de menús activos rechaza un duplicado
+    # del mismo tipo para la misma fecha y escuela
+    try:
+        nuevo_menu = db.create_menu(menu_data.model_dump(mode="json"), current_user.id)
+    except RegistroDuplicadoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Ya existe un menú de {menu_data.tipo.value} para esta fecha en esta escuela"
+        )
     
     return MenuResponse(
         id=nuevo_menu.id,
@@ -233,21 +314,26 @@ async def create_menu(
     )
 
 @router.put("/menus/{menu_id}", response_model=MenuResponse)
-async def update_menu(
+def update_menu(
     menu_id: str,
     menu_data: MenuUpdate,
+    response: Response = None,
     current_user: dict = Depends(get_nutricionista_user)
 ):
-    """Actualiza un menú existente"""
+    """
+    Actualiza un menú existente
+    
+    Si se envían comidas, solo se escribe la diferencia con las actuales; la cabecera
+    X-Comidas-Cambios informa las filas tocadas (insertadas, eliminadas, actualizadas).
+    """
     
-    if menu_id not in db.menus:
+    menu = db.get_menu(menu_id)
+    if not menu:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Menú no encontrado"
         )
     
-    menu = db.menus[menu_id]
-    
     # Verificar permisos
     if current_user.rol == RolUsuario.NUTRICIONISTA:
         if menu.escuela_id != current_user.escuela_id:
@@ -256,8 +342,18 @@ async def update_menu(
                 detail="No tienes permisos para actualizar este menú"
             )
     
+    verificar_comidas(menu_data.comidas)
+    
     # Actualizar el menú
-    menu_actualizado = db.update_menu(menu_id, menu_data)
+    try:
+        menu_actualizado, cambios = db.update_menu(menu_id, menu_data.model_dump(mode="json", exclude_unset=True))
+    except RegistroDuplicadoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ya existe un menú de ese tipo para esta fecha en esta escuela"
+        )
+    if cambios is not None:
+        response.headers["X-Comidas-Cambios"] = ", ".join(f"{clave}={n}" for clave, n in cambios.items())
     
     return MenuResponse(
         id=menu_actualizado.id,
@@ -272,7 +368,7 @@ async def update_menu(
     )
 
 @router.delete("/menus/{menu_id}")
-async def delete_menu(
+def delete_menu(
     menu_id: str,
     current_user: dict = Depends(get_nutricionista_user)
 ):
@@ -281,14 +377,13 @@ async def delete_menu(
     En lugar de eliminación física, desactiva el menú
     """
     
-    if menu_id not in db.menus:
+    menu = db.get_menu(menu_id)
+    if not menu:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Menú no encontrado"
         )
     
-    menu = db.menus[menu_id]
-    
     # Verificar permisos
     if current_user.rol == RolUsuario.NUTRICIONISTA:
         if menu.escuela_id != current_user.escuela_id:
@@ -305,6 +400,6 @@ async def delete_menu(
         )
     
     # Desactivar menú en lugar de eliminar
-    db.menus[menu_id].activo = False
+    db.update_menu(menu_id, {"activo": False})
     
     return {"message": "Menú desactivado exitosamente"}
\ No newline at end of file
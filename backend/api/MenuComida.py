@@ -1,150 +1,197 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List
-
-router = APIRouter(tags=["Menu-Comida Relations"])
-
-class MenuComida(BaseModel):
-    menu_id: str
-    comida_id: str
-    orden: int  # Para mantener el orden de las comidas en el menú
-
-class MenuCompleto(BaseModel):
-    menu_id: str
-    fecha: str
-    tipo: str
-    descripcion: str
-    comidas: List[dict]  # Lista de comidas con sus detalles
-
-# Relaciones Menu-Comida (muchos a muchos)
-menu_comida_relations = [
-    MenuComida(menu_id="550e8400-e29b-41d4-a716-446655440001", comida_id="660e8400-e29b-41d4-a716-446655440003", orden=1),  # Desayuno: Jugo
-    MenuComida(menu_id="550e8400-e29b-41d4-a716-446655440001", comida_id="660e8400-e29b-41d4-a716-446655440004", orden=2),  # Desayuno: Yogur
-    
-    MenuComida(menu_id="550e8400-e29b-41d4-a716-446655440002", comida_id="660e8400-e29b-41d4-a716-446655440001", orden=1),  # Almuerzo: Arroz con pollo
-    MenuComida(menu_id="550e8400-e29b-41d4-a716-446655440002", comida_id="660e8400-e29b-41d4-a716-446655440002", orden=2),  # Almuerzo: Ensalada
-    
-    MenuComida(menu_id="550e8400-e29b-41d4-a716-446655440003", comida_id="660e8400-e29b-41d4-a716-446655440004", orden=1),  # Merienda: Yogur
-    MenuComida(menu_id="550e8400-e29b-41d4-a716-446655440003", comida_id="660e8400-e29b-41d4-a716-446655440003", orden=2),  # Merienda: Jugo
-]
-
-# Importar datos de otros módulos (simulado)
-from api.Menu import Menu_list
-from api.Comida import Comida_list
-
-@router.get("/menu/{menu_id}/comidas", response_model=List[dict])
-async def get_comidas_por_menu(menu_id: str):
-    """Obtiene todas las comidas de un menú específico"""
-    # Buscar las relaciones para este menú
-    relaciones = [r for r in menu_comida_relations if r.menu_id == menu_id]
-    
-    if not relaciones:
-        raise HTTPException(status_code=404, detail="No se encontraron comidas para este menú")
-    
-    # Ordenar por orden
-    relaciones.sort(key=lambda x: x.orden)
-    
-    # Obtener detalles de las comidas
-    comidas_detalle = []
-    for relacion in relaciones:
-        comida = next((c for c in Comida_list if c.id_comida == relacion.comida_id), None)
-        if comida:
-            comidas_detalle.append({
-                "id_comida": comida.id_comida,
-                "nombre": comida.nombre,
-                "categoria": comida.categoria,
-                "calorias": comida.calorias,
-                "proteinas": comida.proteinas,
-                "grasas": comida.grasas,
-                "carbohidratos": comida.carbohidratos,
-                "orden": relacion.orden
-            })
-    
-    return comidas_detalle
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Response
+from typing import List, Optional
+import sys
+import os
 
-@router.get("/menu/{menu_id}/completo", response_model=MenuCompleto)
-async def get_menu_completo(menu_id: str):
-    """Obtiene un menú con todas sus comidas"""
-    # Buscar el menú
-    menu = next((m for m in Menu_list if m.id_menu == menu_id), None)
+# Agregar el directorio padre al path para importar módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import (
+    MenuCompleto,
+    MenuComidaDetalle,
+    MenuComidaItem,
+    RolUsuario
+)
+from auth import get_current_principal, get_nutricionista_user
+from database import db, RegistroDuplicadoError
+from db_config import RutaConSesion
+from api.validaciones import verificar_comidas
+
+router = APIRouter(tags=["Menu-Comida Relations"], route_class=RutaConSesion)
+
+def _menu_completo(menu_id: str, current_user) -> MenuCompleto:
+    """Menú con sus comidas (una consulta), si el usuario puede verlo"""
+    menu = db.get_menu_completo(menu_id)
     if not menu:
-        raise HTTPException(status_code=404, detail="Menú no encontrado")
-    
-    # Obtener las comidas del menú
-    comidas = await get_comidas_por_menu(menu_id)
-    
-    return MenuCompleto(
-        menu_id=menu.id_menu,
-        fecha=str(menu.fecha),
-        tipo=menu.tipo,
-        descripcion=menu.descripcion,
-        comidas=comidas
-    )
-
-@router.post("/menu/{menu_id}/comida/{comida_id}")
-async def agregar_comida_a_menu(menu_id: str, comida_id: str, orden: int = None):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Menú no encontrado"
+        )
+
+    if current_user.rol != RolUsuario.ADMIN and menu.escuela_id != current_user.escuela_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos para ver este menú"
+        )
+
+    return menu
+
+def _verificar_edicion(menu_id: str, current_user):
+    """El menú existe y el usuario puede modificar sus comidas"""
+    menu = db.get_menu(menu_id)
+    if not menu:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Menú no encontrado"
+        )
+
+    # Nutricionistas y rectores (get_nutricionista_user admite ambos) solo editan su escuela
+    if current_user.rol != RolUsuario.ADMIN and menu.escuela_id != current_user.escuela_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos para modificar este menú"
+        )
+
+def _verificar_items(items: List[MenuComidaItem]):
+    verificar_comidas([item.comida_id for item in items])
+    for item in items:
+        if item.porcion is not None and item.porcion <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"La porción debe ser mayor que 0: {item.comida_id}"
+            )
+
+@router.get("/menu/{menu_id}/comidas", response_model=List[MenuComidaDetalle])
+def get_comidas_por_menu(
+    menu_id: str,
+    current_user: dict = Depends(get_current_principal)
+):
+    """Obtiene todas las comidas de un menú específico, en orden"""
+    return _menu_completo(menu_id, current_user).comidas
+
+@router.get("/menu/{menu_id}/completo", response_model=MenuCompleto)
+def get_menu_completo(
+    menu_id: str,
+    current_user: dict = Depends(get_current_principal)
+):
+    """Obtiene un menú con todas sus comidas y sus totales nutricionales"""
+    return _menu_completo(menu_id, current_user)
+
+@router.post("/menu/{menu_id}/comidas", response_model=MenuCompleto)
+def agregar_comidas_a_menu(
+    menu_id: str,
+    items: List[MenuComidaItem],
+    current_user: dict = Depends(get_nutricionista_user)
+):
+    """
+    Agrega varias comidas al final del menú, en el orden indicado
+    Retorna el menú completo actualizado
+    """
+    _verificar_edicion(menu_id, current_user)
+    _verificar_items(items)
+
+    try:
+        db.agregar_comidas_menu(menu_id, [item.model_dump() for item in items])
+    except RegistroDuplicadoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Alguna de las comidas ya está en este menú"
+        )
+
+    return _menu_completo(menu_id, current_user)
+
+@router.put("/menu/{menu_id}/comidas", response_model=MenuCompleto)
+def reemplazar_comidas_de_menu(
+    menu_id: str,
+    items: List[MenuComidaItem],
+    response: Response = None,
+    current_user: dict = Depends(get_nutricionista_user)
+):
+    """
+    Define todas las comidas del menú de una vez: agrega, quita y reordena según la lista
+    Sin porción, cada comida conserva la que ya tenía en el menú
+    Retorna el menú completo actualizado; la cabecera X-Comidas-Cambios informa las
+    filas tocadas (insertadas, eliminadas, actualizadas)
+    """
+    _verificar_edicion(menu_id, current_user)
+    _verificar_items(items)
+
+    cambios = db.reemplazar_comidas_menu(menu_id, [item.model_dump() for item in items])
+    response.headers["X-Comidas-Cambios"] = ", ".join(f"{clave}={n}" for clave, n in cambios.items())
+
+    return _menu_completo(menu_id, current_user)
+
+@router.post("/menu/{menu_id}/comida/{comida_id}", response_model=MenuCompleto)
+def agregar_comida_a_menu(
+    menu_id: str,
+    comida_id: str,
+    orden: Optional[int] = Query(None, description="Posición; por defecto, al final"),
+    porcion: Optional[float] = Query(None, gt=0, description="Porción (por defecto 1.0)"),
+    current_user: dict = Depends(get_nutricionista_user)
+):
     """Agrega una comida a un menú"""
-    # Verificar que existen el menú y la comida
-    menu_existe = any(m.id_menu == menu_id for m in Menu_list)
-    comida_existe = any(c.id_comida == comida_id for c in Comida_list)
-    
-    if not menu_existe:
-        raise HTTPException(status_code=404, detail="Menú no encontrado")
-    if not comida_existe:
-        raise HTTPException(status_code=404, detail="Comida no encontrada")
-    
-    # Verificar que la relación no existe ya
-    relacion_existe = any(
-        r.menu_id == menu_id and r.comida_id == comida_id 
-        for r in menu_comida_relations
-    )
-    if relacion_existe:
-        raise HTTPException(status_code=400, detail="La comida ya está en este menú")
-    
-    # Si no se especifica orden, usar el siguiente disponible
-    if orden is None:
-        ordenes_existentes = [r.orden for r in menu_comida_relations if r.menu_id == menu_id]
-        orden = max(ordenes_existentes, default=0) + 1
-    
-    # Crear la relación
-    nueva_relacion = MenuComida(menu_id=menu_id, comida_id=comida_id, orden=orden)
-    menu_comida_relations.append(nueva_relacion)
-    
-    return {"message": "Comida agregada al menú exitosamente", "relacion": nueva_relacion}
+    _verificar_edicion(menu_id, current_user)
+    if not db.get_comidas_by_ids([comida_id]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Comida no encontrada"
+        )
+
+    try:
+        db.agregar_comidas_menu(menu_id, [{"comida_id": comida_id, "porcion": porcion, "orden": orden}])
+    except RegistroDuplicadoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La comida ya está en este menú"
+        )
+
+    return _menu_completo(menu_id, current_user)
 
 @router.delete("/menu/{menu_id}/comida/{comida_id}")
-async def remover_comida_de_menu(menu_id: str, comida_id: str):
+def remover_comida_de_menu(
+    menu_id: str,
+    comida_id: str,
+    current_user: dict = Depends(get_nutricionista_user)
+):
     """Remueve una comida de un menú"""
-    # Buscar la relación
-    for index, relacion in enumerate(menu_comida_relations):
-        if relacion.menu_id == menu_id and relacion.comida_id == comida_id:
-            del menu_comida_relations[index]
-            return {"message": "Comida removida del menú exitosamente"}
-    
-    raise HTTPException(status_code=404, detail="Relación no encontrada")
+    _verificar_edicion(menu_id, current_user)
+
+    if not db.quitar_comida_menu(menu_id, comida_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Relación no encontrada"
+        )
+
+    return {"message": "Comida removida del menú exitosamente"}
 
 @router.get("/menu/{menu_id}/informacion-nutricional")
-async def get_informacion_nutricional_menu(menu_id: str):
-    """Obtiene la información nutricional total de un menú"""
-    comidas = await get_comidas_por_menu(menu_id)
-    
-    if not comidas:
-        raise HTTPException(status_code=404, detail="No hay comidas en este menú")
-    
-    # Calcular totales nutricionales
-    total_calorias = sum(comida["calorias"] for comida in comidas)
-    total_proteinas = sum(comida["proteinas"] for comida in comidas)
-    total_grasas = sum(comida["grasas"] for comida in comidas)
-    total_carbohidratos = sum(comida["carbohidratos"] for comida in comidas)
-    
+def get_informacion_nutricional_menu(
+    menu_id: str,
+    current_user: dict = Depends(get_current_principal)
+):
+    """Obtiene la información nutricional total de un menú, ponderada por porción"""
+    menu = _menu_completo(menu_id, current_user)
+    if not menu.comidas:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No hay comidas en este menú"
+        )
+
+    totales = menu.informacion_nutricional
     return {
         "menu_id": menu_id,
-        "cantidad_comidas": len(comidas),
+        "cantidad_comidas": len(menu.comidas),
         "informacion_nutricional": {
-            "calorias_totales": total_calorias,
-            "proteinas_totales": round(total_proteinas, 2),
-            "grasas_totales": round(total_grasas, 2),
-            "carbohidratos_totales": round(total_carbohidratos, 2)
+            "calorias_totales": totales.calorias,
+            "proteinas_totales": totales.proteinas,
+            "grasas_totales": totales.grasas,
+            "carbohidratos_totales": totales.carbohidratos,
+            "fibra_total": totales.fibra,
+            "sodio_total": totales.sodio,
+            "azucar_total": totales.azucar
         },
-        "comidas": [{"nombre": c["nombre"], "calorias": c["calorias"]} for c in comidas]
-    }
\ No newline at end of file
+        "comidas": [
+            {"nombre": comida.nombre, "calorias": comida.calorias}
+            for comida in menu.comidas
+        ]
+    }
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Response
 from typing import List, Optional
 import sys
 import os
@@ -12,15 +12,19 @@ from models import (
     UsuarioResponse,
     RolUsuario
 )
-from auth import get_current_user, get_admin_user, get_rector_user
-from database import db
+from auth import AuthService, get_current_user, get_admin_user, get_rector_user
+from database import db, CursorInvalidoError, RegistroDuplicadoError
+from db_config import RutaConSesion
 
-router = APIRouter(tags=["Usuarios"])
+router = APIRouter(tags=["Usuarios"], route_class=RutaConSesion)
 
 @router.get("/usuarios", response_model=List[UsuarioResponse])
-async def get_usuarios(
+def get_usuarios(
     escuela_id: Optional[str] = None,
     rol: Optional[RolUsuario] = None,
+    limit: int = Query(50, ge=1, le=200, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    response: Response = None,
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -28,48 +32,13 @@ async def get_usuarios(
     - Admins: pueden ver todos los usuarios
     - Rectores: solo usuarios de su escuela
     - Otros roles: solo su propio perfil
-    """
-    usuarios = []
-    
-    # Solo admin puede ver todos los usuarios sin restricciones
-    if current_user.rol == RolUsuario.ADMIN:
-        for user in db.usuarios.values():
-            if escuela_id and user.escuela_id != escuela_id:
-                continue
-            if rol and user.rol != rol:
-                continue
-            usuarios.append(UsuarioResponse(
-                id=user.id,
-                nombre=user.nombre,
-                email=user.email,
-                rol=user.rol,
-                escuela_id=user.escuela_id,
-                activo=user.activo,
-                fecha_creacion=user.fecha_creacion,
-                ultimo_acceso=user.ultimo_acceso
-            ))
-    
-    # Rector puede ver usuarios de su escuela
-    elif current_user.rol == RolUsuario.RECTOR:
-        for user in db.usuarios.values():
-            if user.escuela_id != current_user.escuela_id:
-                continue
-            if rol and user.rol != rol:
-                continue
-            usuarios.append(UsuarioResponse(
-                id=user.id,
-                nombre=user.nombre,
-                email=user.email,
-                rol=user.rol,
-                escuela_id=user.escuela_id,
-                activo=user.activo,
-                fecha_creacion=user.fecha_creacion,
-                ultimo_acceso=user.ultimo_acceso
-            ))
     
+    Paginado por keyset (orden por nombre): si hay más resultados, la cabecera
+    X-Next-Cursor trae el cursor para pedir la página siguiente.
+    """
     # Otros roles solo ven su propio perfil
-    else:
-        usuarios.append(UsuarioResponse(
+    if current_user.rol not in [RolUsuario.ADMIN, RolUsuario.RECTOR]:
+        return [UsuarioResponse(
             id=current_user.id,
             nombre=current_user.nombre,
             email=current_user.email,
@@ -78,25 +47,53 @@ async def get_usuarios(
             activo=current_user.activo,
             fecha_creacion=current_user.fecha_creacion,
             ultimo_acceso=current_user.ultimo_acceso
-        ))
+        )]
     
-    return usuarios
+    # Solo admin puede ver todos los usuarios; el rector queda limitado a su escuela
+    if current_user.rol == RolUsuario.RECTOR:
+        # Un rector sin escuela no ve a nadie (sin filtro vería a todos)
+        if not current_user.escuela_id:
+            return []
+        escuela_id = current_user.escuela_id
+    
+    try:
+        pagina, siguiente = db.list_usuarios(escuela_id=escuela_id, rol=rol, limit=limit, cursor=cursor)
+    except CursorInvalidoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido"
+        )
+    if siguiente:
+        response.headers["X-Next-Cursor"] = siguiente
+    
+    return [
+        UsuarioResponse(
+            id=user.id,
+            nombre=user.nombre,
+            email=user.email,
+            rol=user.rol,
+            escuela_id=user.escuela_id,
+            activo=user.activo,
+            fecha_creacion=user.fecha_creacion,
+            ultimo_acceso=user.ultimo_acceso
+        )
+        for user in pagina
+    ]
 
 @router.get("/usuarios/{usuario_id}", response_model=UsuarioResponse)
-async def get_usuario(
+def get_usuario(
     usuario_id: str,
     current_user: dict = Depends(get_current_user)
 ):
     """Obtiene un usuario específico por ID"""
     
-    if usuario_id not in db.usuarios:
+    usuario = db.get_usuario(usuario_id)
+    if not usuario:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuario no encontrado"
         )
     
-    usuario = db.usuarios[usuario_id]
-    
     # Verificar permisos
     if current_user.rol == RolUsuario.ADMIN:
         # Admin puede ver cualquier usuario
@@ -128,7 +125,7 @@ async def get_usuario(
     )
 
 @router.post("/usuarios", response_model=UsuarioResponse)
-async def create_usuario(
+def create_usuario(
     usuario_data: UsuarioCreate,
     current_user: dict = Depends(get_rector_user)
 ):
@@ -137,14 +134,6 @@ async def create_usuario(
     Solo rectores y admins pueden crear usuarios
     """
     
-    # Verificar si el email ya existe
-    for existing_user in db.usuarios.values():
-        if existing_user.email == usuario_data.email:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Ya existe un usuario con este email"
-            )
-    
     # Solo rector puede crear usuarios en su escuela
     if current_user.rol == RolUsuario.RECTOR:
         if usuario_data.escuela_id != current_user.escuela_id:
@@ -153,8 +142,14 @@ async def create_usuario(
                 detail="Solo puedes crear usuarios en tu escuela"
             )
     
-    # Crear el usuario
-    nuevo_usuario = db.create_usuario(usuario_data)
+    # Crear el usuario; el índice único sobre el email rechaza un duplicado
+    try:
+        nuevo_usuario = db.create_usuario(usuario_data.model_dump(mode="json"))
+    except RegistroDuplicadoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ya existe un usuario con este email"
+        )
     
     return UsuarioResponse(
         id=nuevo_usuario.id,
@@ -168,21 +163,20 @@ async def create_usuario(
     )
 
 @router.put("/usuarios/{usuario_id}", response_model=UsuarioResponse)
-async def update_usuario(
+def update_usuario(
     usuario_id: str,
     usuario_data: UsuarioUpdate,
     current_user: dict = Depends(get_current_user)
 ):
     """Actualiza un usuario existente"""
     
-    if usuario_id not in db.usuarios:
+    usuario = db.get_usuario(usuario_id)
+    if not usuario:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuario no encontrado"
         )
     
-    usuario = db.usuarios[usuario_id]
-    
     # Verificar permisos
     if current_user.rol == RolUsuario.ADMIN:
         # Admin puede actualizar cualquier usuario
@@ -209,7 +203,19 @@ async def update_usuario(
             )
     
     # Actualizar el usuario
-    usuario_actualizado = db.update_usuario(usuario_id, usuario_data)
+    try:
+        usuario_actualizado = db.update_usuario(usuario_id, usuario_data.model_dump(mode="json", exclude_unset=True))
+    except RegistroDuplicadoError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ya existe un usuario con este email"
+        )
+    
+    # Los tokens ya emitidos afirman el rol y la escuela anteriores: se revocan
+    if (usuario_actualizado.rol != usuario.rol
+            or usuario_actualizado.escuela_id != usuario.escuela_id
+            or not usuario_actualizado.activo):
+        AuthService.revoke_user_tokens(usuario_id)
     
     return UsuarioResponse(
         id=usuario_actualizado.id,
@@ -223,7 +229,7 @@ async def update_usuario(
     )
 
 @router.delete("/usuarios/{usuario_id}")
-async def delete_usuario(
+def delete_usuario(
     usuario_id: str,
     current_user: dict = Depends(get_admin_user)
 ):
@@ -232,7 +238,7 @@ async def delete_usuario(
     En lugar de eliminación física, desactiva al usuario
     """
     
-    if usuario_id not in db.usuarios:
+    if not db.usuario_exists(usuario_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuario no encontrado"
@@ -246,6 +252,7 @@ async def delete_usuario(
         )
     
     # Desactivar usuario en lugar de eliminar
-    db.usuarios[usuario_id].activo = False
+    db.update_usuario(usuario_id, {"activo": False})
+    AuthService.revoke_user_tokens(usuario_id)
     
     return {"message": "Usuario desactivado exitosamente"}
\ No newline at end of file
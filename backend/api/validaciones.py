@@ -0,0 +1,30 @@
+"""
+Validaciones compartidas por los routers de api/
+"""
+from fastapi import HTTPException, status
+from typing import List, Optional
+import sys
+import os
+
+# Agregar el directorio padre al path para importar módulos
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db
+
+def verificar_comidas(comidas_ids: Optional[List[str]]):
+    """Rechaza comidas inexistentes o repetidas antes de asociarlas al menú"""
+    if not comidas_ids:
+        return
+    repetidas = [comida_id for comida_id in set(comidas_ids) if comidas_ids.count(comida_id) > 1]
+    if repetidas:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Comida repetida en el menú: {repetidas[0]}"
+        )
+    existentes = db.get_comidas_by_ids(list(set(comidas_ids)))
+    faltantes = [comida_id for comida_id in comidas_ids if comida_id not in existentes]
+    if faltantes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Comida no encontrada: {faltantes[0]}"
+        )
@@ -3,31 +3,38 @@ from typing import Optional, Dict, Any
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 import hashlib
+import os
+import time
+import uuid
+from cache import LRUCache
 from models import *
 from database import db
+from passwords import pwd_context, hash_password
+from revocacion import revocation_list
+from ultimo_acceso import ultimo_acceso_buffer
 
 # Configuración de seguridad
 SECRET_KEY = "tu_clave_secreta_super_segura_aqui_2024"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 480  # 8 horas
 
-# Configuración de hash de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Tokens ya verificados (digest SHA-256 del token -> claims); cada entrada vence en su `exp`
+TOKEN_CACHE_MAX = int(os.getenv("TOKEN_CACHE_MAX", "10000"))
+_token_cache = LRUCache("tokens", TOKEN_CACHE_MAX)
+
 security = HTTPBearer()
 
 class AuthService:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         """Verificar contraseña"""
-        # Para desarrollo, usamos hash simple
-        return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
+        return pwd_context.verify(plain_password, hashed_password)
     
     @staticmethod
     def get_password_hash(password: str) -> str:
         """Hashear contraseña"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        return hash_password(password)
     
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -38,13 +45,68 @@ class AuthService:
         else:
             expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         
-        to_encode.update({"exp": expire})
+        # jti identifica el token para poder revocarlo (logout); iat, para revocar
+        # todos los emitidos a un usuario antes de cierto instante
+        to_encode.update({"exp": expire, "iat": datetime.utcnow(), "jti": to_encode.get("jti") or uuid.uuid4().hex})
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
         return encoded_jwt
     
     @staticmethod
     def verify_token(token: str) -> Dict[str, Any]:
-        """Verificar y decodificar token JWT"""
+        """
+        Verificar y decodificar token JWT.
+        
+        El mismo token llega en cada petición durante horas: los ya verificados se
+        guardan (por digest) hasta su `exp`, y solo se repite la comprobación de revocación.
+        """
+        clave = hashlib.sha256(token.encode()).digest()
+        encontrado, payload = _token_cache.get(clave)
+        if not encontrado:
+            payload = AuthService._decode_token(token)
+            # Sin `exp` el token no vence: no se guarda, para no cachearlo indefinidamente
+            restante = payload["exp"] - time.time() if "exp" in payload else 0
+            if restante > 0:
+                _token_cache.set(clave, payload, ttl=restante)
+        
+        if AuthService.is_token_revoked(payload):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token revocado"
+            )
+        return dict(payload)
+    
+    @staticmethod
+    def is_token_revoked(payload: Dict[str, Any]) -> bool:
+        """Token revocado por logout, o emitido a su usuario antes de una revocación de este"""
+        jti = payload.get("jti")
+        if jti is not None and revocation_list.esta_revocado(jti):
+            return True
+        return revocation_list.usuario_revocado(payload["sub"], payload.get("iat"))
+    
+    @staticmethod
+    def revoke_token(token: str):
+        """Revoca un token válido hasta su expiración"""
+        payload = AuthService.verify_token(token)
+        if "jti" in payload and "exp" in payload:
+            revocation_list.revocar(payload["jti"], payload["exp"])
+        AuthService.forget_token(token)
+    
+    @staticmethod
+    def revoke_user_tokens(usuario_id: str):
+        """
+        Revoca todos los tokens emitidos hasta ahora al usuario. Se usa cuando cambia
+        algo que los claims afirman (rol, escuela) o el usuario se desactiva.
+        """
+        revocation_list.revocar_usuario(usuario_id, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    
+    @staticmethod
+    def forget_token(token: str):
+        """Quita un token de la caché de verificación"""
+        _token_cache.invalidate(hashlib.sha256(token.encode()).digest())
+    
+    @staticmethod
+    def _decode_token(token: str) -> Dict[str, Any]:
+        """Decodificar y validar firma y expiración del token JWT"""
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
             user_id: int = payload.get("sub")
@@ -62,42 +124,32 @@ class AuthService:
     
     @staticmethod
     def authenticate_user(email: str, password: str) -> Optional[Usuario]:
-        """Autenticar usuario"""
-        # Buscar usuario por email
-        user = None
-        for u in db.usuarios.values():
-            if u.email == email and u.activo:
-                user = u
-                break
+        """
+        Autenticar usuario contra el hash almacenado.
         
-        # Para desarrollo, usar contraseñas predefinidas
-        default_passwords = {
-            "admin@sistema.cl": "admin123",
-            "rector1@sistema.cl": "rector123",
-            "rector2@sistema.cl": "rector123", 
-            "rector3@sistema.cl": "rector123",
-            "nutricionista1@sistema.cl": "nutri123",
-            "nutricionista2@sistema.cl": "nutri123",
-            "nutricionista3@sistema.cl": "nutri123",
-            "juan.perez@email.com": "padre123",
-            "ana.martinez@email.com": "estudiante123",
-            "ana.garcia@email.com": "padre123",
-            "luis.morales@email.com": "padre123",
-            "carmen.torres@email.com": "padre123",
-            "miguel.rojas@email.com": "padre123",
-            "patricia.vega@email.com": "padre123",
-            "fernando.castro@email.com": "padre123",
-            "diana.herrera@email.com": "padre123",
-            "roberto.sanchez@email.com": "padre123"
-        }
+        bcrypt es deliberadamente lento y libera el GIL: el login es un endpoint
+        síncrono, así que la verificación corre en el pool de hilos y varios
+        logins simultáneos se reparten entre los núcleos.
+        """
+        # Buscar usuario por email (índice único)
+        user = db.get_usuario_by_email(email)
+        if not user or not user.activo:
+            # Mismo costo que una verificación real: no revelar por tiempo si el email existe
+            pwd_context.dummy_verify()
+            return None
         
-        # Verificar contraseña
-        if user and email in default_passwords and password == default_passwords[email]:
-            # Actualizar último acceso
-            user.ultimo_acceso = datetime.now()
-            return user
+        valido, nuevo_hash = pwd_context.verify_and_update(password, user.password_hash)
+        if not valido:
+            return None
+        
+        # Hash heredado (sha256) o con otro coste: se reemplaza por uno bcrypt actual
+        if nuevo_hash:
+            db.update_password_hash(user.id, nuevo_hash)
         
-        return None
+        # Actualizar último acceso (se escribe en diferido, en lote)
+        user.ultimo_acceso = datetime.now()
+        ultimo_acceso_buffer.registrar(user.id, user.ultimo_acceso)
+        return user
     
     @staticmethod
     def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Usuario:
@@ -106,21 +158,44 @@ class AuthService:
         payload = AuthService.verify_token(token)
         user_id = payload.get("sub")
         
-        # Buscar usuario
-        for user in db.usuarios.values():
-            if user.id == user_id and user.activo:
-                return user
+        # Buscar usuario (caché por id; en un fallo, lectura por clave primaria)
+        user = db.get_usuario(user_id)
+        if user and user.activo:
+            ultimo_acceso_buffer.registrar(user.id, datetime.now())
+            return user
         
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario no encontrado"
         )
 
+    @staticmethod
+    def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
+        """
+        Identidad del usuario a partir de los claims del token verificado, sin leer
+        al usuario de la base de datos. Para endpoints de lectura: los claims son
+        fiables porque un cambio de rol o escuela, o la desactivación, revoca los
+        tokens ya emitidos (ver `revoke_user_tokens`).
+        """
+        payload = AuthService.verify_token(credentials.credentials)
+        if "rol" not in payload or "escuela_id" not in payload:
+            # Token emitido sin esos claims: se resuelve con el usuario completo
+            user = AuthService.get_current_user(credentials)
+            return Principal(id=user.id, email=user.email, rol=user.rol, escuela_id=user.escuela_id)
+        
+        ultimo_acceso_buffer.registrar(payload["sub"], datetime.now())
+        return Principal(
+            id=payload["sub"],
+            email=payload.get("email"),
+            rol=payload["rol"],
+            escuela_id=payload["escuela_id"]
+        )
+
 class PermissionService:
     @staticmethod
     def check_admin(current_user: Usuario):
         """Verificar que el usuario sea administrador"""
-        if current_user.rol != RolUsuario.ADMINISTRADOR:
+        if current_user.rol != RolUsuario.ADMIN:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Acceso denegado: Se requieren permisos de administrador"
@@ -129,7 +204,7 @@ class PermissionService:
     @staticmethod
     def check_rector_or_admin(current_user: Usuario):
         """Verificar que el usuario sea rector o administrador"""
-        if current_user.rol not in [RolUsuario.RECTOR, RolUsuario.ADMINISTRADOR]:
+        if current_user.rol not in [RolUsuario.RECTOR, RolUsuario.ADMIN]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Acceso denegado: Se requieren permisos de rector o administrador"
@@ -138,7 +213,7 @@ class PermissionService:
     @staticmethod
     def check_nutricionista_or_higher(current_user: Usuario):
         """Verificar que el usuario sea nutricionista, rector o administrador"""
-        if current_user.rol not in [RolUsuario.NUTRICIONISTA, RolUsuario.RECTOR, RolUsuario.ADMINISTRADOR]:
+        if current_user.rol not in [RolUsuario.NUTRICIONISTA, RolUsuario.RECTOR, RolUsuario.ADMIN]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Acceso denegado: Se requieren permisos de nutricionista o superior"
@@ -147,7 +222,7 @@ class PermissionService:
     @staticmethod
     def check_same_school_or_admin(current_user: Usuario, target_school_id: int):
         """Verificar que el usuario pertenezca a la misma escuela o sea administrador"""
-        if current_user.rol == RolUsuario.ADMINISTRADOR:
+        if current_user.rol == RolUsuario.ADMIN:
             return  # Admin puede acceder a cualquier escuela
         
         if current_user.escuela_id != target_school_id:
@@ -159,7 +234,7 @@ class PermissionService:
     @staticmethod
     def check_own_data_or_admin(current_user: Usuario, target_user_id: int):
         """Verificar que sea el mismo usuario o administrador"""
-        if current_user.rol == RolUsuario.ADMINISTRADOR:
+        if current_user.rol == RolUsuario.ADMIN:
             return
         
         if current_user.id != target_user_id:
@@ -172,6 +247,10 @@ class PermissionService:
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Usuario:
     return AuthService.get_current_user(credentials)
 
+def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
+    """Usuario actual según su token, para endpoints de solo lectura"""
+    return AuthService.get_current_principal(credentials)
+
 def get_admin_user(current_user: Usuario = Depends(get_current_user)) -> Usuario:
     PermissionService.check_admin(current_user)
     return current_user
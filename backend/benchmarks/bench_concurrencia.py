@@ -0,0 +1,150 @@
+"""
+Benchmark de latencia bajo carga concurrente.
+
+Crea una base SQLite temporal con datos sintéticos y lanza, contra la app en
+proceso, peticiones pesadas (listado amplio de menús) junto con peticiones
+ligeras (`/api/health`). Si el trabajo de base de datos bloquea el event loop,
+la latencia de las peticiones ligeras se dispara hasta la de las pesadas.
+
+`--latencia-db-ms` añade una espera a cada sentencia SQL para simular el viaje
+de red a un servidor PostgreSQL remoto (SQLite local responde en microsegundos).
+
+Uso (desde backend/):
+    python benchmarks/bench_concurrencia.py --menus 200 --pesadas 16 --latencia-db-ms 50
+
+Para comparar antes/después, ejecutar el mismo comando sobre cada commit.
+
+Requiere httpx (no es dependencia de producción).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    k = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+def resumen(nombre, latencias):
+    ms = [l * 1000 for l in latencias]
+    print(f"{nombre:<8} n={len(ms):<5} p50={percentil(ms, 50):8.1f} ms  "
+          f"p95={percentil(ms, 95):8.1f} ms  p99={percentil(ms, 99):8.1f} ms")
+
+
+def poblar(total_menus):
+    from db_config import SessionLocal, init_db
+    from models_db import EscuelaDB, UsuarioDB, MenuDB, RolUsuarioEnum, TipoMenuEnum
+
+    init_db()
+    db = SessionLocal()
+    try:
+        db.add(EscuelaDB(
+            id="escuela-bench", nombre="Escuela Bench", direccion="-", telefono="-",
+            email="bench@escuela.cl", codigo_establecimiento="bench", director="-",
+            director_email="director@escuela.cl", capacidad_estudiantes=1,
+            niveles_educativos=[], activa=True, fecha_creacion=datetime.now()
+        ))
+        db.add(UsuarioDB(
+            id="admin-bench", nombre="Admin Bench", email="admin@bench.cl",
+            password_hash="-", rol=RolUsuarioEnum.ADMIN, activo=True,
+            fecha_creacion=datetime.now()
+        ))
+        db.flush()
+        tipos = list(TipoMenuEnum)
+        inicio = date(2020, 1, 1)
+        db.bulk_insert_mappings(MenuDB, [
+            {
+                "id": f"menu-{i:07d}",
+                "escuela_id": "escuela-bench",
+                "fecha": inicio + timedelta(days=i // len(tipos)),
+                "tipo": tipos[i % len(tipos)],
+                "nombre": f"Menú {i}",
+                "descripcion": "",
+                "activo": True,
+                "creado_por": "admin-bench",
+                "fecha_creacion": datetime.now(),
+            }
+            for i in range(total_menus)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+async def ejecutar(args):
+    import httpx
+    from sqlalchemy import event
+    from db_config import engine
+    from main import app
+    from auth import AuthService
+
+    if args.latencia_db_ms:
+        @event.listens_for(engine, "before_cursor_execute")
+        def simular_red(*_):
+            time.sleep(args.latencia_db_ms / 1000)
+
+    token = AuthService.create_access_token({"sub": "admin-bench", "email": "admin@bench.cl", "rol": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+    ruta_pesada = "/api/menus?fecha_inicio=2000-01-01&fecha_fin=2100-01-01"
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=600) as client:
+            async def medir(ruta, destino, programada=None):
+                # La latencia se mide desde el instante en que la petición debía salir,
+                # para no ocultar el tiempo que pasa esperando a un event loop bloqueado
+                t0 = programada if programada is not None else time.perf_counter()
+                respuesta = await client.get(ruta, headers=headers)
+                destino.append(time.perf_counter() - t0)
+                assert respuesta.status_code == 200, respuesta.text
+
+            # Calentamiento
+            await medir("/api/health", [])
+
+            pesadas, ligeras = [], []
+            t0 = time.perf_counter()
+            tareas = [asyncio.create_task(medir(ruta_pesada, pesadas)) for _ in range(args.pesadas)]
+
+            # Peticiones ligeras a ritmo fijo mientras las pesadas están en curso
+            for i in range(args.ligeras):
+                programada = t0 + i * args.intervalo
+                await asyncio.sleep(max(0.0, programada - time.perf_counter()))
+                tareas.append(asyncio.create_task(medir("/api/health", ligeras, programada)))
+
+            await asyncio.gather(*tareas)
+            total = time.perf_counter() - t0
+
+    print(f"menús={args.menus} pesadas={args.pesadas} ligeras={args.ligeras} "
+          f"latencia_db={args.latencia_db_ms}ms total={total:.2f}s")
+    resumen("pesadas", pesadas)
+    resumen("ligeras", ligeras)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--menus", type=int, default=200)
+    parser.add_argument("--pesadas", type=int, default=16)
+    parser.add_argument("--ligeras", type=int, default=200)
+    parser.add_argument("--latencia-db-ms", type=float, default=50.0)
+    parser.add_argument("--intervalo", type=float, default=0.02, help="segundos entre peticiones ligeras")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench-nutricion-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directorio, 'bench.db')}"
+    sys.path.insert(0, BACKEND_DIR)
+
+    poblar(args.menus)
+    asyncio.run(ejecutar(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Micro-benchmark de la verificación de tokens JWT por petición.
+
+Compara, para un mismo token, el costo de `jwt.decode` (firma HMAC + claims) en
+cada llamada contra `AuthService.verify_token` con la caché de tokens verificados
+(digest SHA-256 + búsqueda en la LRU + comprobación de revocación).
+
+Uso (desde backend/):
+    python benchmarks/bench_jwt.py --iteraciones 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def medir(nombre, funcion, iteraciones, repeticiones):
+    # Mejor de varias repeticiones: reduce el ruido del sistema
+    mejor = min(timeit.repeat(funcion, number=iteraciones, repeat=repeticiones))
+    por_llamada = mejor / iteraciones * 1e6
+    print(f"{nombre:<28} {por_llamada:8.2f} µs/llamada")
+    return por_llamada
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iteraciones", type=int, default=50000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    # auth importa database; una base SQLite temporal evita depender de PostgreSQL
+    directorio = tempfile.mkdtemp(prefix="bench-nutricion-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directorio, 'bench.db')}"
+    sys.path.insert(0, BACKEND_DIR)
+
+    from jose import jwt
+    from auth import AuthService, SECRET_KEY, ALGORITHM
+
+    token = AuthService.create_access_token({"sub": "admin-bench", "email": "admin@bench.cl", "rol": "admin"})
+    AuthService.verify_token(token)  # llenar la caché
+
+    print(f"iteraciones={args.iteraciones} repeticiones={args.repeticiones}")
+    sin_cache = medir("jwt.decode (sin caché)", lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]),
+                      args.iteraciones, args.repeticiones)
+    con_cache = medir("verify_token (con caché)", lambda: AuthService.verify_token(token),
+                      args.iteraciones, args.repeticiones)
+    print(f"ahorro por petición: {sin_cache - con_cache:.2f} µs ({sin_cache / con_cache:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark del cálculo de información nutricional de muchos menús.
+
+Crea una base SQLite temporal con `--escuelas` escuelas, un mes de menús (un menú
+por tipo y día) de `--comidas-por-menu` comidas cada uno, y compara:
+- por menú: una consulta de comidas por menú y sumas con `sum()` en Python
+  (lo que hacía el endpoint informacion-nutricional);
+- motor: `MotorNutricional.totales` para todos los menús de una vez.
+
+Uso (desde backend/):
+    python benchmarks/bench_nutricion.py --escuelas 20 --comidas-por-menu 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def poblar(escuelas, comidas_por_menu, total_comidas):
+    from db_config import SessionLocal, init_db
+    from models_db import (EscuelaDB, UsuarioDB, ComidaDB, MenuDB, MenuComidaDB,
+                           RolUsuarioEnum, TipoMenuEnum, CategoriaComidaEnum)
+
+    init_db()
+    azar = random.Random(1)
+    db = SessionLocal()
+    try:
+        db.add(UsuarioDB(
+            id="admin-bench", nombre="Admin Bench", email="admin@bench.cl",
+            password_hash="-", rol=RolUsuarioEnum.ADMIN, activo=True, fecha_creacion=datetime.now()
+        ))
+        db.bulk_insert_mappings(EscuelaDB, [
+            {
+                "id": f"escuela-{e:03d}", "nombre": f"Escuela {e}", "direccion": "-", "telefono": "-",
+                "email": f"e{e}@escuela.cl", "codigo_establecimiento": f"cod-{e}", "director": "-",
+                "director_email": "director@escuela.cl", "capacidad_estudiantes": 1,
+                "niveles_educativos": [], "activa": True, "fecha_creacion": datetime.now(),
+            }
+            for e in range(escuelas)
+        ])
+        db.bulk_insert_mappings(ComidaDB, [
+            {
+                "id": f"comida-{c:05d}", "nombre": f"Comida {c}", "categoria": CategoriaComidaEnum.PROTEINA,
+                "descripcion": "-",
+                "calorias": azar.randint(50, 600), "proteinas": azar.uniform(0, 40),
+                "grasas": azar.uniform(0, 30), "carbohidratos": azar.uniform(0, 80),
+                "fibra": azar.uniform(0, 10), "sodio": azar.uniform(0, 900), "azucar": azar.uniform(0, 30),
+                "ingredientes": [], "alergenos": [], "activa": True, "fecha_creacion": datetime.now(),
+            }
+            for c in range(total_comidas)
+        ])
+        menus, items = [], []
+        inicio = date(2024, 3, 1)
+        for e in range(escuelas):
+            for dia in range(31):
+                for tipo in TipoMenuEnum:
+                    menu_id = f"menu-{e:03d}-{dia:02d}-{tipo.name}"
+                    menus.append({
+                        "id": menu_id, "escuela_id": f"escuela-{e:03d}", "fecha": inicio + timedelta(days=dia),
+                        "tipo": tipo, "nombre": menu_id, "activo": True, "creado_por": "admin-bench",
+                        "fecha_creacion": datetime.now(),
+                    })
+                    for orden, c in enumerate(azar.sample(range(total_comidas), comidas_por_menu)):
+                        items.append({
+                            "id": f"{menu_id}-{orden}", "menu_id": menu_id, "comida_id": f"comida-{c:05d}",
+                            "porcion": azar.choice((0.5, 1.0, 1.5)), "orden": orden,
+                        })
+        db.bulk_insert_mappings(MenuDB, menus)
+        db.bulk_insert_mappings(MenuComidaDB, items)
+        db.commit()
+        return [m["id"] for m in menus]
+    finally:
+        db.close()
+
+
+def por_menu(database, menu_ids):
+    """Un menú a la vez, como el endpoint original"""
+    resultado = {}
+    for menu_id in menu_ids:
+        menu = database.get_menu(menu_id)
+        comidas = database.get_comidas_by_ids(menu.comidas)
+        resultado[menu_id] = {
+            "calorias": sum(comidas[c].calorias for c in menu.comidas),
+            "proteinas": sum(comidas[c].proteinas for c in menu.comidas),
+            "grasas": sum(comidas[c].grasas for c in menu.comidas),
+            "carbohidratos": sum(comidas[c].carbohidratos for c in menu.comidas),
+        }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escuelas", type=int, default=20)
+    parser.add_argument("--comidas-por-menu", type=int, default=5)
+    parser.add_argument("--comidas", type=int, default=500, help="tamaño del catálogo")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench-nutricion-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directorio, 'bench.db')}"
+    sys.path.insert(0, BACKEND_DIR)
+
+    menu_ids = poblar(args.escuelas, args.comidas_por_menu, args.comidas)
+
+    from database import db
+    from nutricion import motor_nutricional
+
+    print(f"escuelas={args.escuelas} menús={len(menu_ids)} comidas_por_menu={args.comidas_por_menu}")
+
+    t0 = time.perf_counter()
+    por_menu(db, menu_ids)
+    print(f"{'por menú (sum)':<22} {(time.perf_counter() - t0) * 1000:10.1f} ms")
+
+    t0 = time.perf_counter()
+    motor_nutricional.totales(menu_ids)
+    print(f"{'motor (carga matriz)':<22} {(time.perf_counter() - t0) * 1000:10.1f} ms")
+
+    t0 = time.perf_counter()
+    motor_nutricional.totales(menu_ids)
+    print(f"{'motor (matriz en caché)':<22} {(time.perf_counter() - t0) * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
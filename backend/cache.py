@@ -0,0 +1,75 @@
+"""
+Caché en memoria LRU con TTL opcional, compartida por los hilos del proceso.
+Usada por Database para las tablas de catálogo (comidas, escuelas).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """Caché LRU acotada en tamaño, con expiración opcional por entrada"""
+
+    def __init__(self, nombre: str, max_size: int = 1024, ttl: Optional[float] = None):
+        self.nombre = nombre
+        self.max_size = max_size
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Aumenta con cada invalidación; permite descartar valores leídos antes de ella
+        self.version = 0
+
+    def get(self, clave: Hashable) -> Tuple[bool, Any]:
+        """Retorna (encontrado, valor); las entradas vencidas cuentan como miss"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                valor, expira = entrada
+                if expira is None or expira > time.monotonic():
+                    self._datos.move_to_end(clave)
+                    self.hits += 1
+                    return True, valor
+                del self._datos[clave]
+            self.misses += 1
+            return False, None
+
+    def set(self, clave: Hashable, valor: Any, version: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Guarda un valor. Si se indica `version` (la leída antes de consultar la base
+        de datos) y hubo una invalidación desde entonces, el valor se descarta.
+        `ttl` reemplaza el TTL de la caché para esta entrada.
+        """
+        ttl = ttl if ttl is not None else self.ttl
+        expira = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._datos[clave] = (valor, expira)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_size:
+                self._datos.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, clave: Optional[Hashable] = None):
+        """Elimina una entrada, o toda la caché si no se indica clave"""
+        with self._lock:
+            self.version += 1
+            if clave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._datos),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
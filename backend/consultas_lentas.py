@@ -0,0 +1,155 @@
+"""
+Registro de consultas SQL lentas con su plan de ejecución.
+
+Los hooks del engine (db_config) entregan aquí cada sentencia que supera el umbral.
+El EXPLAIN (EXPLAIN QUERY PLAN en SQLite) no se ejecuta en la conexión ni en el hilo
+de la petición: un hilo aparte lo corre en una conexión propia y recién entonces
+escribe el registro. Cada registro va a un archivo rotativo (una línea JSON, desde
+que la aplicación lo abre al iniciar) y a un buffer en memoria que consulta el
+endpoint de administración.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+from cache import LRUCache
+
+# Los parámetros de sentencias que tocan estas columnas no se registran
+COLUMNAS_SENSIBLES = ("password_hash",)
+# Largo máximo de cada parámetro en el registro
+MAX_LARGO_PARAMETRO = 200
+
+
+def _parametros_registrables(statement: str, parameters: Any) -> Any:
+    if any(columna in statement for columna in COLUMNAS_SENSIBLES):
+        return "[ocultos]"
+
+    def recortar(valor):
+        texto = valor if isinstance(valor, (int, float, bool)) or valor is None else str(valor)
+        if isinstance(texto, str) and len(texto) > MAX_LARGO_PARAMETRO:
+            return texto[:MAX_LARGO_PARAMETRO] + "…"
+        return texto
+
+    if isinstance(parameters, dict):
+        return {clave: recortar(valor) for clave, valor in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [recortar(valor) for valor in parameters]
+    return recortar(parameters)
+
+
+class RegistroConsultasLentas:
+    """Consultas por encima de `umbral_ms`, con plan capturado fuera de banda"""
+
+    def __init__(self, engine, umbral_ms: float, archivo: Optional[str] = None,
+                 max_registros: int = 200, max_pendientes: int = 100):
+        self.engine = engine
+        self.umbral_ms = umbral_ms
+        self.activo = umbral_ms > 0
+        self._recientes: deque = deque(maxlen=max_registros)
+        self._pendientes: "queue.Queue[tuple[Dict[str, Any], Any]]" = queue.Queue(maxsize=max_pendientes)
+        self._descartados = 0
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Plan por forma de sentencia: una consulta lenta repetida no repite el EXPLAIN
+        self._planes = LRUCache("planes_sql", 256, ttl=600)
+
+        # El archivo se abre al iniciar la aplicación (abrir_archivo), no al importar
+        self.archivo = archivo
+        self._log = logging.getLogger("consultas_lentas")
+        self._log.propagate = False
+
+    def abrir_archivo(self):
+        """Agrega el archivo rotativo al logger, una sola vez; sin archivo o inactivo no hace nada"""
+        if not (self.archivo and self.activo):
+            return
+        ruta = os.path.abspath(self.archivo)
+        with self._lock:
+            if any(getattr(handler, "baseFilename", None) == ruta for handler in self._log.handlers):
+                return
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            self._log.addHandler(RotatingFileHandler(ruta, maxBytes=5 * 1024 * 1024, backupCount=5, encoding="utf-8"))
+            self._log.setLevel(logging.INFO)
+
+    def registrar(self, statement: str, parameters: Any, forma: str, duracion: float,
+                  ruta: Optional[str], executemany: bool):
+        """Llamado desde el hook del engine: solo encola, no consulta nada"""
+        registro = {
+            "fecha": datetime.now().isoformat(timespec="milliseconds"),
+            "duracion_ms": round(duracion * 1000, 2),
+            "ruta": ruta,
+            "sentencia": statement,
+            "parametros": "[lote]" if executemany else _parametros_registrables(statement, parameters),
+            "forma": forma,
+            "plan": None,
+        }
+        try:
+            self._pendientes.put_nowait((registro, None if executemany else parameters))
+        except queue.Full:
+            with self._lock:
+                self._descartados += 1
+            return
+        self._iniciar_hilo()
+
+    def recientes(self, limite: int = 50) -> List[Dict[str, Any]]:
+        """Últimas consultas lentas registradas, la más reciente primero"""
+        with self._lock:
+            return list(self._recientes)[::-1][:limite]
+
+    def metricas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "umbral_ms": self.umbral_ms,
+                "registradas": len(self._recientes),
+                "pendientes": self._pendientes.qsize(),
+                "descartadas": self._descartados,
+            }
+
+    def _iniciar_hilo(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._procesar, name="consultas-lentas", daemon=True)
+                self._hilo.start()
+
+    def _procesar(self):
+        while True:
+            registro, parametros = self._pendientes.get()
+            try:
+                registro["plan"] = self._plan(registro["sentencia"], registro["forma"], parametros)
+            except Exception as e:
+                registro["plan"] = [f"EXPLAIN falló: {e}"]
+            registro.pop("forma")
+            with self._lock:
+                self._recientes.append(registro)
+            self._log.info(json.dumps(registro, ensure_ascii=False, default=str))
+
+    def _plan(self, statement: str, forma: str, parametros: Any) -> Optional[List[str]]:
+        """EXPLAIN en una conexión propia, fuera de la transacción que ejecutó la consulta"""
+        encontrado, plan = self._planes.get(forma)
+        if encontrado:
+            return plan
+        if parametros is None:
+            return None  # executemany: el plan de un lote no es representativo
+
+        prefijo = "EXPLAIN QUERY PLAN " if self.engine.dialect.name == "sqlite" else "EXPLAIN "
+        # Conexión DBAPI directa: no pasa por los hooks del engine (no se mide a sí misma)
+        conexion = self.engine.raw_connection()
+        try:
+            cursor = conexion.cursor()
+            try:
+                cursor.execute(prefijo + statement, parametros)
+                plan = [str(fila[-1]) for fila in cursor.fetchall()]
+            finally:
+                cursor.close()
+            conexion.rollback()
+        finally:
+            conexion.close()
+        self._planes.set(forma, plan)
+        return plan
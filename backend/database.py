@@ -2,23 +2,34 @@
 Database class usando SQLAlchemy con SQLite
 """
 from datetime import datetime, date
-from typing import Dict, Optional, List
+from typing import Any, Callable, Dict, Optional, List, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-import hashlib
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_, or_, func, tuple_, select, insert, update, delete, bindparam, Date, DateTime, Enum as SAEnum
+import base64
+from contextlib import contextmanager
+import enum
+import json
+import logging
+import os
 import uuid
 
-from db_config import SessionLocal, get_db
+from sqlalchemy import event
+
+from cache import LRUCache
+from db_config import SessionLocal, get_request_session
+from passwords import hash_password
 from models_db import (
     EscuelaDB, UsuarioDB, ComidaDB, MenuDB, 
-    MenuComidaDB, FeedbackDB,
+    MenuComidaDB, MenuNutricionDB, FeedbackDB, TokenRevocadoDB,
     RolUsuarioEnum, CategoriaComidaEnum, TipoMenuEnum
 )
 from models import (
-    Usuario, Escuela, Comida, Menu, Feedback,
+    Usuario, Escuela, Comida, Menu, MenuCompleto, Feedback, FeedbackResponse,
     RolUsuario, CategoriaComida, TipoMenu
 )
 
+logger = logging.getLogger(__name__)
 
 # Mapeo de roles entre SQLAlchemy Enum y Pydantic Enum
 ROLE_MAP_DB_TO_PYDANTIC = {
@@ -76,45 +87,586 @@ TIPO_MENU_MAP_PYDANTIC_TO_DB = {
 }
 
 
+# Caché de catálogo (comidas, escuelas): cambia poco y se lee en casi todas las peticiones
+CACHE_CATALOGO_MAX = int(os.getenv("CACHE_CATALOGO_MAX", "2048"))
+CACHE_CATALOGO_TTL = float(os.getenv("CACHE_CATALOGO_TTL", "300"))  # segundos; 0 = sin expiración
+
+# Caché de usuarios por id: la consulta get_current_user en cada petición autenticada.
+# TTL corto porque con varios procesos la invalidación solo llega al proceso que escribe.
+CACHE_USUARIOS_MAX = int(os.getenv("CACHE_USUARIOS_MAX", "10000"))
+CACHE_USUARIOS_TTL = float(os.getenv("CACHE_USUARIOS_TTL", "60"))  # segundos; 0 = sin expiración
+
+# Clave bajo la que se guarda la tabla completa junto a las entradas por id
+_TODAS = ("*",)
+
+# Nutrientes de ComidaDB que se totalizan por menú (columnas homónimas en MenuNutricionDB)
+NUTRIENTES = ("calorias", "proteinas", "grasas", "carbohidratos", "fibra", "sodio", "azucar")
+
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_rollback")
+def _invalidar_pendientes(session: Session):
+    # Segunda invalidación al terminar la transacción: otra petición pudo leer
+    # y cachear el valor anterior entre el flush y el commit
+    for cache, claves in session.info.pop("cache_pendiente", {}).values():
+        for clave in claves:
+            cache.invalidate(clave)
+        cache.invalidate(_TODAS)
+
+
+class CursorInvalidoError(ValueError):
+    """Cursor de paginación mal formado o de otro listado"""
+
+
+class RegistroDuplicadoError(ValueError):
+    """Escritura rechazada por una restricción de unicidad de la base de datos"""
+    
+    def __init__(self, restriccion: str):
+        super().__init__(restriccion)
+        # Nombre del índice único violado (en SQLite, a veces sus columnas: "tabla.columna")
+        self.restriccion = restriccion
+
+
 class Database:
     """Clase Database que usa SQLAlchemy con SQLite"""
     
     def __init__(self):
-        pass
+        ttl = CACHE_CATALOGO_TTL or None
+        self.cache_comidas = LRUCache("comidas", CACHE_CATALOGO_MAX, ttl)
+        self.cache_escuelas = LRUCache("escuelas", CACHE_CATALOGO_MAX, ttl)
+        self.cache_usuarios = LRUCache("usuarios", CACHE_USUARIOS_MAX, CACHE_USUARIOS_TTL or None)
     
     def _get_db(self) -> Session:
-        return SessionLocal()
+        # Dentro de una petición se reutiliza su sesión (unidad de trabajo)
+        return get_request_session() or SessionLocal()
+    
+    def _commit(self, db: Session):
+        # En una petición solo se envían los cambios; RutaConSesion hace el commit antes de responder
+        if db is get_request_session():
+            db.flush()
+        else:
+            db.commit()
+    
+    def _rollback(self, db: Session):
+        if db is not get_request_session():
+            db.rollback()
+    
+    def _close(self, db: Session):
+        if db is not get_request_session():
+            db.close()
+    
+    @staticmethod
+    def _violacion_unicidad(error: IntegrityError) -> Optional[str]:
+        """Restricción única violada según el driver, o None si el error es de otro tipo"""
+        orig = error.orig
+        # psycopg 3 expone sqlstate; psycopg2, pgcode
+        if (getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)) == "23505":
+            return orig.diag.constraint_name or str(orig)
+        mensaje = str(orig)
+        if mensaje.startswith("UNIQUE constraint failed"):
+            return mensaje.split(":", 1)[1].strip()
+        return None
+    
+    @contextmanager
+    def _unicidad(self, db: Session):
+        """
+        Traduce una violación de unicidad al escribir en RegistroDuplicadoError.
+        La transacción se deshace completa: el endpoint responde con error y no confirma nada.
+        """
+        try:
+            yield
+        except IntegrityError as e:
+            restriccion = self._violacion_unicidad(e)
+            db.rollback()
+            if restriccion is None:
+                raise
+            raise RegistroDuplicadoError(restriccion) from e
+    
+    def _cache_activa(self, cache: LRUCache) -> bool:
+        # Si la petición en curso ya escribió en esta entidad, sus lecturas van a la base de datos
+        session = get_request_session()
+        return session is None or cache.nombre not in session.info.get("cache_pendiente", {})
+    
+    def _invalidar(self, db: Session, cache: LRUCache, clave: str):
+        cache.invalidate(clave)
+        cache.invalidate(_TODAS)
+        if db is get_request_session():
+            # Se repite al confirmar o deshacer la transacción de la petición
+            _, claves = db.info.setdefault("cache_pendiente", {}).setdefault(cache.nombre, (cache, set()))
+            claves.add(clave)
+    
+    def _get_cacheado(self, cache: LRUCache, modelo, mapper, ids) -> Dict[str, Any]:
+        """
+        Lectura por id a través de la caché: solo los ids ausentes van a la base de
+        datos, en una sola consulta IN, y quedan guardados para las siguientes lecturas.
+        """
+        usar_cache = self._cache_activa(cache)
+        result = {}
+        faltantes = set(ids)
+        if usar_cache:
+            for id_ in faltantes:
+                encontrado, valor = cache.get(id_)
+                if encontrado:
+                    result[id_] = valor
+            faltantes -= result.keys()
+        if not faltantes:
+            return result
+        
+        version = cache.version
+        db = self._get_db()
+        try:
+            for fila in db.query(modelo).filter(modelo.id.in_(faltantes)).all():
+                result[fila.id] = mapper(fila)
+                if usar_cache:
+                    cache.set(fila.id, result[fila.id], version)
+            return result
+        finally:
+            self._close(db)
+    
+    def _todos_cacheado(self, cache: LRUCache, modelo, mapper) -> Dict[str, Any]:
+        """Tabla completa a través de la caché (también llena las entradas por id)"""
+        usar_cache = self._cache_activa(cache)
+        if usar_cache:
+            encontrado, todos = cache.get(_TODAS)
+            if encontrado:
+                return dict(todos)
+        
+        version = cache.version
+        db = self._get_db()
+        try:
+            todos = {fila.id: mapper(fila) for fila in db.query(modelo).all()}
+            if usar_cache:
+                cache.set(_TODAS, todos, version)
+                for id_, valor in todos.items():
+                    cache.set(id_, valor, version)
+            return dict(todos)
+        finally:
+            self._close(db)
+    
+    def version_comidas(self) -> Optional[int]:
+        """
+        Versión de la caché de comidas, que cambia con cada escritura en comidas de este
+        proceso; None si la petición en curso modificó comidas aún sin confirmar (sus
+        lecturas deben ir a la base de datos). Para cachés derivadas, como la matriz
+        nutricional.
+        """
+        return self.cache_comidas.version if self._cache_activa(self.cache_comidas) else None
+    
+    def invalidar_comidas(self):
+        """Descarta las comidas cacheadas (y lo derivado de ellas), p. ej. tras una carga externa"""
+        self.cache_comidas.invalidate()
+    
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Contadores de aciertos, fallos y desalojos de las cachés de entidades"""
+        return {
+            cache.nombre: cache.stats()
+            for cache in (self.cache_comidas, self.cache_escuelas, self.cache_usuarios)
+        }
     
     def initialize_sample_data(self):
         return True
     
     def _hash_password(self, password: str) -> str:
-        return hashlib.sha256(password.encode()).hexdigest()
+        return hash_password(password)
     
     def get_current_timestamp(self):
         return datetime.now().isoformat()
     
+    def _to_usuario(self, u: UsuarioDB) -> Usuario:
+        return Usuario(
+            id=u.id,
+            nombre=u.nombre,
+            email=u.email,
+            password_hash=u.password_hash,
+            rol=ROLE_MAP_DB_TO_PYDANTIC.get(u.rol.value, u.rol.value.lower()),
+            escuela_id=u.escuela_id,
+            activo=u.activo,
+            fecha_creacion=u.fecha_creacion.isoformat() if u.fecha_creacion else None,
+            ultimo_acceso=u.ultimo_acceso.isoformat() if u.ultimo_acceso else None
+        )
+    
+    def _to_escuela(self, e: EscuelaDB) -> Escuela:
+        return Escuela(
+            id=e.id,
+            nombre=e.nombre,
+            direccion=e.direccion,
+            telefono=e.telefono,
+            email=e.email,
+            codigo_establecimiento=e.codigo_establecimiento,
+            director=e.director,
+            director_email=e.director_email,
+            capacidad_estudiantes=e.capacidad_estudiantes,
+            niveles_educativos=e.niveles_educativos or [],
+            activa=e.activa,
+            fecha_creacion=e.fecha_creacion.isoformat() if e.fecha_creacion else None
+        )
+    
+    def _to_comida(self, c: ComidaDB) -> Comida:
+        return Comida(
+            id=c.id,
+            nombre=c.nombre,
+            categoria=CATEGORIA_MAP_DB_TO_PYDANTIC.get(c.categoria.value, c.categoria.value.lower()),
+            descripcion=c.descripcion,
+            calorias=c.calorias,
+            proteinas=c.proteinas,
+            grasas=c.grasas,
+            carbohidratos=c.carbohidratos,
+            fibra=c.fibra,
+            sodio=c.sodio,
+            azucar=c.azucar,
+            ingredientes=c.ingredientes or [],
+            alergenos=c.alergenos or [],
+            activa=c.activa,
+            fecha_creacion=c.fecha_creacion.isoformat() if c.fecha_creacion else None
+        )
+    
+    def _to_menu(self, m: MenuDB, comidas_ids: List[str]) -> Menu:
+        return Menu(
+            id=m.id,
+            escuela_id=m.escuela_id,
+            fecha=m.fecha.isoformat() if isinstance(m.fecha, date) else m.fecha,
+            tipo=TIPO_MENU_MAP_DB_TO_PYDANTIC.get(m.tipo.value, m.tipo.value.lower()),
+            nombre=m.nombre,
+            descripcion=m.descripcion,
+            comidas=comidas_ids,
+            activo=m.activo,
+            creado_por=m.creado_por,
+            fecha_creacion=m.fecha_creacion.isoformat() if m.fecha_creacion else None
+        )
+    
+    def _to_feedback(self, f: FeedbackDB) -> Feedback:
+        return Feedback(
+            id=f.id,
+            menu_id=f.menu_id,
+            usuario_id=f.usuario_id,
+            calificacion=f.calificacion,
+            comentario=f.comentario,
+            fecha=f.fecha.isoformat() if isinstance(f.fecha, date) else f.fecha
+        )
+    
+    def _to_feedback_response(self, f: FeedbackDB, usuario_nombre, menu_nombre, menu_fecha, menu_tipo) -> FeedbackResponse:
+        return FeedbackResponse(
+            id=f.id,
+            menu_id=f.menu_id,
+            usuario_id=f.usuario_id,
+            calificacion=f.calificacion,
+            comentario=f.comentario,
+            fecha=f.fecha,
+            usuario_nombre=usuario_nombre or "Usuario desconocido",
+            menu_nombre=menu_nombre or "Menú desconocido",
+            menu_fecha=menu_fecha,
+            menu_tipo=TIPO_MENU_MAP_DB_TO_PYDANTIC.get(menu_tipo.value, menu_tipo.value.lower()) if menu_tipo else None
+        )
+    
+    @staticmethod
+    def _encode_cursor(valores: List[Any]) -> str:
+        serializables = [
+            v.name if isinstance(v, enum.Enum) else v.isoformat() if isinstance(v, (date, datetime)) else v
+            for v in valores
+        ]
+        return base64.urlsafe_b64encode(json.dumps(serializables).encode()).decode()
+    
+    @staticmethod
+    def _decode_cursor(cursor: str, columnas: List[Any]) -> List[Any]:
+        try:
+            valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(valores, list) or len(valores) != len(columnas):
+                raise CursorInvalidoError(cursor)
+            
+            result = []
+            for columna, valor in zip(columnas, valores):
+                if isinstance(columna.type, DateTime):
+                    valor = datetime.fromisoformat(valor)
+                elif isinstance(columna.type, Date):
+                    valor = date.fromisoformat(valor)
+                elif isinstance(columna.type, SAEnum):
+                    valor = columna.type.enum_class[valor]
+                result.append(valor)
+            return result
+        except (ValueError, KeyError, TypeError) as e:
+            raise CursorInvalidoError(cursor) from e
+    
+    def _paginar(self, query, orden: List[Tuple[Any, bool]], limit: Optional[int], cursor: Optional[str],
+                 entidad: Optional[Callable] = None):
+        """
+        Paginación por keyset. `orden` es una lista de (columna, descendente) que debe
+        terminar en una columna única; el cursor guarda esos valores de la última fila
+        devuelta. Retorna (filas, siguiente_cursor), con siguiente_cursor None al final.
+        Si la consulta devuelve tuplas, `entidad` extrae de cada fila el objeto con esas columnas.
+        """
+        columnas = [columna for columna, _ in orden]
+        
+        if cursor:
+            valores = self._decode_cursor(cursor, columnas)
+            descendentes = {desc for _, desc in orden}
+            if len(descendentes) == 1:
+                # Misma dirección en todas las columnas: comparación de tuplas, aprovecha el índice
+                if descendentes.pop():
+                    query = query.filter(tuple_(*columnas) < tuple_(*valores))
+                else:
+                    query = query.filter(tuple_(*columnas) > tuple_(*valores))
+            else:
+                condiciones = []
+                for i, (columna, desc) in enumerate(orden):
+                    iguales = [c == v for c, v in zip(columnas[:i], valores[:i])]
+                    condiciones.append(and_(*iguales, columna < valores[i] if desc else columna > valores[i]))
+                query = query.filter(or_(*condiciones))
+        
+        query = query.order_by(*[columna.desc() if desc else columna.asc() for columna, desc in orden])
+        
+        if limit is None:
+            return query.all(), None
+        
+        filas = query.limit(limit + 1).all()
+        if len(filas) <= limit:
+            return filas, None
+        
+        filas = filas[:limit]
+        ultima = entidad(filas[-1]) if entidad else filas[-1]
+        return filas, self._encode_cursor([getattr(ultima, columna.key) for columna in columnas])
+    
+    def _comidas_ids_por_menu(self, db: Session, menu_ids: List[str]) -> Dict[str, List[str]]:
+        """Ids de comidas (ordenadas) de varios menús en una sola consulta"""
+        result = {menu_id: [] for menu_id in menu_ids}
+        if not menu_ids:
+            return result
+        
+        filas = db.query(MenuComidaDB.menu_id, MenuComidaDB.comida_id).filter(
+            MenuComidaDB.menu_id.in_(menu_ids)
+        ).order_by(MenuComidaDB.menu_id, MenuComidaDB.orden).all()
+        
+        for menu_id, comida_id in filas:
+            result[menu_id].append(comida_id)
+        return result
+    
+    def _comidas_ids_por_menu_todos(self, db: Session) -> Dict[str, List[str]]:
+        """Ids de comidas (ordenadas) de todos los menús, agrupadas en memoria"""
+        result: Dict[str, List[str]] = {}
+        filas = db.query(MenuComidaDB.menu_id, MenuComidaDB.comida_id).order_by(
+            MenuComidaDB.menu_id, MenuComidaDB.orden
+        ).all()
+        
+        for menu_id, comida_id in filas:
+            result.setdefault(menu_id, []).append(comida_id)
+        return result
+    
+    def _recalcular_totales(self, db: Session, menu_ids: List[str]):
+        """
+        Recalcula, dentro de la transacción de `db`, los totales nutricionales
+        guardados de los menús indicados (una consulta agregada para todos).
+        """
+        menu_ids = list(dict.fromkeys(menu_ids))
+        if not menu_ids:
+            return
+        db.flush()
+        
+        porcion = func.coalesce(MenuComidaDB.porcion, 1.0)
+        filas = db.execute(
+            select(MenuComidaDB.menu_id, *[
+                func.sum(func.coalesce(getattr(ComidaDB, nutriente), 0) * porcion) for nutriente in NUTRIENTES
+            ])
+            .join(ComidaDB, ComidaDB.id == MenuComidaDB.comida_id)
+            .where(MenuComidaDB.menu_id.in_(menu_ids))
+            .group_by(MenuComidaDB.menu_id)
+        ).all()
+        totales = {fila[0]: fila[1:] for fila in filas}
+        sin_comidas = (0.0,) * len(NUTRIENTES)
+        ahora = datetime.now()
+        
+        db.execute(delete(MenuNutricionDB).where(MenuNutricionDB.menu_id.in_(menu_ids)))
+        db.execute(insert(MenuNutricionDB), [
+            {
+                "menu_id": menu_id,
+                **{nutriente: float(valor or 0) for nutriente, valor in zip(NUTRIENTES, totales.get(menu_id, sin_comidas))},
+                "fecha_calculo": ahora,
+            }
+            for menu_id in menu_ids
+        ])
+    
+    def _sincronizar_comidas(self, db: Session, menu_id: str, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Deja en el menú exactamente las comidas de `items` ({comida_id, porcion}), en ese
+        orden. Sin porción, se mantiene la que la comida ya tenía en el menú (o 1.0).
+        
+        Compara con las filas actuales y solo escribe la diferencia, con una sentencia
+        por tipo de cambio: DELETE de las que salen, UPDATE por lote (executemany por
+        clave primaria) de las que cambian de orden o porción e INSERT de las nuevas.
+        Guardar un borrador sin cambios no escribe nada. Los totales se recalculan solo
+        si cambió algo más que el orden.
+        
+        Retorna cuántas filas se insertaron, eliminaron y actualizaron.
+        """
+        actuales: Dict[str, Tuple[str, float, int]] = {}
+        eliminar: List[str] = []
+        for fila_id, comida_id, porcion, orden in db.execute(
+            select(MenuComidaDB.id, MenuComidaDB.comida_id, MenuComidaDB.porcion, MenuComidaDB.orden)
+            .where(MenuComidaDB.menu_id == menu_id)
+        ):
+            if comida_id in actuales:
+                eliminar.append(fila_id)  # repetida (datos previos al índice único)
+            else:
+                actuales[comida_id] = (fila_id, porcion, orden)
+        
+        insertar: List[Dict[str, Any]] = []
+        actualizar: List[Dict[str, Any]] = []
+        cambia_porcion = False
+        for orden, item in enumerate(items, start=1):
+            comida_id = item["comida_id"]
+            actual = actuales.pop(comida_id, None)
+            if actual is None:
+                insertar.append({
+                    "id": str(uuid.uuid4()),
+                    "menu_id": menu_id,
+                    "comida_id": comida_id,
+                    "porcion": item.get("porcion") or 1.0,
+                    "orden": orden,
+                })
+                continue
+            fila_id, porcion_actual, orden_actual = actual
+            porcion = item.get("porcion") or porcion_actual or 1.0
+            if porcion != porcion_actual or orden != orden_actual:
+                cambia_porcion = cambia_porcion or porcion != porcion_actual
+                actualizar.append({"id": fila_id, "porcion": porcion, "orden": orden})
+        eliminar.extend(fila_id for fila_id, _, _ in actuales.values())
+        
+        if eliminar:
+            db.execute(delete(MenuComidaDB).where(MenuComidaDB.id.in_(eliminar)))
+        if actualizar:
+            db.execute(update(MenuComidaDB), actualizar)
+        if insertar:
+            db.execute(insert(MenuComidaDB), insertar)
+        if eliminar or insertar or cambia_porcion:
+            self._recalcular_totales(db, [menu_id])
+        
+        cambios = {"insertadas": len(insertar), "eliminadas": len(eliminar), "actualizadas": len(actualizar)}
+        logger.debug("Comidas del menú %s sincronizadas: %s", menu_id, cambios)
+        return cambios
+    
+    def _menus_completos(self, db: Session, condicion) -> List[MenuCompleto]:
+        """
+        Menús que cumplen `condicion`, con sus comidas en orden y sus totales, en una
+        sola consulta: menús LEFT JOIN totales guardados LEFT JOIN menu_comidas/comidas
+        (una fila por comida). Un menú sin totales guardados los suma de sus comidas.
+        """
+        n = len(NUTRIENTES)
+        filas = db.execute(
+            select(
+                MenuDB,
+                *[getattr(MenuNutricionDB, nutriente) for nutriente in NUTRIENTES],
+                ComidaDB.id, ComidaDB.nombre, ComidaDB.categoria,
+                *[func.coalesce(getattr(ComidaDB, nutriente), 0) for nutriente in NUTRIENTES],
+                func.coalesce(MenuComidaDB.porcion, 1.0), MenuComidaDB.orden
+            )
+            .outerjoin(MenuNutricionDB, MenuNutricionDB.menu_id == MenuDB.id)
+            .outerjoin(MenuComidaDB, MenuComidaDB.menu_id == MenuDB.id)
+            .outerjoin(ComidaDB, ComidaDB.id == MenuComidaDB.comida_id)
+            .where(condicion)
+            .order_by(MenuDB.fecha, MenuDB.tipo, MenuDB.id, MenuComidaDB.orden, MenuComidaDB.id)
+        ).all()
+        
+        # menu_id -> (MenuDB, totales guardados o None, comidas)
+        agrupados: Dict[str, Tuple[MenuDB, Optional[Tuple], List[Dict[str, Any]]]] = {}
+        for fila in filas:
+            menu_db = fila[0]
+            if menu_db.id not in agrupados:
+                guardados = fila[1:1 + n]
+                agrupados[menu_db.id] = (menu_db, None if guardados[0] is None else guardados, [])
+            comida_id, nombre, categoria = fila[1 + n:4 + n]
+            if comida_id is None:
+                continue
+            valores = fila[4 + n:4 + 2 * n]
+            agrupados[menu_db.id][2].append({
+                "comida_id": comida_id,
+                "nombre": nombre,
+                "categoria": CATEGORIA_MAP_DB_TO_PYDANTIC.get(categoria.value, categoria.value.lower()),
+                **dict(zip(NUTRIENTES, valores)),
+                "porcion": fila[4 + 2 * n],
+                "orden": fila[5 + 2 * n] or 0,
+            })
+        
+        resultado = []
+        for menu_db, guardados, comidas in agrupados.values():
+            if guardados is None:
+                guardados = [sum(c[nutriente] * c["porcion"] for c in comidas) for nutriente in NUTRIENTES]
+            resultado.append(MenuCompleto(
+                id=menu_db.id,
+                escuela_id=menu_db.escuela_id,
+                fecha=menu_db.fecha,
+                tipo=TIPO_MENU_MAP_DB_TO_PYDANTIC.get(menu_db.tipo.value, menu_db.tipo.value.lower()),
+                nombre=menu_db.nombre,
+                descripcion=menu_db.descripcion,
+                activo=menu_db.activo,
+                creado_por=menu_db.creado_por,
+                fecha_creacion=menu_db.fecha_creacion,
+                comidas=comidas,
+                informacion_nutricional={n: round(float(v or 0), 2) for n, v in zip(NUTRIENTES, guardados)}
+            ))
+        return resultado
+    
     @property
     def usuarios(self) -> Dict[str, Usuario]:
         db = self._get_db()
         try:
             usuarios_db = db.query(UsuarioDB).all()
-            return {
-                u.id: Usuario(
-                    id=u.id,
-                    nombre=u.nombre,
-                    email=u.email,
-                    password_hash=u.password_hash,
-                    rol=ROLE_MAP_DB_TO_PYDANTIC.get(u.rol.value, u.rol.value.lower()),
-                    escuela_id=u.escuela_id,
-                    activo=u.activo,
-                    fecha_creacion=u.fecha_creacion.isoformat() if u.fecha_creacion else None,
-                    ultimo_acceso=u.ultimo_acceso.isoformat() if u.ultimo_acceso else None
-                )
-                for u in usuarios_db
-            }
+            return {u.id: self._to_usuario(u) for u in usuarios_db}
         finally:
-            db.close()
+            self._close(db)
+    
+    def list_usuarios(
+        self,
+        escuela_id: Optional[str] = None,
+        rol: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Usuario], Optional[str]]:
+        """Usuarios filtrados, ordenados por (nombre, id) y paginados por keyset"""
+        db = self._get_db()
+        try:
+            query = db.query(UsuarioDB)
+            
+            if escuela_id:
+                query = query.filter(UsuarioDB.escuela_id == escuela_id)
+            if rol:
+                query = query.filter(UsuarioDB.rol == ROLE_MAP_PYDANTIC_TO_DB.get(rol, RolUsuarioEnum.ESTUDIANTE))
+            
+            usuarios_db, siguiente = self._paginar(
+                query, [(UsuarioDB.nombre, False), (UsuarioDB.id, False)], limit, cursor
+            )
+            return [self._to_usuario(u) for u in usuarios_db], siguiente
+        finally:
+            self._close(db)
+    
+    def get_usuario(self, usuario_id: str) -> Optional[Usuario]:
+        return self._get_cacheado(self.cache_usuarios, UsuarioDB, self._to_usuario, [usuario_id]).get(usuario_id)
+    
+    def usuario_exists(self, usuario_id: str) -> bool:
+        return self.get_usuario(usuario_id) is not None
+    
+    def get_usuarios_by_ids(self, usuario_ids: List[str]) -> Dict[str, Usuario]:
+        if not usuario_ids:
+            return {}
+        return self._get_cacheado(self.cache_usuarios, UsuarioDB, self._to_usuario, usuario_ids)
+    
+    def get_usuario_by_email(self, email: str) -> Optional[Usuario]:
+        """Búsqueda por email (índice único), sin pasar por la caché: se usa en el login"""
+        db = self._get_db()
+        try:
+            usuario_db = db.query(UsuarioDB).filter(UsuarioDB.email == email).first()
+            return self._to_usuario(usuario_db) if usuario_db else None
+        finally:
+            self._close(db)
+    
+    def update_password_hash(self, usuario_id: str, password_hash: str):
+        """Reemplaza el hash almacenado (rehash de hashes heredados tras un login correcto)"""
+        db = self._get_db()
+        try:
+            db.query(UsuarioDB).filter(UsuarioDB.id == usuario_id).update(
+                {UsuarioDB.password_hash: password_hash}, synchronize_session=False
+            )
+            self._commit(db)
+            self._invalidar(db, self.cache_usuarios, usuario_id)
+        finally:
+            self._close(db)
     
     def create_usuario(self, usuario_data):
         db = self._get_db()
@@ -131,22 +683,14 @@ class Database:
                 ultimo_acceso=datetime.now()
             )
             db.add(usuario_db)
-            db.commit()
+            with self._unicidad(db):
+                self._commit(db)
+            self._invalidar(db, self.cache_usuarios, usuario_db.id)
             db.refresh(usuario_db)
             
-            return Usuario(
-                id=usuario_db.id,
-                nombre=usuario_db.nombre,
-                email=usuario_db.email,
-                password_hash=usuario_db.password_hash,
-                rol=ROLE_MAP_DB_TO_PYDANTIC.get(usuario_db.rol.value, usuario_db.rol.value.lower()),
-                escuela_id=usuario_db.escuela_id,
-                activo=usuario_db.activo,
-                fecha_creacion=usuario_db.fecha_creacion.isoformat(),
-                ultimo_acceso=usuario_db.ultimo_acceso.isoformat() if usuario_db.ultimo_acceso else None
-            )
+            return self._to_usuario(usuario_db)
         finally:
-            db.close()
+            self._close(db)
     
     def update_usuario(self, usuario_id, usuario_data):
         db = self._get_db()
@@ -168,47 +712,34 @@ class Database:
             if "activo" in usuario_data:
                 usuario_db.activo = usuario_data["activo"]
             
-            db.commit()
+            with self._unicidad(db):
+                self._commit(db)
+            self._invalidar(db, self.cache_usuarios, usuario_db.id)
             db.refresh(usuario_db)
             
-            return Usuario(
-                id=usuario_db.id,
-                nombre=usuario_db.nombre,
-                email=usuario_db.email,
-                password_hash=usuario_db.password_hash,
-                rol=ROLE_MAP_DB_TO_PYDANTIC.get(usuario_db.rol.value, usuario_db.rol.value.lower()),
-                escuela_id=usuario_db.escuela_id,
-                activo=usuario_db.activo,
-                fecha_creacion=usuario_db.fecha_creacion.isoformat(),
-                ultimo_acceso=usuario_db.ultimo_acceso.isoformat() if usuario_db.ultimo_acceso else None
-            )
+            return self._to_usuario(usuario_db)
         finally:
-            db.close()
+            self._close(db)
     
     @property
     def escuelas(self) -> Dict[str, Escuela]:
+        return self._todos_cacheado(self.cache_escuelas, EscuelaDB, self._to_escuela)
+    
+    def get_escuela(self, escuela_id: str) -> Optional[Escuela]:
+        return self._get_cacheado(self.cache_escuelas, EscuelaDB, self._to_escuela, [escuela_id]).get(escuela_id)
+    
+    def escuela_exists(self, escuela_id: str) -> bool:
+        return self.get_escuela(escuela_id) is not None
+    
+    def contar_usuarios_activos(self, escuela_id: str) -> int:
+        """COUNT de usuarios activos de la escuela (índice por escuela_id)"""
         db = self._get_db()
         try:
-            escuelas_db = db.query(EscuelaDB).all()
-            return {
-                e.id: Escuela(
-                    id=e.id,
-                    nombre=e.nombre,
-                    direccion=e.direccion,
-                    telefono=e.telefono,
-                    email=e.email,
-                    codigo_establecimiento=e.codigo_establecimiento,
-                    director=e.director,
-                    director_email=e.director_email,
-                    capacidad_estudiantes=e.capacidad_estudiantes,
-                    niveles_educativos=e.niveles_educativos or [],
-                    activa=e.activa,
-                    fecha_creacion=e.fecha_creacion.isoformat() if e.fecha_creacion else None
-                )
-                for e in escuelas_db
-            }
+            return db.query(func.count(UsuarioDB.id)).filter(
+                UsuarioDB.escuela_id == escuela_id, UsuarioDB.activo.is_(True)
+            ).scalar()
         finally:
-            db.close()
+            self._close(db)
     
     def create_escuela(self, escuela_data):
         db = self._get_db()
@@ -228,25 +759,14 @@ class Database:
                 fecha_creacion=datetime.now()
             )
             db.add(escuela_db)
-            db.commit()
+            with self._unicidad(db):
+                self._commit(db)
+            self._invalidar(db, self.cache_escuelas, escuela_db.id)
             db.refresh(escuela_db)
             
-            return Escuela(
-                id=escuela_db.id,
-                nombre=escuela_db.nombre,
-                direccion=escuela_db.direccion,
-                telefono=escuela_db.telefono,
-                email=escuela_db.email,
-                codigo_establecimiento=escuela_db.codigo_establecimiento,
-                director=escuela_db.director,
-                director_email=escuela_db.director_email,
-                capacidad_estudiantes=escuela_db.capacidad_estudiantes,
-                niveles_educativos=escuela_db.niveles_educativos or [],
-                activa=escuela_db.activa,
-                fecha_creacion=escuela_db.fecha_creacion.isoformat()
-            )
+            return self._to_escuela(escuela_db)
         finally:
-            db.close()
+            self._close(db)
     
     def update_escuela(self, escuela_id, escuela_data):
         db = self._get_db()
@@ -260,53 +780,81 @@ class Database:
                 if field in escuela_data:
                     setattr(escuela_db, field, escuela_data[field])
             
-            db.commit()
+            with self._unicidad(db):
+                self._commit(db)
+            self._invalidar(db, self.cache_escuelas, escuela_db.id)
             db.refresh(escuela_db)
             
-            return Escuela(
-                id=escuela_db.id,
-                nombre=escuela_db.nombre,
-                direccion=escuela_db.direccion,
-                telefono=escuela_db.telefono,
-                email=escuela_db.email,
-                codigo_establecimiento=escuela_db.codigo_establecimiento,
-                director=escuela_db.director,
-                director_email=escuela_db.director_email,
-                capacidad_estudiantes=escuela_db.capacidad_estudiantes,
-                niveles_educativos=escuela_db.niveles_educativos or [],
-                activa=escuela_db.activa,
-                fecha_creacion=escuela_db.fecha_creacion.isoformat()
-            )
+            return self._to_escuela(escuela_db)
         finally:
-            db.close()
+            self._close(db)
     
     @property
     def comidas(self) -> Dict[str, Comida]:
+        return self._todos_cacheado(self.cache_comidas, ComidaDB, self._to_comida)
+    
+    def list_comidas(
+        self,
+        categoria: Optional[str] = None,
+        max_calorias: Optional[int] = None,
+        min_proteinas: Optional[float] = None,
+        search: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Comida], Optional[str]]:
+        """Comidas filtradas, ordenadas por (nombre, id) y paginadas por keyset"""
         db = self._get_db()
         try:
-            comidas_db = db.query(ComidaDB).all()
-            return {
-                c.id: Comida(
-                    id=c.id,
-                    nombre=c.nombre,
-                    categoria=CATEGORIA_MAP_DB_TO_PYDANTIC.get(c.categoria.value, c.categoria.value.lower()),
-                    descripcion=c.descripcion,
-                    calorias=c.calorias,
-                    proteinas=c.proteinas,
-                    grasas=c.grasas,
-                    carbohidratos=c.carbohidratos,
-                    fibra=c.fibra,
-                    sodio=c.sodio,
-                    azucar=c.azucar,
-                    ingredientes=c.ingredientes or [],
-                    alergenos=c.alergenos or [],
-                    activa=c.activa,
-                    fecha_creacion=c.fecha_creacion.isoformat() if c.fecha_creacion else None
-                )
-                for c in comidas_db
-            }
+            query = db.query(ComidaDB)
+            
+            if categoria:
+                query = query.filter(ComidaDB.categoria == CATEGORIA_MAP_PYDANTIC_TO_DB.get(categoria, CategoriaComidaEnum.PROTEINA))
+            if max_calorias:
+                query = query.filter(ComidaDB.calorias <= max_calorias)
+            if min_proteinas:
+                query = query.filter(ComidaDB.proteinas >= min_proteinas)
+            if search:
+                query = query.filter(func.lower(ComidaDB.nombre).contains(search.lower(), autoescape=True))
+            
+            comidas_db, siguiente = self._paginar(
+                query, [(ComidaDB.nombre, False), (ComidaDB.id, False)], limit, cursor
+            )
+            return [self._to_comida(c) for c in comidas_db], siguiente
         finally:
-            db.close()
+            self._close(db)
+    
+    def get_comida(self, comida_id: str) -> Optional[Comida]:
+        return self._get_cacheado(self.cache_comidas, ComidaDB, self._to_comida, [comida_id]).get(comida_id)
+    
+    def comida_exists(self, comida_id: str) -> bool:
+        return self.get_comida(comida_id) is not None
+    
+    def get_comidas_by_ids(self, comida_ids: List[str]) -> Dict[str, Comida]:
+        if not comida_ids:
+            return {}
+        return self._get_cacheado(self.cache_comidas, ComidaDB, self._to_comida, comida_ids)
+    
+    def comida_en_menus_activos(self, comida_id: str) -> bool:
+        """EXISTS sobre menu_comidas (índice por comida_id) unido a los menús activos"""
+        db = self._get_db()
+        try:
+            return db.query(
+                select(MenuComidaDB.id).join(MenuDB, MenuDB.id == MenuComidaDB.menu_id).where(
+                    MenuComidaDB.comida_id == comida_id, MenuDB.activo.is_(True)
+                ).exists()
+            ).scalar()
+        finally:
+            self._close(db)
+    
+    def nutrientes_comidas(self, columnas: List[str]) -> List[Tuple]:
+        """(id, *columnas) de todas las comidas, activas o no; los nulos como 0"""
+        db = self._get_db()
+        try:
+            return db.query(
+                ComidaDB.id, *[func.coalesce(getattr(ComidaDB, columna), 0) for columna in columnas]
+            ).all()
+        finally:
+            self._close(db)
     
     def create_comida(self, comida_data):
         db = self._get_db()
@@ -335,28 +883,14 @@ class Database:
                 fecha_creacion=datetime.now()
             )
             db.add(comida_db)
-            db.commit()
+            with self._unicidad(db):
+                self._commit(db)
+            self._invalidar(db, self.cache_comidas, comida_db.id)
             db.refresh(comida_db)
             
-            return Comida(
-                id=comida_db.id,
-                nombre=comida_db.nombre,
-                categoria=CATEGORIA_MAP_DB_TO_PYDANTIC.get(comida_db.categoria.value, comida_db.categoria.value.lower()),
-                descripcion=comida_db.descripcion,
-                calorias=comida_db.calorias,
-                proteinas=comida_db.proteinas,
-                grasas=comida_db.grasas,
-                carbohidratos=comida_db.carbohidratos,
-                fibra=comida_db.fibra,
-                sodio=comida_db.sodio,
-                azucar=comida_db.azucar,
-                ingredientes=comida_db.ingredientes or [],
-                alergenos=comida_db.alergenos or [],
-                activa=comida_db.activa,
-                fecha_creacion=comida_db.fecha_creacion.isoformat()
-            )
+            return self._to_comida(comida_db)
         finally:
-            db.close()
+            self._close(db)
     
     def update_comida(self, comida_id, comida_data):
         db = self._get_db()
@@ -377,59 +911,174 @@ class Database:
                     CategoriaComidaEnum.PROTEINA
                 )
             
-            db.commit()
+            # El recálculo envía los cambios (flush): va dentro de _unicidad, como el commit
+            with self._unicidad(db):
+                # Solo se recalculan los menús que incluyen esta comida
+                if any(nutriente in comida_data for nutriente in NUTRIENTES):
+                    afectados = db.execute(
+                        select(MenuComidaDB.menu_id).where(MenuComidaDB.comida_id == comida_id).distinct()
+                    ).scalars().all()
+                    self._recalcular_totales(db, afectados)
+                self._commit(db)
+            self._invalidar(db, self.cache_comidas, comida_db.id)
             db.refresh(comida_db)
             
-            return Comida(
-                id=comida_db.id,
-                nombre=comida_db.nombre,
-                categoria=CATEGORIA_MAP_DB_TO_PYDANTIC.get(comida_db.categoria.value, comida_db.categoria.value.lower()),
-                descripcion=comida_db.descripcion,
-                calorias=comida_db.calorias,
-                proteinas=comida_db.proteinas,
-                grasas=comida_db.grasas,
-                carbohidratos=comida_db.carbohidratos,
-                fibra=comida_db.fibra,
-                sodio=comida_db.sodio,
-                azucar=comida_db.azucar,
-                ingredientes=comida_db.ingredientes or [],
-                alergenos=comida_db.alergenos or [],
-                activa=comida_db.activa,
-                fecha_creacion=comida_db.fecha_creacion.isoformat()
-            )
+            return self._to_comida(comida_db)
         finally:
-            db.close()
+            self._close(db)
     
     @property
     def menus(self) -> Dict[str, Menu]:
         db = self._get_db()
         try:
             menus_db = db.query(MenuDB).all()
-            result = {}
-            
-            for m in menus_db:
-                menu_comidas = db.query(MenuComidaDB).filter(
-                    MenuComidaDB.menu_id == m.id
-                ).order_by(MenuComidaDB.orden).all()
-                
-                comidas_ids = [mc.comida_id for mc in menu_comidas]
-                
-                result[m.id] = Menu(
-                    id=m.id,
-                    escuela_id=m.escuela_id,
-                    fecha=m.fecha.isoformat() if isinstance(m.fecha, date) else m.fecha,
-                    tipo=TIPO_MENU_MAP_DB_TO_PYDANTIC.get(m.tipo.value, m.tipo.value.lower()),
-                    nombre=m.nombre,
-                    descripcion=m.descripcion,
-                    comidas=comidas_ids,
-                    activo=m.activo,
-                    creado_por=m.creado_por,
-                    fecha_creacion=m.fecha_creacion.isoformat() if m.fecha_creacion else None
-                )
             
-            return result
+            # Todas las asociaciones menú-comida en una sola consulta
+            comidas_por_menu = self._comidas_ids_por_menu_todos(db)
+            
+            return {m.id: self._to_menu(m, comidas_por_menu.get(m.id, [])) for m in menus_db}
         finally:
-            db.close()
+            self._close(db)
+    
+    def get_menu(self, menu_id: str) -> Optional[Menu]:
+        db = self._get_db()
+        try:
+            menu_db = db.get(MenuDB, menu_id)
+            if not menu_db:
+                return None
+            comidas_ids = self._comidas_ids_por_menu(db, [menu_id])[menu_id]
+            return self._to_menu(menu_db, comidas_ids)
+        finally:
+            self._close(db)
+    
+    def get_menu_completo(self, menu_id: str) -> Optional[MenuCompleto]:
+        """Menú con sus comidas y totales nutricionales, en una sola consulta"""
+        db = self._get_db()
+        try:
+            menus = self._menus_completos(db, MenuDB.id == menu_id)
+            return menus[0] if menus else None
+        finally:
+            self._close(db)
+    
+    def get_menus_completos(
+        self,
+        escuela_id: str,
+        fecha_inicio: date,
+        fecha_fin: date,
+        activo: Optional[bool] = True
+    ) -> List[MenuCompleto]:
+        """Menús de una escuela en un rango de fechas, con comidas y totales, en una sola consulta"""
+        db = self._get_db()
+        try:
+            condicion = and_(
+                MenuDB.escuela_id == escuela_id,
+                MenuDB.fecha >= fecha_inicio,
+                MenuDB.fecha <= fecha_fin
+            )
+            if activo is not None:
+                condicion = and_(condicion, MenuDB.activo == activo)
+            return self._menus_completos(db, condicion)
+        finally:
+            self._close(db)
+    
+    def porciones_por_menu(self, menu_ids: List[str]) -> List[Tuple[str, str, float]]:
+        """(menu_id, comida_id, porción) de las comidas de varios menús en una sola consulta"""
+        if not menu_ids:
+            return []
+        db = self._get_db()
+        try:
+            # Core select: filas planas, sin la maquinaria del Query ORM (pueden ser miles)
+            return db.execute(
+                select(MenuComidaDB.menu_id, MenuComidaDB.comida_id, func.coalesce(MenuComidaDB.porcion, 1.0))
+                .where(MenuComidaDB.menu_id.in_(menu_ids))
+            ).all()
+        finally:
+            self._close(db)
+    
+    def totales_nutricionales(self, menu_ids: List[str]) -> Dict[str, Dict[str, float]]:
+        """Totales guardados por menú: menu_id -> {nutriente: total}; sin fila, no aparece"""
+        if not menu_ids:
+            return {}
+        db = self._get_db()
+        try:
+            filas = db.execute(
+                select(MenuNutricionDB.menu_id, *[getattr(MenuNutricionDB, nutriente) for nutriente in NUTRIENTES])
+                .where(MenuNutricionDB.menu_id.in_(menu_ids))
+            ).all()
+            return {fila[0]: {n: round(v, 2) for n, v in zip(NUTRIENTES, fila[1:])} for fila in filas}
+        finally:
+            self._close(db)
+    
+    def recalcular_totales_faltantes(self, lote: int = 1000) -> int:
+        """Calcula los totales de los menús que aún no los tienen guardados; retorna cuántos"""
+        db = self._get_db()
+        try:
+            faltantes = db.execute(
+                select(MenuDB.id)
+                .outerjoin(MenuNutricionDB, MenuNutricionDB.menu_id == MenuDB.id)
+                .where(MenuNutricionDB.menu_id.is_(None))
+            ).scalars().all()
+            for i in range(0, len(faltantes), lote):
+                self._recalcular_totales(db, faltantes[i:i + lote])
+            self._commit(db)
+            return len(faltantes)
+        finally:
+            self._close(db)
+    
+    def query_menus(
+        self,
+        escuela_id: Optional[str] = None,
+        fecha_inicio: Optional[date] = None,
+        fecha_fin: Optional[date] = None,
+        tipo: Optional[str] = None,
+        activo: Optional[bool] = None,
+        order_by: Optional[List[str]] = None
+    ) -> List[Menu]:
+        """
+        Menús filtrados y ordenados en la base de datos.
+        order_by acepta nombres de columna de MenuDB; prefijo "-" para orden descendente.
+        """
+        menus, _ = self.list_menus(escuela_id, fecha_inicio, fecha_fin, tipo, activo, order_by)
+        return menus
+    
+    def list_menus(
+        self,
+        escuela_id: Optional[str] = None,
+        fecha_inicio: Optional[date] = None,
+        fecha_fin: Optional[date] = None,
+        tipo: Optional[str] = None,
+        activo: Optional[bool] = None,
+        order_by: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Menu], Optional[str]]:
+        """Como query_menus, pero paginado por keyset (el id desempata el orden)"""
+        db = self._get_db()
+        try:
+            query = db.query(MenuDB)
+            
+            if escuela_id:
+                query = query.filter(MenuDB.escuela_id == escuela_id)
+            if fecha_inicio:
+                query = query.filter(MenuDB.fecha >= fecha_inicio)
+            if fecha_fin:
+                query = query.filter(MenuDB.fecha <= fecha_fin)
+            if tipo:
+                query = query.filter(MenuDB.tipo == TIPO_MENU_MAP_PYDANTIC_TO_DB.get(tipo, TipoMenuEnum.ALMUERZO))
+            if activo is not None:
+                query = query.filter(MenuDB.activo == activo)
+            
+            orden = [
+                (getattr(MenuDB, campo.lstrip("-")), campo.startswith("-"))
+                for campo in order_by or ["fecha", "tipo"]
+            ]
+            orden.append((MenuDB.id, False))
+            menus_db, siguiente = self._paginar(query, orden, limit, cursor)
+            
+            comidas_por_menu = self._comidas_ids_por_menu(db, [m.id for m in menus_db])
+            return [self._to_menu(m, comidas_por_menu[m.id]) for m in menus_db], siguiente
+        finally:
+            self._close(db)
     
     def create_menu(self, menu_data, creado_por):
         db = self._get_db()
@@ -452,7 +1101,8 @@ class Database:
                 fecha_creacion=datetime.now()
             )
             db.add(menu_db)
-            db.flush()
+            with self._unicidad(db):
+                db.flush()
             
             comidas_ids = menu_data.get("comidas", [])
             for orden, comida_id in enumerate(comidas_ids, start=1):
@@ -465,33 +1115,29 @@ class Database:
                 )
                 db.add(menu_comida)
             
-            db.commit()
+            with self._unicidad(db):
+                self._recalcular_totales(db, [menu_db.id])
+                self._commit(db)
             db.refresh(menu_db)
             
-            return Menu(
-                id=menu_db.id,
-                escuela_id=menu_db.escuela_id,
-                fecha=menu_db.fecha.isoformat() if isinstance(menu_db.fecha, date) else menu_db.fecha,
-                tipo=TIPO_MENU_MAP_DB_TO_PYDANTIC.get(menu_db.tipo.value, menu_db.tipo.value.lower()),
-                nombre=menu_db.nombre,
-                descripcion=menu_db.descripcion,
-                comidas=comidas_ids,
-                activo=menu_db.activo,
-                creado_por=menu_db.creado_por,
-                fecha_creacion=menu_db.fecha_creacion.isoformat()
-            )
+            return self._to_menu(menu_db, comidas_ids)
         except Exception as e:
-            db.rollback()
+            self._rollback(db)
             raise e
         finally:
-            db.close()
+            self._close(db)
     
-    def update_menu(self, menu_id, menu_data):
+    def update_menu(self, menu_id, menu_data) -> Tuple[Optional[Menu], Optional[Dict[str, int]]]:
+        """
+        Actualiza el menú. Retorna (menú, cambios): `cambios` son las filas de comidas
+        insertadas/eliminadas/actualizadas si se enviaron "comidas" (si no, None).
+        Sin el menú, (None, None).
+        """
         db = self._get_db()
         try:
             menu_db = db.query(MenuDB).filter(MenuDB.id == menu_id).first()
             if not menu_db:
-                return None
+                return None, None
             
             if "nombre" in menu_data:
                 menu_db.nombre = menu_data["nombre"]
@@ -507,63 +1153,165 @@ class Database:
             if "activo" in menu_data:
                 menu_db.activo = menu_data["activo"]
             
-            if "comidas" in menu_data:
-                db.query(MenuComidaDB).filter(MenuComidaDB.menu_id == menu_id).delete()
-                
-                for orden, comida_id in enumerate(menu_data["comidas"], start=1):
-                    menu_comida = MenuComidaDB(
-                        id=str(uuid.uuid4()),
-                        menu_id=menu_id,
-                        comida_id=comida_id,
-                        porcion=1.0,
-                        orden=orden
-                    )
-                    db.add(menu_comida)
-            
-            db.commit()
+            cambios = None
+            with self._unicidad(db):
+                if "comidas" in menu_data:
+                    cambios = self._sincronizar_comidas(db, menu_id, [{"comida_id": c} for c in menu_data["comidas"]])
+                self._commit(db)
             db.refresh(menu_db)
             
-            menu_comidas = db.query(MenuComidaDB).filter(
-                MenuComidaDB.menu_id == menu_id
-            ).order_by(MenuComidaDB.orden).all()
-            comidas_ids = [mc.comida_id for mc in menu_comidas]
+            comidas_ids = self._comidas_ids_por_menu(db, [menu_id])[menu_id]
             
-            return Menu(
-                id=menu_db.id,
-                escuela_id=menu_db.escuela_id,
-                fecha=menu_db.fecha.isoformat() if isinstance(menu_db.fecha, date) else menu_db.fecha,
-                tipo=TIPO_MENU_MAP_DB_TO_PYDANTIC.get(menu_db.tipo.value, menu_db.tipo.value.lower()),
-                nombre=menu_db.nombre,
-                descripcion=menu_db.descripcion,
-                comidas=comidas_ids,
-                activo=menu_db.activo,
-                creado_por=menu_db.creado_por,
-                fecha_creacion=menu_db.fecha_creacion.isoformat()
+            return self._to_menu(menu_db, comidas_ids), cambios
+        except Exception as e:
+            self._rollback(db)
+            raise e
+        finally:
+            self._close(db)
+    
+    def agregar_comidas_menu(self, menu_id: str, items: List[Dict[str, Any]]):
+        """
+        Agrega comidas ({comida_id, porcion, orden}) a un menú en una sola sentencia.
+        Sin orden, van al final en el orden de la lista. Una comida que ya está en el
+        menú lanza RegistroDuplicadoError (índice único menú-comida).
+        """
+        db = self._get_db()
+        try:
+            siguiente = (db.execute(
+                select(func.max(MenuComidaDB.orden)).where(MenuComidaDB.menu_id == menu_id)
+            ).scalar() or 0) + 1
+            filas = []
+            for item in items:
+                orden = item.get("orden")
+                if orden is None:
+                    orden, siguiente = siguiente, siguiente + 1
+                filas.append({
+                    "id": str(uuid.uuid4()),
+                    "menu_id": menu_id,
+                    "comida_id": item["comida_id"],
+                    "porcion": item.get("porcion") or 1.0,
+                    "orden": orden,
+                })
+            with self._unicidad(db):
+                if filas:
+                    db.execute(insert(MenuComidaDB), filas)
+                self._recalcular_totales(db, [menu_id])
+                self._commit(db)
+        except Exception as e:
+            self._rollback(db)
+            raise e
+        finally:
+            self._close(db)
+    
+    def reemplazar_comidas_menu(self, menu_id: str, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Deja en el menú exactamente las comidas indicadas, en ese orden, escribiendo
+        solo la diferencia (ver _sincronizar_comidas). Retorna las filas tocadas.
+        """
+        db = self._get_db()
+        try:
+            with self._unicidad(db):
+                cambios = self._sincronizar_comidas(db, menu_id, items)
+                self._commit(db)
+            return cambios
+        except Exception as e:
+            self._rollback(db)
+            raise e
+        finally:
+            self._close(db)
+    
+    def quitar_comida_menu(self, menu_id: str, comida_id: str) -> bool:
+        """Quita una comida de un menú; False si no estaba"""
+        db = self._get_db()
+        try:
+            resultado = db.execute(
+                delete(MenuComidaDB).where(MenuComidaDB.menu_id == menu_id, MenuComidaDB.comida_id == comida_id)
             )
+            if not resultado.rowcount:
+                return False
+            self._recalcular_totales(db, [menu_id])
+            self._commit(db)
+            return True
         except Exception as e:
-            db.rollback()
+            self._rollback(db)
             raise e
         finally:
-            db.close()
+            self._close(db)
     
     @property
     def feedback(self) -> Dict[str, Feedback]:
         db = self._get_db()
         try:
             feedbacks_db = db.query(FeedbackDB).all()
-            return {
-                f.id: Feedback(
-                    id=f.id,
-                    menu_id=f.menu_id,
-                    usuario_id=f.usuario_id,
-                    calificacion=f.calificacion,
-                    comentario=f.comentario,
-                    fecha=f.fecha.isoformat() if isinstance(f.fecha, date) else f.fecha
-                )
-                for f in feedbacks_db
-            }
+            return {f.id: self._to_feedback(f) for f in feedbacks_db}
         finally:
-            db.close()
+            self._close(db)
+    
+    def list_feedback(
+        self,
+        escuela_id: Optional[str] = None,
+        autor_id: Optional[str] = None,
+        menu_id: Optional[str] = None,
+        usuario_id: Optional[str] = None,
+        calificacion_min: Optional[int] = None,
+        fecha_inicio: Optional[date] = None,
+        fecha_fin: Optional[date] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[FeedbackResponse], Optional[str]]:
+        """
+        Feedback filtrado, del más reciente al más antiguo, paginado por keyset.
+        Una sola consulta feedback ⋈ menus ⋈ usuarios que ya trae los nombres para la respuesta.
+        escuela_id limita a menús de esa escuela y autor_id a feedback propio (alcance por rol).
+        """
+        db = self._get_db()
+        try:
+            query = db.query(
+                FeedbackDB, UsuarioDB.nombre, MenuDB.nombre, MenuDB.fecha, MenuDB.tipo
+            ).outerjoin(
+                MenuDB, MenuDB.id == FeedbackDB.menu_id
+            ).outerjoin(
+                UsuarioDB, UsuarioDB.id == FeedbackDB.usuario_id
+            )
+            
+            if escuela_id:
+                query = query.filter(MenuDB.escuela_id == escuela_id)
+            if autor_id:
+                query = query.filter(FeedbackDB.usuario_id == autor_id)
+            if menu_id:
+                query = query.filter(FeedbackDB.menu_id == menu_id)
+            if usuario_id:
+                query = query.filter(FeedbackDB.usuario_id == usuario_id)
+            if calificacion_min:
+                query = query.filter(FeedbackDB.calificacion >= calificacion_min)
+            if fecha_inicio:
+                query = query.filter(FeedbackDB.fecha >= fecha_inicio)
+            if fecha_fin:
+                query = query.filter(FeedbackDB.fecha <= fecha_fin)
+            
+            filas, siguiente = self._paginar(
+                query, [(FeedbackDB.fecha, True), (FeedbackDB.id, True)], limit, cursor,
+                entidad=lambda fila: fila[0]
+            )
+            return [self._to_feedback_response(*fila) for fila in filas], siguiente
+        finally:
+            self._close(db)
+    
+    def get_feedback(self, feedback_id: str) -> Optional[Feedback]:
+        db = self._get_db()
+        try:
+            feedback_db = db.get(FeedbackDB, feedback_id)
+            return self._to_feedback(feedback_db) if feedback_db else None
+        finally:
+            self._close(db)
+    
+    def get_feedback_by_menu(self, menu_id: str) -> List[Feedback]:
+        db = self._get_db()
+        try:
+            feedbacks_db = db.query(FeedbackDB).filter(FeedbackDB.menu_id == menu_id).all()
+            return [self._to_feedback(f) for f in feedbacks_db]
+        finally:
+            self._close(db)
     
     def create_feedback(self, feedback_data, usuario_id):
         db = self._get_db()
@@ -577,19 +1325,13 @@ class Database:
                 fecha=date.today()
             )
             db.add(feedback_db)
-            db.commit()
+            with self._unicidad(db):
+                self._commit(db)
             db.refresh(feedback_db)
             
-            return Feedback(
-                id=feedback_db.id,
-                menu_id=feedback_db.menu_id,
-                usuario_id=feedback_db.usuario_id,
-                calificacion=feedback_db.calificacion,
-                comentario=feedback_db.comentario,
-                fecha=feedback_db.fecha.isoformat() if isinstance(feedback_db.fecha, date) else feedback_db.fecha
-            )
+            return self._to_feedback(feedback_db)
         finally:
-            db.close()
+            self._close(db)
     
     def update_feedback(self, feedback_id, feedback_data):
         db = self._get_db()
@@ -603,19 +1345,134 @@ class Database:
             if "comentario" in feedback_data:
                 feedback_db.comentario = feedback_data["comentario"]
             
-            db.commit()
+            self._commit(db)
             db.refresh(feedback_db)
             
-            return Feedback(
-                id=feedback_db.id,
-                menu_id=feedback_db.menu_id,
-                usuario_id=feedback_db.usuario_id,
-                calificacion=feedback_db.calificacion,
-                comentario=feedback_db.comentario,
-                fecha=feedback_db.fecha.isoformat() if isinstance(feedback_db.fecha, date) else feedback_db.fecha
+            return self._to_feedback(feedback_db)
+        finally:
+            self._close(db)
+    
+    def delete_feedback(self, feedback_id):
+        db = self._get_db()
+        try:
+            eliminados = db.query(FeedbackDB).filter(FeedbackDB.id == feedback_id).delete()
+            self._commit(db)
+            return eliminados > 0
+        finally:
+            self._close(db)
+    
+    def actualizar_ultimos_accesos(self, accesos: Dict[str, datetime]) -> int:
+        """
+        UPDATE masivo de ultimo_acceso (una sentencia, executemany por id).
+        Nunca retrocede la fecha: otro proceso pudo haber escrito una más reciente.
+        """
+        if not accesos:
+            return 0
+        db = self._get_db()
+        try:
+            tabla = UsuarioDB.__table__
+            db.execute(
+                update(tabla)
+                .where(tabla.c.id == bindparam("b_id"))
+                .where(or_(tabla.c.ultimo_acceso.is_(None), tabla.c.ultimo_acceso < bindparam("b_acceso")))
+                .values(ultimo_acceso=bindparam("b_acceso")),
+                [{"b_id": usuario_id, "b_acceso": acceso} for usuario_id, acceso in accesos.items()]
             )
+            self._commit(db)
+            return len(accesos)
         finally:
-            db.close()
+            self._close(db)
+    
+    def revocar_token(self, jti: str, expira: datetime, fecha_revocacion: Optional[datetime] = None):
+        """Registra un token revocado; si ya existe se actualizan expiración y fecha (UTC)"""
+        db = self._get_db()
+        try:
+            fecha_revocacion = fecha_revocacion or datetime.utcnow()
+            registro = db.get(TokenRevocadoDB, jti)
+            if registro is None:
+                db.add(TokenRevocadoDB(jti=jti, expira=expira, fecha_revocacion=fecha_revocacion))
+            else:
+                registro.expira = max(registro.expira, expira)
+                registro.fecha_revocacion = max(registro.fecha_revocacion, fecha_revocacion)
+            self._commit(db)
+        finally:
+            self._close(db)
+    
+    def tokens_revocados_vigentes(self, ahora: datetime) -> Dict[str, Tuple[datetime, datetime]]:
+        """jti -> (expiración, fecha de revocación), en UTC, de las revocaciones que aún no vencen"""
+        db = self._get_db()
+        try:
+            return {
+                jti: (expira, fecha_revocacion)
+                for jti, expira, fecha_revocacion in db.query(
+                    TokenRevocadoDB.jti, TokenRevocadoDB.expira, TokenRevocadoDB.fecha_revocacion
+                ).filter(TokenRevocadoDB.expira > ahora)
+            }
+        finally:
+            self._close(db)
+    
+    def purgar_tokens_revocados(self, ahora: datetime) -> int:
+        """Elimina los registros de tokens ya vencidos; retorna cuántos"""
+        db = self._get_db()
+        try:
+            eliminados = db.query(TokenRevocadoDB).filter(TokenRevocadoDB.expira <= ahora).delete()
+            self._commit(db)
+            return eliminados
+        finally:
+            self._close(db)
+    
+    def contar_global(self) -> Dict[str, Any]:
+        """Conteos de todo el sistema con una consulta agregada por tabla"""
+        db = self._get_db()
+        try:
+            def por_estado(columna_estado):
+                # {True: n, False: m} para una columna booleana activo/activa
+                return dict(db.query(columna_estado, func.count()).group_by(columna_estado).all())
+            
+            escuelas = por_estado(EscuelaDB.activa)
+            menus = por_estado(MenuDB.activo)
+            comidas = por_estado(ComidaDB.activa)
+            
+            usuarios_por_rol = {rol: 0 for rol in ROLE_MAP_DB_TO_PYDANTIC.values()}
+            usuarios_activos = 0
+            for rol, activo, total in db.query(
+                UsuarioDB.rol, UsuarioDB.activo, func.count()
+            ).group_by(UsuarioDB.rol, UsuarioDB.activo).all():
+                usuarios_por_rol[ROLE_MAP_DB_TO_PYDANTIC.get(rol.value, rol.value.lower())] += total
+                if activo:
+                    usuarios_activos += total
+            
+            return {
+                "escuelas_total": sum(escuelas.values()),
+                "escuelas_activas": escuelas.get(True, 0),
+                "usuarios_por_rol": usuarios_por_rol,
+                "usuarios_activos": usuarios_activos,
+                "menus_total": sum(menus.values()),
+                "menus_activos": menus.get(True, 0),
+                "comidas_total": sum(comidas.values()),
+                "comidas_activas": comidas.get(True, 0),
+                "feedback_total": db.query(func.count(FeedbackDB.id)).scalar()
+            }
+        finally:
+            self._close(db)
+    
+    def contar_escuela(self, escuela_id: str) -> Dict[str, int]:
+        """Conteos de una escuela: usuarios, menús activos y feedback recibido"""
+        db = self._get_db()
+        try:
+            return {
+                "usuarios_total": db.query(func.count(UsuarioDB.id)).filter(
+                    UsuarioDB.escuela_id == escuela_id
+                ).scalar(),
+                "menus_activos": db.query(func.count(MenuDB.id)).filter(
+                    MenuDB.escuela_id == escuela_id, MenuDB.activo.is_(True)
+                ).scalar(),
+                "feedback_recibido": db.query(func.count(FeedbackDB.id)).join(
+                    MenuDB, MenuDB.id == FeedbackDB.menu_id
+                ).filter(MenuDB.escuela_id == escuela_id).scalar()
+            }
+        finally:
+            self._close(db)
 
 
 # Instancia global de la base de datos
@@ -2,11 +2,11 @@
 Script para inicializar la base de datos con datos de ejemplo
 """
 from datetime import datetime, date
-import hashlib
 import uuid
 from sqlalchemy.orm import Session
 
 from db_config import engine, init_db, SessionLocal
+from passwords import hash_password
 from models_db import (
     Base, EscuelaDB, UsuarioDB, ComidaDB, MenuDB, 
     MenuComidaDB, FeedbackDB,
@@ -14,8 +14,8 @@ from models_db import (
 )
 
 def _hash_password(password: str) -> str:
-    """Hashear contraseña usando SHA256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hashear contraseña con bcrypt"""
+    return hash_password(password)
 
 def create_sample_data(db: Session):
     """Crear datos de ejemplo en la base de datos"""
@@ -1,23 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import sys
 import os
 
 # Agregar el directorio actual al path para importar módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from api import Usuario, Escuela, Menu, Comida, Autenticacion, Feedback
+from api import Usuario, Escuela, Menu, Comida, MenuComida, Autenticacion, Feedback
 from database import db
+from stats import stats_service
+from db_config import RutaConSesion, configure_db_threadpool, init_db, ConsultasSQLMiddleware, consultas_lentas
 from models import RolUsuario
-from auth import get_current_user
+from auth import get_current_user, get_admin_user
+from revocacion import revocation_list, REVOCACION_SYNC_SEGUNDOS
+from ultimo_acceso import ultimo_acceso_buffer, ULTIMO_ACCESO_FLUSH_SEGUNDOS
+from metricas import MetricasMiddleware, registro_metricas
+from perfilador import PerfilMiddleware, obtener_perfil, listar_perfiles
+
+async def _tarea_periodica(intervalo: float, funcion):
+    """Ejecuta `funcion` (bloqueante) en el pool de hilos cada `intervalo` segundos"""
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await run_in_threadpool(funcion)
+        except Exception as e:
+            print(f"⚠️  Error en tarea periódica {funcion.__name__}: {e}")
 
 # Inicializar la base de datos al startup
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Inicializar la base de datos
+    configure_db_threadpool()
+    consultas_lentas.abrir_archivo()
+    init_db()
     db.initialize_sample_data()
+    # Totales nutricionales de los menús creados antes de guardarlos (o fuera de Database)
+    db.recalcular_totales_faltantes()
+    revocation_list.sincronizar()
+    tareas = [
+        asyncio.create_task(_tarea_periodica(REVOCACION_SYNC_SEGUNDOS, revocation_list.sincronizar)),
+        asyncio.create_task(_tarea_periodica(ULTIMO_ACCESO_FLUSH_SEGUNDOS, ultimo_acceso_buffer.flush)),
+    ]
     print("✅ Base de datos inicializada con datos de ejemplo")
     print("\n🔐 Credenciales de acceso:")
     print("Admin: admin@sistema.cl / admin123")
@@ -27,6 +54,13 @@ async def lifespan(app: FastAPI):
     print("Estudiante: ana.martinez@email.com / estudiante123")
     yield
     # Shutdown
+    for tarea in tareas:
+        tarea.cancel()
+    # Último volcado de los accesos acumulados
+    try:
+        ultimo_acceso_buffer.flush()
+    except Exception as e:
+        print(f"⚠️  No se pudieron guardar los últimos accesos: {e}")
     print("🔄 Cerrando aplicación...")
 
 app = FastAPI(
@@ -66,6 +100,10 @@ app = FastAPI(
     }
 )
 
+# Una sesión (unidad de trabajo) por petición, confirmada antes de enviar la respuesta.
+# Los routers de api/ declaran la misma clase de ruta
+app.router.route_class = RutaConSesion
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -79,27 +117,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    # Cursor de la página siguiente en los listados; sentencias SQL de la petición (fuera de producción);
+    # filas de comidas tocadas al editar un menú
+    expose_headers=["X-Next-Cursor", "X-DB-Queries", "X-DB-Time-ms", "X-Profile-Id", "X-Comidas-Cambios"],
 )
 
+# Perfilado por muestreo de peticiones marcadas por un admin (X-Profile: 1 o ?profile=1)
+app.add_middleware(PerfilMiddleware)
+
+# Conteo de sentencias SQL por petición y aviso de N+1
+app.add_middleware(ConsultasSQLMiddleware)
+
+# Métricas por endpoint (el último middleware agregado es el más externo: mide todo)
+app.add_middleware(MetricasMiddleware, registro=registro_metricas)
+
 # Incluir todos los routers
 app.include_router(Autenticacion.router, prefix="/api/auth", tags=["🔐 Autenticación"])
 app.include_router(Usuario.router, prefix="/api", tags=["👥 Usuarios"])
 app.include_router(Escuela.router, prefix="/api", tags=["🏫 Escuelas"])
 app.include_router(Menu.router, prefix="/api", tags=["📋 Menús"])
 app.include_router(Comida.router, prefix="/api", tags=["🍽️ Comidas"])
+app.include_router(MenuComida.router, prefix="/api", tags=["🥗 Menú-Comidas"])
 app.include_router(Feedback.router, prefix="/api", tags=["💬 Feedback"])
 
 @app.get("/", tags=["📊 Sistema"])
-async def root():
+def root():
     """
     Endpoint principal del sistema con información general y estadísticas básicas
     """
-    # Estadísticas básicas
-    total_escuelas = len([e for e in db.escuelas.values() if e.activa])
-    total_usuarios = len([u for u in db.usuarios.values() if u.activo])
-    total_menus = len([m for m in db.menus.values() if m.activo])
-    total_comidas = len([c for c in db.comidas.values() if c.activa])
-    total_feedback = len(db.feedback)
+    # Estadísticas básicas (consultas agregadas, cacheadas unos segundos)
+    conteos = stats_service.globales()
     
     return {
         "sistema": "Sistema de Nutrición Escolar",
@@ -107,11 +154,11 @@ async def root():
         "estado": "Operativo",
         "descripcion": "API completa para gestión de nutrición escolar con autenticación JWT y control de roles",
         "estadisticas": {
-            "escuelas_activas": total_escuelas,
-            "usuarios_activos": total_usuarios,
-            "menus_activos": total_menus,
-            "comidas_disponibles": total_comidas,
-            "feedback_total": total_feedback
+            "escuelas_activas": conteos["escuelas_activas"],
+            "usuarios_activos": conteos["usuarios_activos"],
+            "menus_activos": conteos["menus_activos"],
+            "comidas_disponibles": conteos["comidas_activas"],
+            "feedback_total": conteos["feedback_total"]
         },
         "endpoints_principales": {
             "autenticacion": "/api/auth/login",
@@ -152,8 +199,13 @@ async def health_check():
         }
     }
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas HTTP en formato de texto de Prometheus"""
+    return PlainTextResponse(registro_metricas.exportar(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/stats", tags=["📊 Sistema"])
-async def get_system_stats(current_user: dict = Depends(get_current_user)):
+def get_system_stats(current_user: dict = Depends(get_current_user)):
     """
     Estadísticas del sistema (requiere autenticación)
     Información detallada según el rol del usuario
@@ -168,37 +220,59 @@ async def get_system_stats(current_user: dict = Depends(get_current_user)):
     
     if current_user.rol == RolUsuario.ADMIN:
         # Stats completas para admin
+        conteos = stats_service.globales()
         stats.update({
             "sistema_completo": {
-                "escuelas": len(db.escuelas),
-                "usuarios_por_rol": {
-                    "admin": len([u for u in db.usuarios.values() if u.rol == RolUsuario.ADMIN]),
-                    "rector": len([u for u in db.usuarios.values() if u.rol == RolUsuario.RECTOR]),
-                    "nutricionista": len([u for u in db.usuarios.values() if u.rol == RolUsuario.NUTRICIONISTA]),
-                    "padre": len([u for u in db.usuarios.values() if u.rol == RolUsuario.PADRE]),
-                    "estudiante": len([u for u in db.usuarios.values() if u.rol == RolUsuario.ESTUDIANTE])
-                },
-                "menus_totales": len(db.menus),
-                "comidas_totales": len(db.comidas),
-                "feedback_total": len(db.feedback)
-            }
+                "escuelas": conteos["escuelas_total"],
+                "usuarios_por_rol": conteos["usuarios_por_rol"],
+                "menus_totales": conteos["menus_total"],
+                "comidas_totales": conteos["comidas_total"],
+                "feedback_total": conteos["feedback_total"]
+            },
+            "cache": db.cache_stats(),
+            "ultimo_acceso": ultimo_acceso_buffer.metricas()
         })
     elif current_user.rol == RolUsuario.RECTOR:
         # Stats de su escuela
-        usuarios_escuela = [u for u in db.usuarios.values() if u.escuela_id == current_user.escuela_id]
-        menus_escuela = [m for m in db.menus.values() if m.escuela_id == current_user.escuela_id]
-        
         stats.update({
-            "mi_escuela": {
-                "usuarios_total": len(usuarios_escuela),
-                "menus_activos": len([m for m in menus_escuela if m.activo]),
-                "feedback_recibido": len([f for f in db.feedback.values() 
-                                       if f.menu_id in [m.id for m in menus_escuela]])
-            }
+            "mi_escuela": stats_service.de_escuela(current_user.escuela_id)
         })
     
     return stats
 
+@app.get("/api/stats/consultas-lentas", tags=["📊 Sistema"])
+def get_consultas_lentas(
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_admin_user)
+):
+    """
+    Últimas sentencias SQL que superaron el umbral (SQL_LENTA_MS), con parámetros,
+    ruta que las originó y plan de ejecución (solo admin)
+    """
+    return {
+        **consultas_lentas.metricas(),
+        "consultas": consultas_lentas.recientes(limit)
+    }
+
+@app.get("/api/stats/perfiles", tags=["📊 Sistema"])
+def get_perfiles(current_user: dict = Depends(get_admin_user)):
+    """Perfiles de peticiones guardados (solo admin); se piden con X-Profile: 1 o ?profile=1"""
+    return listar_perfiles()
+
+@app.get("/api/stats/perfiles/{perfil_id}", tags=["📊 Sistema"])
+def get_perfil(perfil_id: str, current_user: dict = Depends(get_admin_user)):
+    """
+    Perfil de una petición en formato de pilas colapsadas, para flamegraph.pl o
+    speedscope (solo admin)
+    """
+    pilas = obtener_perfil(perfil_id)
+    if pilas is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Perfil no encontrado"
+        )
+    return PlainTextResponse(pilas, headers={"Content-Disposition": f'attachment; filename="perfil-{perfil_id}.folded"'})
+
 # Manejo de errores globales
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
@@ -0,0 +1,226 @@
+"""
+Métricas HTTP por endpoint (plantilla de ruta y método), expuestas en formato de
+texto de Prometheus en /metrics.
+
+`MetricasMiddleware` es un middleware ASGI puro: no envuelve la respuesta ni lee
+el cuerpo, solo observa los mensajes que pasan. Registra en un `RegistroMetricas`
+intercambiable; el registro en memoria (`RegistroEnMemoria`) no depende de ningún
+servicio externo, así que las pruebas pueden consultar sus valores directamente.
+"""
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+
+# Límites superiores (segundos / bytes) de los buckets de los histogramas
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_TAMANO = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Etiqueta de las peticiones que no corresponden a ninguna ruta (evita una serie por URL)
+SIN_RUTA = "sin_ruta"
+
+
+class Histograma:
+    """Histograma acumulativo con buckets fijos, al estilo Prometheus"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.conteos = [0] * (len(self.buckets) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.conteos[bisect.bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def cuantil(self, q: float) -> Optional[float]:
+        """Estimación por interpolación lineal dentro del bucket, como histogram_quantile"""
+        if not self.total:
+            return None
+        objetivo = q * self.total
+        acumulado = 0
+        for i, conteo in enumerate(self.conteos):
+            if acumulado + conteo >= objetivo and conteo:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                inferior = self.buckets[i - 1] if i else 0.0
+                return inferior + (self.buckets[i] - inferior) * (objetivo - acumulado) / conteo
+            acumulado += conteo
+        return self.buckets[-1]
+
+
+class RegistroMetricas(ABC):
+    """Interfaz del registro que alimenta el middleware"""
+
+    @abstractmethod
+    def inicio(self, metodo: str, ruta: str):
+        ...
+
+    @abstractmethod
+    def fin(self, metodo: str, ruta: str, estado: int, duracion: float, tamano: int):
+        ...
+
+    @abstractmethod
+    def exportar(self) -> str:
+        """Texto en formato de exposición de Prometheus"""
+
+
+class RegistroEnMemoria(RegistroMetricas):
+    """Registro en el proceso; los valores se consultan con `resumen()` o `exportar()`"""
+
+    def __init__(self, buckets_latencia: Sequence[float] = BUCKETS_LATENCIA,
+                 buckets_tamano: Sequence[float] = BUCKETS_TAMANO):
+        self.buckets_latencia = buckets_latencia
+        self.buckets_tamano = buckets_tamano
+        self._lock = threading.Lock()
+        self._peticiones: Dict[Tuple[str, str, int], int] = {}
+        self._en_curso: Dict[Tuple[str, str], int] = {}
+        self._latencias: Dict[Tuple[str, str], Histograma] = {}
+        self._tamanos: Dict[Tuple[str, str], Histograma] = {}
+
+    def inicio(self, metodo: str, ruta: str):
+        with self._lock:
+            clave = (metodo, ruta)
+            self._en_curso[clave] = self._en_curso.get(clave, 0) + 1
+
+    def fin(self, metodo: str, ruta: str, estado: int, duracion: float, tamano: int):
+        clave = (metodo, ruta)
+        with self._lock:
+            self._en_curso[clave] -= 1
+            self._peticiones[(metodo, ruta, estado)] = self._peticiones.get((metodo, ruta, estado), 0) + 1
+            if clave not in self._latencias:
+                self._latencias[clave] = Histograma(self.buckets_latencia)
+                self._tamanos[clave] = Histograma(self.buckets_tamano)
+            self._latencias[clave].observar(duracion)
+            self._tamanos[clave].observar(tamano)
+
+    def reset(self):
+        with self._lock:
+            self._peticiones.clear()
+            self._en_curso.clear()
+            self._latencias.clear()
+            self._tamanos.clear()
+
+    def resumen(self) -> Dict[str, Dict[str, Any]]:
+        """Por "MÉTODO ruta": peticiones por estado, en curso, p50/p95/p99 (s) y bytes"""
+        with self._lock:
+            resultado: Dict[str, Dict[str, Any]] = {}
+            for (metodo, ruta), en_curso in self._en_curso.items():
+                latencias = self._latencias.get((metodo, ruta))
+                tamanos = self._tamanos.get((metodo, ruta))
+                resultado[f"{metodo} {ruta}"] = {
+                    "peticiones": {
+                        estado: n for (m, r, estado), n in self._peticiones.items() if (m, r) == (metodo, ruta)
+                    },
+                    "en_curso": en_curso,
+                    "p50": latencias.cuantil(0.5) if latencias else None,
+                    "p95": latencias.cuantil(0.95) if latencias else None,
+                    "p99": latencias.cuantil(0.99) if latencias else None,
+                    "bytes_total": int(tamanos.suma) if tamanos else 0,
+                }
+            return resultado
+
+    def exportar(self) -> str:
+        lineas: List[str] = []
+        with self._lock:
+            lineas += [
+                "# HELP http_requests_total Peticiones HTTP atendidas",
+                "# TYPE http_requests_total counter",
+            ]
+            for (metodo, ruta, estado), n in sorted(self._peticiones.items()):
+                lineas.append(f'http_requests_total{{{_etiquetas(metodo, ruta)},status="{estado}"}} {n}')
+            lineas += [
+                "# HELP http_requests_in_flight Peticiones HTTP en curso",
+                "# TYPE http_requests_in_flight gauge",
+            ]
+            for (metodo, ruta), n in sorted(self._en_curso.items()):
+                lineas.append(f"http_requests_in_flight{{{_etiquetas(metodo, ruta)}}} {n}")
+            _exportar_histogramas(lineas, "http_request_duration_seconds",
+                                  "Latencia de las peticiones HTTP", self._latencias)
+            _exportar_histogramas(lineas, "http_response_size_bytes",
+                                  "Tamaño del cuerpo de las respuestas HTTP", self._tamanos)
+        return "\n".join(lineas) + "\n"
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(metodo: str, ruta: str) -> str:
+    return f'method="{_escapar(metodo)}",route="{_escapar(ruta)}"'
+
+
+def _exportar_histogramas(lineas: List[str], nombre: str, ayuda: str,
+                          histogramas: Dict[Tuple[str, str], Histograma]):
+    lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+    for (metodo, ruta), histograma in sorted(histogramas.items()):
+        etiquetas = _etiquetas(metodo, ruta)
+        acumulado = 0
+        for limite, conteo in zip(histograma.buckets, histograma.conteos):
+            acumulado += conteo
+            lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite:g}"}} {acumulado}')
+        lineas.append(f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {histograma.total}')
+        lineas.append(f"{nombre}_sum{{{etiquetas}}} {histograma.suma:g}")
+        lineas.append(f"{nombre}_count{{{etiquetas}}} {histograma.total}")
+
+
+def resolver_ruta(scope: Dict[str, Any]):
+    """
+    Ruta que atenderá la petición, resuelta igual que el router: primera ruta con
+    coincidencia completa, o la primera parcial (método no permitido). None si no hay.
+    """
+    app = scope.get("app")
+    parcial = None
+    for ruta in getattr(getattr(app, "router", None), "routes", ()):
+        coincidencia, _ = ruta.matches(scope)
+        if coincidencia == Match.FULL:
+            return ruta
+        if coincidencia == Match.PARTIAL and parcial is None:
+            parcial = ruta
+    return parcial
+
+
+def plantilla_ruta(scope: Dict[str, Any]) -> str:
+    """Plantilla de la ruta que atenderá la petición (p. ej. /api/menus/{menu_id})"""
+    return getattr(resolver_ruta(scope), "path", SIN_RUTA)
+
+
+class MetricasMiddleware:
+    """Middleware ASGI: cuenta, mide y registra cada petición HTTP"""
+
+    def __init__(self, app, registro: Optional[RegistroMetricas] = None):
+        self.app = app
+        self.registro = registro or registro_metricas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        ruta = plantilla_ruta(scope)
+        estado = 500  # si la app falla antes de responder
+        tamano = 0
+
+        async def send_medido(mensaje):
+            nonlocal estado, tamano
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            elif mensaje["type"] == "http.response.body":
+                tamano += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        self.registro.inicio(metodo, ruta)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_medido)
+        finally:
+            self.registro.fin(metodo, ruta, estado, time.perf_counter() - inicio, tamano)
+
+
+# Registro global usado por la aplicación y por /metrics
+registro_metricas = RegistroEnMemoria()
@@ -31,11 +31,13 @@ class TipoComida(str, Enum):
 
 class CategoriaComida(str, Enum):
     PROTEINA = "proteina"
+    CARBOHIDRATO = "carbohidrato"
     VEGETAL = "vegetal"
     FRUTA = "fruta"
     CEREAL = "cereal"
     LACTEO = "lacteo"
     BEBIDA = "bebida"
+    POSTRE = "postre"
 
 class TipoFeedback(str, Enum):
     SABOR = "sabor"
@@ -70,6 +72,13 @@ class Usuario(UsuarioBase):
     ultimo_acceso: Optional[datetime] = None
     creado_por: Optional[str] = None
 
+class Principal(BaseModel):
+    """Identidad del usuario tomada de los claims del token, sin consultar la base de datos"""
+    id: str
+    email: Optional[str] = None
+    rol: RolUsuario
+    escuela_id: Optional[str] = None
+
 class UsuarioLogin(BaseModel):
     email: EmailStr
     password: str
@@ -187,7 +196,7 @@ class MenuBase(BaseModel):
     descripcion: Optional[str] = None
 
 class MenuCreate(MenuBase):
-    pass
+    comidas: List[str] = []  # IDs de comidas, en orden
 
 class MenuUpdate(BaseModel):
     nombre: Optional[str] = None
@@ -195,9 +204,11 @@ class MenuUpdate(BaseModel):
     fecha: Optional[date] = None
     tipo: Optional[TipoMenu] = None
     activo: Optional[bool] = None
+    comidas: Optional[List[str]] = None  # Reemplaza las comidas del menú
 
 class Menu(MenuBase):
     id: str
+    comidas: List[str] = []
     activo: bool = True
     creado_por: str
     fecha_creacion: datetime
@@ -312,6 +323,48 @@ class MenuResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class InformacionNutricional(BaseModel):
+    """Totales de un menú, ponderados por la porción de cada comida"""
+    calorias: float
+    proteinas: float
+    grasas: float
+    carbohidratos: float
+    fibra: float
+    sodio: float
+    azucar: float
+
+class MenuInformacionNutricional(BaseModel):
+    menu_id: str
+    escuela_id: str
+    fecha: date
+    tipo: TipoMenu
+    nombre: str
+    informacion_nutricional: InformacionNutricional
+
+class MenuComidaItem(BaseModel):
+    """Comida en una edición por lote de un menú; el orden es el de la lista"""
+    comida_id: str
+    porcion: Optional[float] = None  # None: se mantiene la actual (1.0 si la comida es nueva)
+
+class MenuComidaDetalle(BaseModel):
+    comida_id: str
+    nombre: str
+    categoria: CategoriaComida
+    calorias: int
+    proteinas: float
+    grasas: float
+    carbohidratos: float
+    fibra: float
+    sodio: float
+    azucar: float
+    porcion: float
+    orden: int
+
+class MenuCompleto(MenuResponse):
+    """Menú con sus comidas en orden y sus totales nutricionales"""
+    comidas: List[MenuComidaDetalle] = []
+    informacion_nutricional: InformacionNutricional
+
 class ComidaResponse(BaseModel):
     id: str
     nombre: str
@@ -335,6 +388,10 @@ class FeedbackResponse(BaseModel):
     calificacion: int
     comentario: Optional[str] = None
     fecha: date
+    usuario_nombre: Optional[str] = None
+    menu_nombre: Optional[str] = None
+    menu_fecha: Optional[date] = None
+    menu_tipo: Optional[TipoMenu] = None
 
     class Config:
         from_attributes = True
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, Date, ForeignKey, Enum, Text, JSON
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, Date, ForeignKey, Enum, Text, JSON, Index, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, date
@@ -49,6 +49,11 @@ class EscuelaDB(Base):
     # Relaciones
     usuarios = relationship("UsuarioDB", back_populates="escuela", cascade="all, delete-orphan")
     menus = relationship("MenuDB", back_populates="escuela", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Nombre único sin distinguir mayúsculas
+        Index("uq_escuelas_nombre", func.lower(nombre), unique=True),
+    )
 
 # Modelo de Usuario
 class UsuarioDB(Base):
@@ -68,6 +73,11 @@ class UsuarioDB(Base):
     escuela = relationship("EscuelaDB", back_populates="usuarios")
     menus_creados = relationship("MenuDB", foreign_keys="MenuDB.creado_por", back_populates="creador")
     feedback = relationship("FeedbackDB", back_populates="usuario", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Orden estable para la paginación por keyset del listado de usuarios
+        Index("ix_usuarios_nombre_id", "nombre", "id"),
+    )
 
 # Modelo de Comida
 class ComidaDB(Base):
@@ -91,6 +101,13 @@ class ComidaDB(Base):
     
     # Relaciones
     menu_comidas = relationship("MenuComidaDB", back_populates="comida", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Orden estable para la paginación por keyset del catálogo
+        Index("ix_comidas_nombre_id", "nombre", "id"),
+        # Nombre único sin distinguir mayúsculas
+        Index("uq_comidas_nombre", func.lower(nombre), unique=True),
+    )
 
 # Modelo de Menú
 class MenuDB(Base):
@@ -111,6 +128,19 @@ class MenuDB(Base):
     creador = relationship("UsuarioDB", foreign_keys=[creado_por], back_populates="menus_creados")
     menu_comidas = relationship("MenuComidaDB", back_populates="menu", cascade="all, delete-orphan")
     feedback = relationship("FeedbackDB", back_populates="menu", cascade="all, delete-orphan")
+    nutricion = relationship("MenuNutricionDB", back_populates="menu", uselist=False, cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Respaldo de los listados por escuela y rango de fechas (vista semanal)
+        Index("ix_menus_escuela_fecha_tipo", "escuela_id", "fecha", "tipo"),
+        # Un solo menú activo por escuela, fecha y tipo (los desactivados no cuentan)
+        Index(
+            "uq_menus_activo_escuela_fecha_tipo", "escuela_id", "fecha", "tipo",
+            unique=True,
+            sqlite_where=activo.is_(True),
+            postgresql_where=activo.is_(True),
+        ),
+    )
 
 # Modelo de MenuComida (tabla intermedia)
 class MenuComidaDB(Base):
@@ -125,6 +155,29 @@ class MenuComidaDB(Base):
     # Relaciones
     menu = relationship("MenuDB", back_populates="menu_comidas")
     comida = relationship("ComidaDB", back_populates="menu_comidas")
+    
+    __table_args__ = (
+        # Cada comida una vez por menú; también resuelve altas y bajas por (menú, comida)
+        Index("uq_menu_comidas_menu_comida", "menu_id", "comida_id", unique=True),
+    )
+
+# Totales nutricionales de cada menú (ponderados por porción); los mantiene Database
+# en la misma transacción que cambia las comidas del menú o sus valores nutricionales
+class MenuNutricionDB(Base):
+    __tablename__ = "menu_nutricion"
+    
+    menu_id = Column(String, ForeignKey("menus.id", ondelete="CASCADE"), primary_key=True)
+    calorias = Column(Float, nullable=False, default=0.0)
+    proteinas = Column(Float, nullable=False, default=0.0)
+    grasas = Column(Float, nullable=False, default=0.0)
+    carbohidratos = Column(Float, nullable=False, default=0.0)
+    fibra = Column(Float, nullable=False, default=0.0)
+    sodio = Column(Float, nullable=False, default=0.0)
+    azucar = Column(Float, nullable=False, default=0.0)
+    fecha_calculo = Column(DateTime, default=datetime.now)
+    
+    # Relaciones
+    menu = relationship("MenuDB", back_populates="nutricion")
 
 # Modelo de Feedback
 class FeedbackDB(Base):
@@ -140,3 +193,18 @@ class FeedbackDB(Base):
     # Relaciones
     menu = relationship("MenuDB", back_populates="feedback")
     usuario = relationship("UsuarioDB", back_populates="feedback")
+    
+    __table_args__ = (
+        # Orden estable (más reciente primero) para la paginación por keyset
+        Index("ix_feedback_fecha_id", "fecha", "id"),
+        # Un feedback por usuario y menú
+        Index("uq_feedback_menu_usuario", "menu_id", "usuario_id", unique=True),
+    )
+
+# Modelo de Token revocado (logout); se conserva hasta que el token vence
+class TokenRevocadoDB(Base):
+    __tablename__ = "tokens_revocados"
+    
+    jti = Column(String, primary_key=True)  # o "usuario:<id>" para todos los tokens de un usuario
+    expira = Column(DateTime, nullable=False, index=True)  # UTC, igual que el claim exp
+    fecha_revocacion = Column(DateTime, default=datetime.utcnow)  # UTC; corte por iat en revocaciones de usuario
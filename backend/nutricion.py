@@ -0,0 +1,95 @@
+"""
+Cálculo vectorizado de la información nutricional de los menús.
+
+Los nutrientes de todas las comidas se mantienen en una matriz NumPy (una fila por
+comida, una columna por nutriente). Los totales de un conjunto de menús son el
+producto de la matriz dispersa menú × comida (peso = porción) por esa matriz,
+acumulado con `np.add.at` sobre las filas (menu, comida, porción) de menu_comidas:
+una consulta y una operación vectorial, sin importar cuántos menús sean.
+
+La matriz se recarga cuando cambia alguna comida en este proceso (versión de la caché
+de comidas) o cuando vence su TTL, como las cachés de catálogo, para recoger los
+cambios hechos por otros procesos.
+"""
+import threading
+import time
+from itertools import repeat
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# NUTRIENTES: columnas de ComidaDB que se suman, en el orden de las columnas de la matriz
+from database import db, NUTRIENTES, CACHE_CATALOGO_TTL
+
+
+class MotorNutricional:
+    def __init__(self, database=db, nutrientes: Sequence[str] = NUTRIENTES,
+                 ttl: Optional[float] = CACHE_CATALOGO_TTL or None):
+        self.db = database
+        self.nutrientes = tuple(nutrientes)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._expira: Optional[float] = None
+        self._indice: Dict[str, int] = {}
+        self._matriz = np.zeros((0, len(self.nutrientes)))
+
+    def _leer_matriz(self) -> Tuple[Dict[str, int], np.ndarray]:
+        filas = self.db.nutrientes_comidas(list(self.nutrientes))
+        indice = {fila[0]: i for i, fila in enumerate(filas)}
+        matriz = np.array([fila[1:] for fila in filas], dtype=np.float64).reshape(len(filas), len(self.nutrientes))
+        return indice, matriz
+
+    def matriz(self) -> Tuple[Dict[str, int], np.ndarray]:
+        """(comida_id -> fila, matriz comidas × nutrientes), recargada si cambió alguna comida"""
+        version = self.db.version_comidas()
+        if version is None:
+            # La petición en curso modificó comidas aún sin confirmar: se leen directamente
+            return self._leer_matriz()
+        if not self._vigente(version):
+            with self._lock:
+                if not self._vigente(version):
+                    # Si hay otra invalidación durante la lectura, la versión guardada
+                    # ya no coincide y la próxima llamada vuelve a leer
+                    self._indice, self._matriz = self._leer_matriz()
+                    self._version = version
+                    self._expira = time.monotonic() + self.ttl if self.ttl else None
+        return self._indice, self._matriz
+
+    def _vigente(self, version: int) -> bool:
+        return version == self._version and (self._expira is None or self._expira > time.monotonic())
+
+    def totales_matriz(self, menu_ids: List[str]) -> np.ndarray:
+        """Matriz menús × nutrientes (en el orden de `menu_ids`), ponderada por porción"""
+        totales = np.zeros((len(menu_ids), len(self.nutrientes)))
+        porciones = self.db.porciones_por_menu(menu_ids)
+        if not porciones:
+            return totales
+
+        indice, matriz = self.matriz()
+        posicion = {menu_id: i for i, menu_id in enumerate(menu_ids)}
+        n = len(porciones)
+        menus, comidas, porciones_col = zip(*porciones)
+        filas_menu = np.fromiter(map(posicion.__getitem__, menus), dtype=np.intp, count=n)
+        filas_comida = np.fromiter(map(indice.get, comidas, repeat(-1)), dtype=np.intp, count=n)
+        pesos = np.fromiter(porciones_col, dtype=np.float64, count=n)
+
+        existentes = filas_comida >= 0
+        np.add.at(
+            totales,
+            filas_menu[existentes],
+            matriz[filas_comida[existentes]] * pesos[existentes, None]
+        )
+        return totales
+
+    def totales(self, menu_ids: List[str]) -> Dict[str, Dict[str, float]]:
+        """Totales por menú: menu_id -> {nutriente: total}"""
+        totales = self.totales_matriz(menu_ids).round(2)
+        return {
+            menu_id: dict(zip(self.nutrientes, fila.tolist()))
+            for menu_id, fila in zip(menu_ids, totales)
+        }
+
+
+# Instancia global del motor
+motor_nutricional = MotorNutricional()
@@ -0,0 +1,25 @@
+"""
+Almacén de credenciales: hash y verificación de contraseñas.
+Módulo aparte para que lo usen tanto `auth` como `database` sin importarse entre sí.
+"""
+import os
+
+from passlib.context import CryptContext
+
+# Coste de bcrypt (log2 de iteraciones). Cada +1 duplica el tiempo de login;
+# ajustarlo a que una verificación tome ~100-250 ms en el hardware de producción.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# bcrypt para todos los hashes nuevos. hex_sha256 solo se acepta para verificar los
+# hashes heredados (sha256 sin sal); al marcarlo deprecated, verify_and_update
+# devuelve el hash bcrypt con el que reemplazarlos tras un login correcto.
+pwd_context = CryptContext(
+    schemes=["bcrypt", "hex_sha256"],
+    deprecated=["hex_sha256"],
+    bcrypt__rounds=BCRYPT_ROUNDS,
+)
+
+
+def hash_password(password: str) -> str:
+    """Hashear contraseña con el esquema por defecto (bcrypt)"""
+    return pwd_context.hash(password)
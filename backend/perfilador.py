@@ -0,0 +1,209 @@
+"""
+Perfilado por muestreo de peticiones individuales, a pedido de un admin.
+
+Una petición con la cabecera `X-Profile: 1` o el parámetro `?profile=1`, hecha con
+un token de admin, se ejecuta con un hilo que cada PERFIL_INTERVALO_MS toma la pila
+de los hilos que la atienden (`sys._current_frames`). El resultado queda guardado
+en formato de pilas colapsadas ("a;b;c N", el de flamegraph.pl / speedscope) y se
+descarga desde /api/stats/perfiles/{id}; la respuesta trae el id en X-Profile-Id.
+
+Sin la marca el middleware solo revisa las cabeceras: no hay hilo de muestreo ni
+hooks de perfilado activos.
+
+Atribución de muestras:
+- Hilo del event loop: solo cuando la tarea en ejecución es la de esta petición.
+- Hilos del pool: cuando la pila pasa por el endpoint o una de sus dependencias
+  síncronas. Dos peticiones simultáneas al mismo endpoint se mezclarían.
+"""
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from starlette.datastructures import MutableHeaders
+
+from metricas import resolver_ruta
+
+# Intervalo entre muestras
+PERFIL_INTERVALO_MS = float(os.getenv("PERFIL_INTERVALO_MS", "2"))
+# Perfiles guardados para descarga (los más recientes) y cuánto tiempo
+PERFIL_MAX_GUARDADOS = int(os.getenv("PERFIL_MAX_GUARDADOS", "50"))
+PERFIL_TTL_SEGUNDOS = float(os.getenv("PERFIL_TTL_SEGUNDOS", "3600"))
+
+# id -> (vence (monotonic), metadatos, pilas colapsadas), del más antiguo al más reciente
+_perfiles: "OrderedDict[str, tuple[float, Dict[str, Any], str]]" = OrderedDict()
+_perfiles_lock = threading.Lock()
+
+
+def _nombre_frame(frame) -> str:
+    codigo = frame.f_code
+    return f"{os.path.basename(codigo.co_filename)}:{getattr(codigo, 'co_qualname', codigo.co_name)}"
+
+
+def _pila_desde(frame, raices: Set[Any]) -> Optional[str]:
+    """Pila colapsada desde el primer frame (hacia la raíz) cuyo código está en `raices`"""
+    nombres: List[str] = []
+    while frame is not None:
+        nombres.append(_nombre_frame(frame))
+        if frame.f_code in raices:
+            return ";".join(reversed(nombres))
+        frame = frame.f_back
+    return None
+
+
+def _tarea_en_ejecucion(loop) -> Optional[asyncio.Task]:
+    tareas = getattr(asyncio.tasks, "_current_tasks", None)
+    return tareas.get(loop) if tareas is not None else None
+
+
+def _codigos_ruta(ruta) -> Set[Any]:
+    """Código del endpoint y de las dependencias de la ruta (recursivamente)"""
+    codigos: Set[Any] = set()
+    pendientes = [getattr(ruta, "dependant", None)]
+    while pendientes:
+        dependant = pendientes.pop()
+        if dependant is None:
+            continue
+        # inspect.unwrap: el endpoint original, no el envoltorio que hace commit (RutaConSesion)
+        codigo = getattr(inspect.unwrap(dependant.call) if dependant.call else None, "__code__", None)
+        if codigo is not None:
+            codigos.add(codigo)
+        pendientes.extend(dependant.dependencies)
+    return codigos
+
+
+class PerfilMuestreo:
+    """Muestreador de una petición: corre en su propio hilo entre iniciar() y detener()"""
+
+    def __init__(self, intervalo: float, codigos: Set[Any], raiz_loop: Any):
+        self.intervalo = intervalo
+        self.codigos = codigos
+        self.raiz_loop = {raiz_loop}
+        self.hilo_loop = threading.get_ident()
+        self.loop = asyncio.get_running_loop()
+        self.tarea = asyncio.current_task()
+        self.muestras: Counter = Counter()
+        self.total = 0
+        self._fin = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, name="perfilador", daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+
+    def detener(self) -> Counter:
+        self._fin.set()
+        self._hilo.join()
+        return self.muestras
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        while not self._fin.wait(self.intervalo):
+            self.total += 1
+            for hilo, frame in sys._current_frames().items():
+                if hilo == propio:
+                    continue
+                if hilo == self.hilo_loop:
+                    if _tarea_en_ejecucion(self.loop) is not self.tarea:
+                        continue
+                    pila = _pila_desde(frame, self.raiz_loop)
+                else:
+                    pila = _pila_desde(frame, self.codigos)
+                if pila:
+                    self.muestras[pila] += 1
+
+
+def _solicitado(scope) -> bool:
+    for nombre, valor in scope["headers"]:
+        if nombre == b"x-profile":
+            return valor not in (b"", b"0", b"false")
+    query = scope.get("query_string", b"")
+    return b"profile=" in query and any(
+        parte.startswith(b"profile=") and parte[8:] not in (b"", b"0", b"false") for parte in query.split(b"&")
+    )
+
+
+def _es_admin(scope) -> bool:
+    from auth import AuthService  # auth importa la base de datos; solo se necesita al perfilar
+
+    for nombre, valor in scope["headers"]:
+        if nombre == b"authorization":
+            esquema, _, token = valor.decode("latin-1").partition(" ")
+            if esquema.lower() != "bearer":
+                return False
+            try:
+                return AuthService.verify_token(token).get("rol") == "admin"
+            except Exception:
+                return False
+    return False
+
+
+class PerfilMiddleware:
+    """Middleware ASGI que perfila las peticiones marcadas por un admin"""
+
+    def __init__(self, app, intervalo_ms: float = PERFIL_INTERVALO_MS):
+        self.app = app
+        self.intervalo = intervalo_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _solicitado(scope) or not _es_admin(scope):
+            await self.app(scope, receive, send)
+            return
+
+        perfil_id = uuid.uuid4().hex[:16]
+        ruta = resolver_ruta(scope)
+        perfil = PerfilMuestreo(self.intervalo, _codigos_ruta(ruta), PerfilMiddleware.__call__.__code__)
+
+        async def send_con_perfil(mensaje):
+            if mensaje["type"] == "http.response.start":
+                MutableHeaders(scope=mensaje)["X-Profile-Id"] = perfil_id
+            await send(mensaje)
+
+        inicio = time.perf_counter()
+        perfil.iniciar()
+        try:
+            await self.app(scope, receive, send_con_perfil)
+        finally:
+            muestras = perfil.detener()
+            guardar_perfil(perfil_id, {
+                "id": perfil_id,
+                "fecha": datetime.now().isoformat(timespec="seconds"),
+                "ruta": f"{scope['method']} {scope['path']}",
+                "duracion_ms": round((time.perf_counter() - inicio) * 1000, 2),
+                "intervalo_ms": self.intervalo * 1000,
+                "muestreos": perfil.total,
+                "muestras": sum(muestras.values()),
+            }, muestras)
+
+
+def _descartar_vencidos(ahora: float):
+    while _perfiles and (len(_perfiles) > PERFIL_MAX_GUARDADOS or next(iter(_perfiles.values()))[0] <= ahora):
+        _perfiles.popitem(last=False)
+
+
+def guardar_perfil(perfil_id: str, metadatos: Dict[str, Any], muestras: Counter):
+    pilas = "".join(f"{pila} {n}\n" for pila, n in muestras.most_common())
+    ahora = time.monotonic()
+    with _perfiles_lock:
+        _perfiles[perfil_id] = (ahora + PERFIL_TTL_SEGUNDOS, metadatos, pilas)
+        _descartar_vencidos(ahora)
+
+
+def obtener_perfil(perfil_id: str) -> Optional[str]:
+    """Pilas colapsadas del perfil, o None si no existe o ya se descartó"""
+    with _perfiles_lock:
+        _descartar_vencidos(time.monotonic())
+        perfil = _perfiles.get(perfil_id)
+        return perfil[2] if perfil else None
+
+
+def listar_perfiles() -> List[Dict[str, Any]]:
+    """Metadatos de los perfiles guardados, el más reciente primero"""
+    with _perfiles_lock:
+        _descartar_vencidos(time.monotonic())
+        return [metadatos for _, metadatos, _ in reversed(_perfiles.values())]
@@ -0,0 +1,105 @@
+"""
+Lista de tokens revocados (logout), consultada en cada petición autenticada.
+
+En memoria se guarda jti -> `exp` (epoch UTC) de los tokens revocados que aún no
+vencen, así que la consulta es una búsqueda en un dict. La tabla tokens_revocados
+la hace persistente entre reinicios y la comparte entre procesos: cada proceso la
+vuelve a leer periódicamente (ver `sincronizar`).
+
+También se pueden revocar todos los tokens de un usuario emitidos hasta un instante
+(desactivación, cambio de rol o de escuela): se guarda usuario -> (corte, vencimiento)
+y se rechazan los tokens de ese usuario con `iat` hasta el corte, inclusive. Así los claims
+del token siguen siendo fiables para autorizar sin releer al usuario.
+"""
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from database import db
+
+# Cada cuántos segundos se releen las revocaciones de otros procesos y se purgan las vencidas
+REVOCACION_SYNC_SEGUNDOS = float(os.getenv("REVOCACION_SYNC_SEGUNDOS", "30"))
+
+# Prefijo del jti con que se persisten las revocaciones de usuario
+PREFIJO_USUARIO = "usuario:"
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _a_epoch(instante: datetime) -> float:
+    return (instante - _EPOCH).total_seconds()
+
+
+class RevocationList:
+    def __init__(self):
+        self._revocados: Dict[str, float] = {}
+        # usuario_id -> (corte, vencimiento), ambos en epoch UTC
+        self._usuarios: Dict[str, Tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._revocados)
+
+    def esta_revocado(self, jti: str) -> bool:
+        exp = self._revocados.get(jti)
+        return exp is not None and exp > time.time()
+
+    def usuario_revocado(self, usuario_id: str, iat: Optional[float]) -> bool:
+        """
+        Token del usuario emitido hasta su último corte, inclusive (sin `iat` cuenta como
+        anterior). `iat` tiene resolución de segundos: un token del mismo segundo que el
+        corte pudo emitirse antes de la revocación, así que también se rechaza.
+        """
+        revocacion = self._usuarios.get(usuario_id)
+        if revocacion is None:
+            return False
+        corte, vence = revocacion
+        return vence > time.time() and (iat is None or iat <= corte)
+
+    def revocar(self, jti: str, exp: float):
+        """Revoca un token hasta su expiración; queda registrado en la base de datos"""
+        self._revocados[jti] = exp
+        db.revocar_token(jti, datetime.utcfromtimestamp(exp))
+
+    def revocar_usuario(self, usuario_id: str, vigencia_segundos: float):
+        """
+        Revoca los tokens del usuario emitidos hasta ahora. `vigencia_segundos` es la
+        duración máxima de un token: pasado ese plazo ya no queda ninguno afectado.
+        """
+        # iat se codifica en segundos enteros: el corte también, y se compara con <=
+        # (un login en este mismo segundo, posterior a la revocación, también se rechaza)
+        corte = float(int(time.time()))
+        vence = corte + vigencia_segundos
+        self._usuarios[usuario_id] = (corte, vence)
+        db.revocar_token(
+            PREFIJO_USUARIO + usuario_id, datetime.utcfromtimestamp(vence), datetime.utcfromtimestamp(corte)
+        )
+
+    def sincronizar(self):
+        """
+        Incorpora las revocaciones registradas por otros procesos y descarta las vencidas,
+        en memoria y en la base de datos. Se reemplazan los dicts completos: las lecturas
+        concurrentes ven el anterior o el nuevo, nunca uno a medio construir.
+        """
+        ahora = time.time()
+        ahora_utc = datetime.utcfromtimestamp(ahora)
+        db.purgar_tokens_revocados(ahora_utc)
+        
+        vigentes: Dict[str, float] = {}
+        usuarios: Dict[str, Tuple[float, float]] = {}
+        for jti, (expira, fecha_revocacion) in db.tokens_revocados_vigentes(ahora_utc).items():
+            if jti.startswith(PREFIJO_USUARIO):
+                usuarios[jti[len(PREFIJO_USUARIO):]] = (_a_epoch(fecha_revocacion), _a_epoch(expira))
+            else:
+                vigentes[jti] = _a_epoch(expira)
+        # Se conservan las locales aún no confirmadas en la base de datos
+        vigentes.update({jti: exp for jti, exp in self._revocados.items() if exp > ahora})
+        for usuario_id, (corte, vence) in self._usuarios.items():
+            if vence > ahora and corte >= usuarios.get(usuario_id, (0.0, 0.0))[0]:
+                usuarios[usuario_id] = (corte, vence)
+        self._revocados = vigentes
+        self._usuarios = usuarios
+
+
+# Instancia global de la lista de revocación
+revocation_list = RevocationList()
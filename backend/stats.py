@@ -0,0 +1,45 @@
+"""
+Servicio de estadísticas agregadas para el dashboard (endpoints `/` y `/api/stats`).
+Los conteos salen de consultas COUNT(*) ... GROUP BY y se guardan unos segundos,
+porque el dashboard los consulta periódicamente.
+"""
+import os
+from typing import Any, Dict
+
+from cache import LRUCache
+from database import db
+
+# Segundos que se reutilizan los conteos; 0 desactiva la caché
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "10"))
+
+
+class StatsService:
+    def __init__(self, ttl: float = STATS_CACHE_TTL):
+        self._cache = LRUCache("estadisticas", max_size=256, ttl=ttl) if ttl else None
+
+    def _cacheado(self, clave, calcular) -> Dict[str, Any]:
+        if self._cache is None:
+            return calcular()
+        encontrado, valor = self._cache.get(clave)
+        if encontrado:
+            return valor
+        version = self._cache.version
+        valor = calcular()
+        self._cache.set(clave, valor, version)
+        return valor
+
+    def globales(self) -> Dict[str, Any]:
+        """Conteos de todo el sistema"""
+        return self._cacheado("globales", db.contar_global)
+
+    def de_escuela(self, escuela_id: str) -> Dict[str, int]:
+        """Conteos de una escuela"""
+        return self._cacheado(("escuela", escuela_id), lambda: db.contar_escuela(escuela_id))
+
+    def invalidate(self):
+        if self._cache is not None:
+            self._cache.invalidate()
+
+
+# Instancia global del servicio
+stats_service = StatsService()
@@ -0,0 +1,68 @@
+"""
+Configuración de pytest: base SQLite en memoria (ENVIRONMENT=test) y backend/ en el path.
+Dependencias de las pruebas: pip install -r requirements-dev.txt (desde backend/).
+Las variables se fijan antes de importar db_config, que crea el engine al importarse.
+"""
+import os
+import sys
+
+os.environ["ENVIRONMENT"] = "test"
+# bcrypt al mínimo: los datos de ejemplo hashean una contraseña por usuario
+os.environ["BCRYPT_ROUNDS"] = "4"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import delete
+
+
+def limpiar_base():
+    """Vacía todas las tablas, las cachés de Database y la lista de revocación global"""
+    from db_config import SessionLocal
+    from database import db
+    from models_db import Base
+    from revocacion import revocation_list
+
+    session = SessionLocal()
+    for tabla in reversed(Base.metadata.sorted_tables):
+        session.execute(delete(tabla))
+    session.commit()
+    session.close()
+    for cache in (db.cache_comidas, db.cache_escuelas, db.cache_usuarios):
+        cache.invalidate()
+    # Las revocaciones en memoria sobreviven al vaciado de tokens_revocados
+    revocation_list.__init__()
+
+
+@pytest.fixture
+def datos_ejemplo():
+    """Base con los datos de ejemplo de init_db.py; se vacía al terminar la prueba"""
+    from db_config import SessionLocal, init_db as crear_tablas
+    from init_db import create_sample_data
+
+    crear_tablas()
+    limpiar_base()
+    session = SessionLocal()
+    create_sample_data(session)
+    session.close()
+    yield
+    limpiar_base()
+
+
+@pytest.fixture
+def client(datos_ejemplo):
+    """Cliente HTTP de la aplicación (con su lifespan) sobre los datos de ejemplo"""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def login(client):
+    """login(email, password) -> cabeceras Authorization con el token del usuario"""
+    def _login(email: str, password: str):
+        r = client.post("/api/auth/login", data={"username": email, "password": password})
+        assert r.status_code == 200, r.text
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+    return _login
@@ -0,0 +1,54 @@
+"""
+Bajas lógicas (DELETE): se rechazan mientras el registro siga en uso.
+python -m pytest tests/test_bajas.py (desde backend/)
+"""
+from database import db
+
+
+def test_comida_en_menu_activo_no_se_desactiva(client, login):
+    nutri = login("nutricionista1@sistema.cl", "nutri123")
+
+    # comida-001 está en menu-001 (activo)
+    r = client.delete("/api/comidas/comida-001", headers=nutri)
+    assert r.status_code == 400
+    assert db.get_comida("comida-001").activa
+
+    # comida-002 no está en ningún menú
+    r = client.delete("/api/comidas/comida-002", headers=nutri)
+    assert r.status_code == 200
+    assert not db.get_comida("comida-002").activa
+
+
+def test_comida_solo_en_menus_inactivos_se_desactiva(client, login):
+    admin = login("admin@sistema.cl", "admin123")
+    nutri = login("nutricionista1@sistema.cl", "nutri123")
+
+    for menu_id in ("menu-001", "menu-002"):
+        r = client.put(f"/api/menus/{menu_id}", json={"activo": False}, headers=admin)
+        assert r.status_code == 200, r.text
+
+    assert not db.comida_en_menus_activos("comida-001")
+    r = client.delete("/api/comidas/comida-001", headers=nutri)
+    assert r.status_code == 200
+
+
+def test_escuela_con_usuarios_activos_no_se_desactiva(client, login):
+    from sqlalchemy import update
+    from db_config import SessionLocal
+    from models_db import UsuarioDB
+
+    admin = login("admin@sistema.cl", "admin123")
+
+    r = client.delete("/api/escuelas/escuela-003", headers=admin)
+    assert r.status_code == 400
+    assert "Hay 2 usuarios activos" in r.json()["message"]
+
+    session = SessionLocal()
+    session.execute(update(UsuarioDB).where(UsuarioDB.escuela_id == "escuela-003").values(activo=False))
+    session.commit()
+    session.close()
+
+    assert db.contar_usuarios_activos("escuela-003") == 0
+    r = client.delete("/api/escuelas/escuela-003", headers=admin)
+    assert r.status_code == 200
+    assert not db.get_escuela("escuela-003").activa
@@ -0,0 +1,59 @@
+"""
+Cachés de entidades de Database: una lectura repetida no consulta la base de datos y
+cada escritura invalida la entrada, también cuando llega por la API.
+python -m pytest tests/test_cache.py (desde backend/)
+"""
+from test_menus_queries import contar_sentencias
+
+from database import db
+
+
+def test_usuario_cacheado_no_consulta_la_base(datos_ejemplo):
+    db.get_usuario("padre-001")
+    aciertos = db.cache_stats()["usuarios"]["hits"]
+
+    with contar_sentencias() as sentencias:
+        usuario = db.get_usuario("padre-001")
+    assert usuario.nombre == "Juan Pérez"
+    assert sentencias == []
+    assert db.cache_stats()["usuarios"]["hits"] == aciertos + 1
+
+
+def test_update_invalida_la_cache(datos_ejemplo):
+    db.get_comida("comida-001")
+    db.comidas
+
+    db.update_comida("comida-001", {"calorias": 999})
+
+    assert db.get_comida("comida-001").calorias == 999
+    assert db.comidas["comida-001"].calorias == 999
+
+
+def test_escritura_por_la_api_invalida_la_cache(client, login):
+    admin = login("admin@sistema.cl", "admin123")
+    padre = login("juan.perez@email.com", "padre123")
+    nutri = login("nutricionista1@sistema.cl", "nutri123")
+
+    # get_current_user resuelve al usuario por la caché
+    assert client.get("/api/auth/profile", headers=padre).json()["nombre"] == "Juan Pérez"
+    r = client.put("/api/usuarios/padre-001", json={"nombre": "Juan P."}, headers=admin)
+    assert r.status_code == 200, r.text
+    assert client.get("/api/auth/profile", headers=padre).json()["nombre"] == "Juan P."
+
+    assert client.get("/api/comidas/comida-001", headers=nutri).json()["calorias"] != 999
+    r = client.put("/api/comidas/comida-001", json={"calorias": 999}, headers=nutri)
+    assert r.status_code == 200, r.text
+    assert client.get("/api/comidas/comida-001", headers=nutri).json()["calorias"] == 999
+
+
+def test_escritura_deshecha_no_queda_en_cache(client, login):
+    nutri = login("nutricionista1@sistema.cl", "nutri123")
+    nombre = client.get("/api/comidas/comida-002", headers=nutri).json()["nombre"]
+
+    # El nombre duplicado deshace la transacción después del flush
+    r = client.put("/api/comidas/comida-002", json={"nombre": "Pollo al Horno", "calorias": 1}, headers=nutri)
+    assert r.status_code == 400
+
+    comida = client.get("/api/comidas/comida-002", headers=nutri).json()
+    assert comida["nombre"] == nombre
+    assert comida["calorias"] != 1
@@ -0,0 +1,45 @@
+"""
+Registro de consultas lentas: el archivo se abre al iniciar la aplicación, no al importar.
+python -m pytest tests/test_consultas_lentas.py (desde backend/)
+"""
+import logging
+from logging.handlers import RotatingFileHandler
+
+import pytest
+
+from consultas_lentas import RegistroConsultasLentas
+from db_config import engine
+
+
+@pytest.fixture
+def logger_limpio():
+    log = logging.getLogger("consultas_lentas")
+    previos = list(log.handlers)
+    yield log
+    for handler in list(log.handlers):
+        if handler not in previos:
+            log.removeHandler(handler)
+            handler.close()
+
+
+def _archivos(log):
+    return [handler for handler in log.handlers if isinstance(handler, RotatingFileHandler)]
+
+
+def test_archivo_se_abre_solo_al_iniciar(tmp_path, logger_limpio):
+    archivo = tmp_path / "logs" / "consultas_lentas.log"
+    registro = RegistroConsultasLentas(engine, 100, str(archivo))
+    assert not archivo.parent.exists()
+    assert _archivos(logger_limpio) == []
+
+    registro.abrir_archivo()
+    registro.abrir_archivo()
+    assert archivo.parent.is_dir()
+    assert len(_archivos(logger_limpio)) == 1
+
+
+def test_registro_inactivo_no_abre_archivo(tmp_path, logger_limpio):
+    archivo = tmp_path / "logs" / "consultas_lentas.log"
+    RegistroConsultasLentas(engine, 0, str(archivo)).abrir_archivo()
+    assert not archivo.parent.exists()
+    assert _archivos(logger_limpio) == []
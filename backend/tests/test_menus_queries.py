@@ -0,0 +1,96 @@
+"""
+Regresión del N+1 en `Database.menus`: la cantidad de sentencias SQL no depende
+de cuántos menús haya.
+"""
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, event
+
+from db_config import SessionLocal, engine, init_db
+from database import Database
+from models_db import (
+    Base, EscuelaDB, UsuarioDB, ComidaDB, MenuDB, MenuComidaDB,
+    RolUsuarioEnum, TipoMenuEnum, CategoriaComidaEnum
+)
+
+COMIDAS_POR_MENU = 3
+
+
+@pytest.fixture
+def database():
+    init_db()
+    session = SessionLocal()
+    session.add(EscuelaDB(
+        id="escuela-test", nombre="Escuela Test", direccion="-", telefono="-",
+        email="escuela@test.cl", codigo_establecimiento="cod-test", director="-",
+        director_email="director@test.cl", capacidad_estudiantes=1
+    ))
+    session.add(UsuarioDB(
+        id="admin-test", nombre="Admin Test", email="admin@test.cl",
+        password_hash="-", rol=RolUsuarioEnum.ADMIN, activo=True
+    ))
+    session.add_all(
+        ComidaDB(
+            id=f"comida-{c}", nombre=f"Comida {c}", categoria=CategoriaComidaEnum.PROTEINA,
+            descripcion="-", calorias=100, proteinas=1, grasas=1, carbohidratos=1
+        )
+        for c in range(COMIDAS_POR_MENU)
+    )
+    session.commit()
+    session.close()
+    yield Database()
+    session = SessionLocal()
+    for tabla in reversed(Base.metadata.sorted_tables):
+        session.execute(delete(tabla))
+    session.commit()
+    session.close()
+
+
+def crear_menus(desde: int, hasta: int):
+    session = SessionLocal()
+    for i in range(desde, hasta):
+        menu_id = f"menu-{i}"
+        session.add(MenuDB(
+            id=menu_id, escuela_id="escuela-test", fecha=date(2024, 1, 1) + timedelta(days=i),
+            tipo=TipoMenuEnum.ALMUERZO, nombre=menu_id, activo=True,
+            creado_por="admin-test", fecha_creacion=datetime.now()
+        ))
+        session.add_all(
+            MenuComidaDB(id=f"{menu_id}-{c}", menu_id=menu_id, comida_id=f"comida-{c}", porcion=1.0, orden=c)
+            for c in range(COMIDAS_POR_MENU)
+        )
+    session.commit()
+    session.close()
+
+
+@contextmanager
+def contar_sentencias():
+    sentencias = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        yield sentencias
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+
+def test_menus_cantidad_fija_de_sentencias(database):
+    n = 5
+    crear_menus(0, n)
+    with contar_sentencias() as pocas:
+        menus = database.menus
+    assert len(menus) == n
+    assert menus["menu-0"].comidas == [f"comida-{c}" for c in range(COMIDAS_POR_MENU)]
+
+    crear_menus(n, 10 * n)
+    with contar_sentencias() as muchas:
+        menus = database.menus
+    assert len(menus) == 10 * n
+
+    assert len(muchas) == len(pocas)
+    assert len(pocas) <= 2
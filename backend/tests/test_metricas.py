@@ -0,0 +1,75 @@
+"""
+Métricas HTTP: peticiones reales a la aplicación, consultadas en el registro en memoria
+(`resumen()`) y en el texto de Prometheus que expone /metrics (`exportar()`).
+python -m pytest tests/test_metricas.py (desde backend/)
+"""
+import re
+
+import pytest
+
+from metricas import registro_metricas
+
+RUTA_MENU = "/api/menus/{menu_id}"
+
+
+@pytest.fixture
+def metricas(client):
+    registro_metricas.reset()
+    yield registro_metricas
+    registro_metricas.reset()
+
+
+def _serie(texto: str, nombre: str, etiquetas: str) -> float:
+    coincidencia = re.search(rf"^{re.escape(nombre + '{' + etiquetas + '}')} (\S+)$", texto, re.M)
+    assert coincidencia, f"{nombre}{{{etiquetas}}} no está en la exportación"
+    return float(coincidencia.group(1))
+
+
+def test_resumen_por_plantilla_de_ruta(client, login, metricas):
+    padre = login("juan.perez@email.com", "padre123")
+    respuestas = [
+        client.get("/api/menus/menu-001", headers=padre),
+        client.get("/api/menus/menu-002", headers=padre),
+        client.get("/api/menus/no-existe", headers=padre),
+    ]
+    assert [r.status_code for r in respuestas] == [200, 200, 404]
+    assert client.get("/no/existe").status_code == 404
+
+    resumen = metricas.resumen()
+    # Una serie por plantilla, no por URL
+    menu = resumen[f"GET {RUTA_MENU}"]
+    assert menu["peticiones"] == {200: 2, 404: 1}
+    assert menu["en_curso"] == 0
+    assert menu["bytes_total"] == sum(len(r.content) for r in respuestas)
+    assert 0 < menu["p50"] <= menu["p95"] <= menu["p99"]
+    assert resumen["GET sin_ruta"]["peticiones"] == {404: 1}
+    assert resumen["POST /api/auth/login"]["peticiones"] == {200: 1}
+
+
+def test_exportar_en_formato_prometheus(client, login, metricas):
+    padre = login("juan.perez@email.com", "padre123")
+    for menu_id in ("menu-001", "menu-002", "no-existe"):
+        client.get(f"/api/menus/{menu_id}", headers=padre)
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    texto = r.text
+    etiquetas = f'method="GET",route="{RUTA_MENU}"'
+
+    assert "# TYPE http_requests_total counter" in texto
+    assert _serie(texto, "http_requests_total", etiquetas + ',status="200"') == 2
+    assert _serie(texto, "http_requests_total", etiquetas + ',status="404"') == 1
+    # /metrics se cuenta a sí misma como en curso mientras exporta
+    assert _serie(texto, "http_requests_in_flight", 'method="GET",route="/metrics"') == 1
+
+    # Buckets acumulativos que terminan en +Inf == _count
+    buckets = [
+        float(valor) for valor in re.findall(
+            rf'^http_request_duration_seconds_bucket{{{re.escape(etiquetas)},le="[^"]+"}} (\S+)$', texto, re.M
+        )
+    ]
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == _serie(texto, "http_request_duration_seconds_count", etiquetas) == 3
+    assert _serie(texto, "http_response_size_bytes_count", etiquetas) == 3
+    assert texto.endswith("\n")
@@ -0,0 +1,63 @@
+"""
+Matriz de nutrientes de MotorNutricional: se recarga al cambiar comidas en este proceso,
+al invalidarlas explícitamente o al vencer su TTL (cambios hechos por otro proceso).
+python -m pytest tests/test_nutricion.py (desde backend/)
+"""
+import pytest
+from sqlalchemy import update
+
+import nutricion
+from database import db
+from db_config import SessionLocal
+from models_db import ComidaDB
+from nutricion import MotorNutricional
+
+
+def _calorias(motor, comida_id):
+    indice, matriz = motor.matriz()
+    return matriz[indice[comida_id], motor.nutrientes.index("calorias")]
+
+
+def _cambiar_calorias_por_fuera(comida_id, calorias):
+    # Como otro proceso: escribe directo en la base, sin pasar por Database
+    session = SessionLocal()
+    session.execute(update(ComidaDB).where(ComidaDB.id == comida_id).values(calorias=calorias))
+    session.commit()
+    session.close()
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(nutricion.time, "monotonic", lambda: ahora[0])
+    return ahora
+
+
+def test_escritura_local_recarga_la_matriz(datos_ejemplo):
+    motor = MotorNutricional(ttl=None)
+    assert _calorias(motor, "comida-001") != 999
+
+    db.update_comida("comida-001", {"calorias": 999})
+    assert _calorias(motor, "comida-001") == 999
+
+
+def test_invalidar_comidas_recarga_la_matriz(datos_ejemplo):
+    motor = MotorNutricional(ttl=None)
+    antes = _calorias(motor, "comida-001")
+
+    _cambiar_calorias_por_fuera("comida-001", 999)
+    assert _calorias(motor, "comida-001") == antes
+
+    db.invalidar_comidas()
+    assert _calorias(motor, "comida-001") == 999
+
+
+def test_ttl_recoge_cambios_de_otro_proceso(datos_ejemplo, reloj):
+    motor = MotorNutricional(ttl=60)
+    antes = _calorias(motor, "comida-001")
+
+    _cambiar_calorias_por_fuera("comida-001", 999)
+    reloj[0] += 59
+    assert _calorias(motor, "comida-001") == antes
+    reloj[0] += 2
+    assert _calorias(motor, "comida-001") == 999
@@ -0,0 +1,64 @@
+"""
+Paginación por keyset de los listados: recorrido completo con X-Next-Cursor,
+cursor inválido y el alcance por escuela del rector.
+"""
+from sqlalchemy import update
+
+from db_config import SessionLocal
+from models_db import UsuarioDB
+
+
+def recorrer(client, url, headers, limit):
+    ids, cursor, paginas = [], None, 0
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get(url, headers=headers, params=params)
+        assert r.status_code == 200, r.text
+        ids += [item["id"] for item in r.json()]
+        paginas += 1
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids, paginas
+
+
+def test_cursor_recorre_todo_sin_repetir(client, login):
+    admin = login("admin@sistema.cl", "admin123")
+    todos = [u["id"] for u in client.get("/api/usuarios", headers=admin, params={"limit": 200}).json()]
+
+    ids, paginas = recorrer(client, "/api/usuarios", admin, limit=3)
+
+    assert ids == todos
+    assert paginas == -(-len(todos) // 3)
+
+
+def test_cursor_malformado_responde_400(client, login):
+    admin = login("admin@sistema.cl", "admin123")
+
+    for cursor in ("no-es-un-cursor", "eyJ4IjogMX0", "%%%"):
+        r = client.get("/api/usuarios", headers=admin, params={"cursor": cursor})
+        assert r.status_code == 400, cursor
+        assert r.json()["message"] == "Cursor inválido"
+
+
+def test_rector_sin_escuela_no_ve_usuarios(client, login):
+    session = SessionLocal()
+    session.execute(update(UsuarioDB).where(UsuarioDB.id == "rector-001").values(escuela_id=None))
+    session.commit()
+    session.close()
+    rector = login("rector1@sistema.cl", "rector123")
+
+    r = client.get("/api/usuarios", headers=rector)
+
+    assert r.status_code == 200
+    assert r.json() == []
+
+
+def test_rector_ve_solo_su_escuela(client, login):
+    rector = login("rector1@sistema.cl", "rector123")
+
+    usuarios = client.get("/api/usuarios", headers=rector).json()
+
+    assert usuarios
+    assert {u["escuela_id"] for u in usuarios} == {"escuela-001"}
@@ -0,0 +1,28 @@
+"""
+Edición de las comidas de un menú: fuera de admin, solo en la escuela propia.
+python -m pytest tests/test_permisos_menu.py (desde backend/)
+"""
+import pytest
+
+
+@pytest.mark.parametrize("email,password", [
+    ("rector2@sistema.cl", "rector123"),
+    ("nutricionista2@sistema.cl", "nutri123"),
+])
+def test_otra_escuela_no_edita_el_menu(client, login, email, password):
+    cabeceras = login(email, password)
+
+    r = client.post("/api/menu/menu-001/comida/comida-002", headers=cabeceras)
+    assert r.status_code == 403
+    r = client.delete("/api/menu/menu-001/comida/comida-001", headers=cabeceras)
+    assert r.status_code == 403
+    r = client.put("/api/menu/menu-001/comidas", json=[{"comida_id": "comida-002"}], headers=cabeceras)
+    assert r.status_code == 403
+
+
+def test_rector_edita_el_menu_de_su_escuela(client, login):
+    rector = login("rector1@sistema.cl", "rector123")
+
+    r = client.post("/api/menu/menu-001/comida/comida-002", headers=rector)
+    assert r.status_code == 200, r.text
+    assert "comida-002" in [c["comida_id"] for c in r.json()["comidas"]]
@@ -0,0 +1,105 @@
+"""
+Lista de revocación: tokens revocados por usuario (desactivación, cambio de rol o
+de escuela) y por jti (logout).
+"""
+from datetime import datetime
+
+import pytest
+
+import revocacion
+from database import db
+from revocacion import RevocationList
+
+AHORA = 1_700_000_000.6
+VIGENCIA = 8 * 3600
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    monkeypatch.setattr(revocacion.time, "time", lambda: AHORA)
+
+
+def test_usuario_revocado_incluye_el_segundo_del_corte(datos_ejemplo, reloj):
+    lista = RevocationList()
+    lista.revocar_usuario("padre-001", VIGENCIA)
+    segundo = int(AHORA)
+
+    assert lista.usuario_revocado("padre-001", segundo - 1)
+    # Emitido en el mismo segundo que la revocación: pudo ser antes, se rechaza
+    assert lista.usuario_revocado("padre-001", segundo)
+    assert not lista.usuario_revocado("padre-001", segundo + 1)
+    assert lista.usuario_revocado("padre-001", None)
+    assert not lista.usuario_revocado("nutri-001", segundo - 1)
+
+
+def test_revocacion_de_usuario_vence_con_la_vigencia(datos_ejemplo, monkeypatch):
+    lista = RevocationList()
+    monkeypatch.setattr(revocacion.time, "time", lambda: AHORA)
+    lista.revocar_usuario("padre-001", VIGENCIA)
+
+    monkeypatch.setattr(revocacion.time, "time", lambda: AHORA + VIGENCIA + 1)
+    assert not lista.usuario_revocado("padre-001", int(AHORA) - 1)
+
+
+def test_revocacion_de_usuario_se_comparte_entre_procesos(datos_ejemplo, reloj):
+    RevocationList().revocar_usuario("padre-001", VIGENCIA)
+
+    otro_proceso = RevocationList()
+    otro_proceso.sincronizar()
+
+    assert otro_proceso.usuario_revocado("padre-001", int(AHORA))
+    assert not otro_proceso.usuario_revocado("padre-001", int(AHORA) + 1)
+
+
+def test_usuario_desactivado_pierde_acceso_en_lecturas(client, login):
+    admin = login("admin@sistema.cl", "admin123")
+    padre = login("juan.perez@email.com", "padre123")
+    assert client.get("/api/menus", headers=padre).status_code == 200
+
+    r = client.put("/api/usuarios/padre-001", headers=admin, json={"activo": False})
+    assert r.status_code == 200, r.text
+
+    # /api/menus autoriza con los claims del token, sin leer al usuario
+    r = client.get("/api/menus", headers=padre)
+    assert r.status_code == 401
+
+
+def test_jti_revocado_hasta_su_expiracion(datos_ejemplo, monkeypatch):
+    lista = RevocationList()
+    monkeypatch.setattr(revocacion.time, "time", lambda: AHORA)
+    lista.revocar("jti-1", AHORA + 60)
+
+    assert lista.esta_revocado("jti-1")
+    assert not lista.esta_revocado("jti-2")
+
+    monkeypatch.setattr(revocacion.time, "time", lambda: AHORA + 61)
+    assert not lista.esta_revocado("jti-1")
+
+
+def test_revocacion_de_jti_se_comparte_y_se_purga(datos_ejemplo, monkeypatch):
+    monkeypatch.setattr(revocacion.time, "time", lambda: AHORA)
+    RevocationList().revocar("jti-1", AHORA + 60)
+
+    otro_proceso = RevocationList()
+    otro_proceso.sincronizar()
+    assert otro_proceso.esta_revocado("jti-1")
+    assert len(otro_proceso) == 1
+
+    # Vencido el token, sincronizar lo descarta en memoria y en la base de datos
+    monkeypatch.setattr(revocacion.time, "time", lambda: AHORA + 61)
+    otro_proceso.sincronizar()
+    assert len(otro_proceso) == 0
+    assert db.tokens_revocados_vigentes(datetime.utcfromtimestamp(AHORA)) == {}
+
+
+def test_logout_revoca_solo_ese_token(client, login):
+    padre = login("juan.perez@email.com", "padre123")
+    otra_sesion = login("juan.perez@email.com", "padre123")
+
+    r = client.post("/api/auth/logout", headers=padre)
+    assert r.status_code == 200, r.text
+
+    # Rechazado tanto leyendo al usuario como solo con los claims del token
+    assert client.get("/api/auth/profile", headers=padre).status_code == 401
+    assert client.get("/api/menus", headers=padre).status_code == 401
+    assert client.get("/api/menus", headers=otra_sesion).status_code == 200
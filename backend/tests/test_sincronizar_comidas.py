@@ -0,0 +1,60 @@
+"""
+Reemplazo de las comidas de un menú por diferencia (_sincronizar_comidas): las filas
+insertadas, eliminadas y actualizadas que informa coinciden con lo que cambió.
+python -m pytest tests/test_sincronizar_comidas.py (desde backend/)
+"""
+from test_menus_queries import contar_sentencias
+
+from database import db
+
+# Comidas de menu-001 en los datos de ejemplo, en orden y con porción 1.0
+ACTUALES = ["comida-001", "comida-003", "comida-005", "comida-007", "comida-010"]
+
+
+def _items(comida_ids, porciones=None):
+    porciones = porciones or {}
+    return [{"comida_id": c, "porcion": porciones.get(c)} for c in comida_ids]
+
+
+def _escrituras(sentencias):
+    return [s for s in sentencias if s.split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE")]
+
+
+def test_sin_cambios_no_escribe(datos_ejemplo):
+    with contar_sentencias() as sentencias:
+        cambios = db.reemplazar_comidas_menu("menu-001", _items(ACTUALES))
+    assert cambios == {"insertadas": 0, "eliminadas": 0, "actualizadas": 0}
+    assert _escrituras(sentencias) == []
+
+
+def test_reordenar_solo_actualiza_el_orden(datos_ejemplo):
+    nuevo = ["comida-003", "comida-001"] + ACTUALES[2:]
+    with contar_sentencias() as sentencias:
+        cambios = db.reemplazar_comidas_menu("menu-001", _items(nuevo))
+    assert cambios == {"insertadas": 0, "eliminadas": 0, "actualizadas": 2}
+    # Mismas comidas y porciones: los totales guardados no se recalculan
+    assert not any("menu_nutricion" in s for s in _escrituras(sentencias))
+    assert [c.comida_id for c in db.get_menu_completo("menu-001").comidas] == nuevo
+
+
+def test_agregar_quitar_y_cambiar_porcion(datos_ejemplo):
+    # Sale comida-010, entra comida-002 en su lugar y comida-001 pasa a porción 2
+    nuevo = ACTUALES[:4] + ["comida-002"]
+    cambios = db.reemplazar_comidas_menu("menu-001", _items(nuevo, {"comida-001": 2.0}))
+    assert cambios == {"insertadas": 1, "eliminadas": 1, "actualizadas": 1}
+
+    menu = db.get_menu_completo("menu-001")
+    assert [c.comida_id for c in menu.comidas] == nuevo
+    assert {c.comida_id: c.porcion for c in menu.comidas}["comida-001"] == 2.0
+    assert menu.informacion_nutricional.calorias == round(
+        sum(c.calorias * c.porcion for c in menu.comidas), 2
+    )
+
+
+def test_cabecera_de_cambios(client, login):
+    nutri = login("nutricionista1@sistema.cl", "nutri123")
+
+    r = client.put("/api/menu/menu-001/comidas", json=_items(ACTUALES[1:]), headers=nutri)
+    assert r.status_code == 200, r.text
+    # Sale comida-001 y las cuatro restantes suben una posición
+    assert r.headers["X-Comidas-Cambios"] == "insertadas=0, eliminadas=1, actualizadas=4"
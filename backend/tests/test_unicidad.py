@@ -0,0 +1,67 @@
+"""
+Unicidad por índices: una IntegrityError de unicidad se traduce en RegistroDuplicadoError
+y el endpoint responde 400 sin confirmar nada.
+python -m pytest tests/test_unicidad.py (desde backend/)
+"""
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from database import Database, RegistroDuplicadoError, db
+
+COMIDA = {
+    "nombre": "Pollo al Horno", "categoria": "proteina", "descripcion": "-",
+    "calorias": 100, "proteinas": 1, "grasas": 1, "carbohidratos": 1,
+    "fibra": 0, "sodio": 0, "azucar": 0, "ingredientes": [], "alergenos": []
+}
+
+
+def _integrity_error(orig):
+    return IntegrityError("INSERT ...", {}, orig)
+
+
+def test_violacion_unicidad_segun_driver():
+    sqlite = Exception("UNIQUE constraint failed: comidas.nombre")
+    assert Database._violacion_unicidad(_integrity_error(sqlite)) == "comidas.nombre"
+
+    psycopg = Exception("duplicate key value violates unique constraint")
+    psycopg.sqlstate = "23505"
+    psycopg.diag = SimpleNamespace(constraint_name="uq_comidas_nombre")
+    assert Database._violacion_unicidad(_integrity_error(psycopg)) == "uq_comidas_nombre"
+
+    # Otras violaciones (NOT NULL, clave foránea) no son duplicados
+    assert Database._violacion_unicidad(_integrity_error(Exception("NOT NULL constraint failed: comidas.nombre"))) is None
+    fk = Exception("foreign key violation")
+    fk.sqlstate = "23503"
+    assert Database._violacion_unicidad(_integrity_error(fk)) is None
+
+
+def test_create_fuera_de_peticion_lanza_registro_duplicado(datos_ejemplo):
+    with pytest.raises(RegistroDuplicadoError) as error:
+        db.create_comida({**COMIDA, "nombre": "POLLO AL HORNO"})
+    assert "nombre" in error.value.restriccion
+    assert len(db.comidas) == 10
+
+
+def test_comida_duplicada_responde_400(client, login):
+    nutri = login("nutricionista1@sistema.cl", "nutri123")
+
+    # uq_comidas_nombre es sobre lower(nombre)
+    r = client.post("/api/comidas", json={**COMIDA, "nombre": "pollo al horno"}, headers=nutri)
+    assert r.status_code == 400
+    assert r.json()["message"] == "Ya existe una comida con este nombre"
+    assert len(db.comidas) == 10
+
+    r = client.put("/api/comidas/comida-002", json={"nombre": "Pollo al Horno"}, headers=nutri)
+    assert r.status_code == 400
+    assert db.get_comida("comida-002").nombre != "Pollo al Horno"
+
+
+def test_feedback_duplicado_responde_400(client, login):
+    padre = login("juan.perez@email.com", "padre123")
+
+    r = client.post("/api/feedback", json={"menu_id": "menu-001", "usuario_id": "padre-001", "calificacion": 3}, headers=padre)
+    assert r.status_code == 400
+    assert r.json()["message"] == "Ya has dado feedback para este menú"
+    assert len(db.get_feedback_by_menu("menu-001")) == 2
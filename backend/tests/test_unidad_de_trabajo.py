@@ -0,0 +1,75 @@
+"""
+Unidad de trabajo por petición (RutaConSesion): commit antes de responder y sin
+saltos extra al pool de hilos para confirmar o cerrar la sesión.
+"""
+import pytest
+from sqlalchemy import event
+
+import db_config
+from db_config import SessionLocal
+
+COMIDA = {
+    "nombre": "Comida de prueba", "categoria": "proteina", "descripcion": "-",
+    "calorias": 100, "proteinas": 1, "grasas": 1, "carbohidratos": 1,
+    "fibra": 0, "sodio": 0, "azucar": 0, "ingredientes": [], "alergenos": [],
+}
+
+
+@pytest.fixture
+def saltos_al_pool(monkeypatch):
+    """Llamadas a run_in_threadpool hechas por RutaConSesion"""
+    llamadas = []
+    original = db_config.run_in_threadpool
+
+    async def contar(funcion, *args, **kwargs):
+        llamadas.append(funcion)
+        return await original(funcion, *args, **kwargs)
+
+    monkeypatch.setattr(db_config, "run_in_threadpool", contar)
+    return llamadas
+
+
+def test_commit_fallido_responde_500_y_no_guarda(client, login):
+    nutri = login("nutricionista1@sistema.cl", "nutri123")
+
+    def fallar(session):
+        raise RuntimeError("commit fallido")
+
+    event.listen(SessionLocal, "before_commit", fallar)
+    try:
+        r = client.post("/api/comidas", headers=nutri, json=COMIDA)
+    finally:
+        event.remove(SessionLocal, "before_commit", fallar)
+
+    assert r.status_code == 500
+    assert r.json()["message"] == "No se pudieron guardar los cambios"
+    nombres = [c["nombre"] for c in client.get("/api/comidas", headers=nutri, params={"limit": 200}).json()]
+    assert COMIDA["nombre"] not in nombres
+
+
+def test_escritura_confirmada_antes_de_responder(client, login):
+    nutri = login("nutricionista1@sistema.cl", "nutri123")
+
+    r = client.post("/api/comidas", headers=nutri, json=COMIDA)
+
+    assert r.status_code == 200
+    session = SessionLocal()
+    try:
+        from models_db import ComidaDB
+        assert session.get(ComidaDB, r.json()["id"]) is not None
+    finally:
+        session.close()
+
+
+def test_sin_saltos_extra_al_pool(client, login, saltos_al_pool):
+    nutri = login("nutricionista1@sistema.cl", "nutri123")
+    saltos_al_pool.clear()
+
+    # Endpoint async sin base de datos: no abre transacción
+    assert client.get("/api/health").status_code == 200
+    # Endpoint síncrono que escribe: el commit corre en su mismo hilo
+    assert client.post("/api/comidas", headers=nutri, json=COMIDA).status_code == 200
+    # Error en el endpoint síncrono: el rollback también
+    assert client.post("/api/comidas", headers=nutri, json=COMIDA).status_code == 400
+
+    assert saltos_al_pool == []
@@ -0,0 +1,77 @@
+"""
+Escritura diferida (write-behind) de usuarios.ultimo_acceso.
+
+Cada login y petición autenticada solo anota la hora en memoria; una tarea del
+lifespan (main.py) vuelca lo acumulado con un único UPDATE masivo cada
+ULTIMO_ACCESO_FLUSH_SEGUNDOS y una última vez al apagar la aplicación.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+from database import db
+
+ULTIMO_ACCESO_FLUSH_SEGUNDOS = float(os.getenv("ULTIMO_ACCESO_FLUSH_SEGUNDOS", "5"))
+
+
+class UltimoAccesoBuffer:
+    """Acumula el último acceso por usuario (se queda con el más reciente) hasta el flush"""
+
+    def __init__(self):
+        self._pendientes: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        # Métricas
+        self.registros = 0
+        self.flushes = 0
+        self.accesos_escritos = 0
+        self.errores = 0
+        self.ultimo_flush_ms = 0.0
+
+    def registrar(self, usuario_id: str, instante: datetime):
+        with self._lock:
+            self.registros += 1
+            anterior = self._pendientes.get(usuario_id)
+            if anterior is None or instante > anterior:
+                self._pendientes[usuario_id] = instante
+
+    def flush(self) -> int:
+        """Escribe los accesos pendientes; si falla, se reencolan para el próximo intento"""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        if not pendientes:
+            return 0
+
+        inicio = time.perf_counter()
+        try:
+            escritas = db.actualizar_ultimos_accesos(pendientes)
+        except Exception:
+            with self._lock:
+                self.errores += 1
+                for usuario_id, instante in pendientes.items():
+                    anterior = self._pendientes.get(usuario_id)
+                    if anterior is None or instante > anterior:
+                        self._pendientes[usuario_id] = instante
+            raise
+
+        with self._lock:
+            self.flushes += 1
+            self.accesos_escritos += escritas
+            self.ultimo_flush_ms = (time.perf_counter() - inicio) * 1000
+        return escritas
+
+    def metricas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pendientes": len(self._pendientes),
+                "registros": self.registros,
+                "flushes": self.flushes,
+                "accesos_escritos": self.accesos_escritos,
+                "errores": self.errores,
+                "ultimo_flush_ms": round(self.ultimo_flush_ms, 2),
+            }
+
+
+# Instancia global del buffer
+ultimo_acceso_buffer = UltimoAccesoBuffer()